@@ -11,8 +11,8 @@ from app import extensions, views, commands
 from app import extensions, views, commands
 from app.config import ProductionConfig, DebugConfig
 from app.config import ProductionConfig, DebugConfig
-from app.extensions.logger import LoggingConfig
-from app.extensions.logger import LoggingConfig
+from app.extensions.logger import LoggingConfig, init_request_logging
+from app.extensions.logger import LoggingConfig, init_request_logging
 
 
 def create_app(test_config: Optional[Dict[str, Any]] = None):
@@ -37,6 +37,7 @@ def create_app(test_config: Optional[Dict[str, Any]] = None):
     for _logger in (app.logger,):
         logging_config.configure(_logger)
         logger.setLevel(logging_config.LOG_LEVEL)
+    init_request_logging(app)
 
     logger.debug("Debug message")
     logger.info("Configuration loaded")
@@ -61,6 +62,10 @@ def create_app(test_config: Optional[Dict[str, Any]] = None):
             }
         )
         response.status_code = e.code
+        # e.g. Retry-After of 429 and 503 responses
+        for header, value in e.get_headers():
+            if header != "Content-Type":
+                response.headers[header] = value
         return response
 
     @app.errorhandler(ValidationError)
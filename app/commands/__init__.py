@@ -1,7 +1,9 @@
 from . import employees
+from . import database
 
 MODULES = (
     employees,
+    database,
 )
 
 
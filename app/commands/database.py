@@ -0,0 +1,80 @@
+from typing import Optional
+
+import click
+from flask import Blueprint
+
+from app.extensions.database import db
+from app.utils.snapshots import FORMATS, SnapshotFailed, restore, snapshot
+
+blp = Blueprint("database", __name__, cli_group=None)
+
+
+@blp.cli.command("snapshot-db")
+@click.argument("path", type=click.Path(dir_okay=False, writable=True))
+@click.option(
+    "--format",
+    "snapshot_format",
+    type=click.Choice(FORMATS),
+    default=None,
+    help="backup (SQLite only, the default there) or a portable dump",
+)
+@click.option("--compress", is_flag=True, help="Compress the snapshot with gzip")
+@click.option(
+    "--pages",
+    type=int,
+    default=1024,
+    help="Pages copied at a time by the SQLite backup, readers run in between",
+)
+def snapshot_db(
+    path: str,
+    snapshot_format: Optional[str] = None,
+    compress: bool = False,
+    pages: int = 1024,
+):
+    """Write a snapshot of the database to a file
+
+    The application can keep serving requests while the snapshot is taken.
+    """
+    try:
+        result = snapshot(
+            db.engine,
+            path,
+            snapshot_format=snapshot_format,
+            compress=compress,
+            pages=pages,
+        )
+    except SnapshotFailed as e:
+        raise click.ClickException(str(e))
+    click.echo(
+        f"Wrote a {result['format']} snapshot of {result['bytes']} bytes"
+        f" to {path} in {result['seconds']:.2f}s"
+    )
+
+
+@blp.cli.command("restore-db")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--pages",
+    type=int,
+    default=1024,
+    help="Pages copied at a time by the SQLite backup",
+)
+@click.option(
+    "--batch-size", type=int, default=10000, help="Rows inserted at a time from a dump"
+)
+@click.confirmation_option(prompt="Replace the contents of the database?")
+def restore_db(path: str, pages: int = 1024, batch_size: int = 10000):
+    """Replace the contents of the database with a snapshot
+
+    The format and the compression of the snapshot are detected. Running
+    servers keep their in-memory caches, restart them after a restore.
+    """
+    try:
+        result = restore(db.engine, path, pages=pages, batch_size=batch_size)
+    except SnapshotFailed as e:
+        raise click.ClickException(str(e))
+    restored = f" ({result['rows']} rows)" if result["rows"] is not None else ""
+    click.echo(
+        f"Restored the {result['format']} snapshot {path}{restored}"
+        f" in {result['seconds']:.2f}s"
+    )
@@ -1,20 +1,21 @@
-import random
+import os
 from typing import Optional
 
 import click
-import joblib
-import pandas as pd
-from faker import Faker
-from flask import Blueprint
-from sklearn.compose import ColumnTransformer
-from sklearn.linear_model import Ridge
-from sklearn.model_selection import train_test_split
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-
-from app.constants import departments
+import sqlalchemy as sa
+from flask import Blueprint, current_app
+
 from app.extensions.database import db
-from app.models.employees import Employee
+from app.extensions.partitions import employee_partitions
+from app.extensions.salary_model.training import (
+    search_salary_model,
+    train_salary_model,
+)
+from app.models.employees import create_search_index
+from app.models.hires import MonthlyHires, add_hires, refresh_hires
+from app.utils import generation
+from app.utils.importing import FORMATS, ImportFailed, import_employees
+from app.utils.changelog import compact_changes
 
 blp = Blueprint("employees", __name__, cli_group=None)
 
@@ -27,81 +28,134 @@ def generate_employees(count: Optional[int] = 100):
     Args:
         count (int, optional): Number of employees to generate. Defaults to 100.
     """
-    fake = Faker()
-
-    with db.session() as session:
-        for _ in range(count):
-            employee = Employee()
-            employee.name = fake.name()
-            employee.department = random.choice(departments)
-            employee.salary = fake.pyint(min_value=30000, max_value=1000000)
-            employee.hire_date = fake.date_time_between(
-                start_date="-10y", end_date="now"
-            )
-            session.add(employee)
-        session.commit()
+    generation.generate_employees(count)
     click.echo(f"Generated {count} employees")
 
 
-@blp.cli.command("train-salary-model")
-def train_salary_prediction_model():
-    """Train a model to predict salaries"""
+@blp.cli.command("compact-employee-changes")
+@click.option(
+    "--retention-days",
+    type=float,
+    default=None,
+    help="Purge tombstones older than this, defaults to EMPLOYEE_CHANGES_RETENTION_DAYS",
+)
+def compact_employee_changes(retention_days: Optional[float] = None):
+    """Keep only the latest change of each employee and purge old tombstones"""
+    if retention_days is None:
+        retention_days = current_app.config.get("EMPLOYEE_CHANGES_RETENTION_DAYS")
+    removed = compact_changes(retention_days)
+    click.echo(f"Removed {removed} employee changes")
+
+
+@blp.cli.command("rebuild-search-index")
+def rebuild_search_index():
+    """Create and rebuild the full-text index of employee names"""
+    for engine in employee_partitions.engines or (db.engine,):
+        with engine.begin() as connection:
+            supported = create_search_index(connection)
+    if supported:
+        click.echo("Rebuilt search index")
+    else:
+        click.echo("Full-text search index is not supported, using LIKE fallback")
+
+
+@blp.cli.command("rebuild-hires-rollup")
+def rebuild_hires_rollup():
+    """Recount the monthly hires of every department from the employees"""
+    with db.engine.begin() as connection:
+        if employee_partitions.enabled:
+            counts = employee_partitions.hire_counts()
+            connection.execute(sa.delete(MonthlyHires))
+            add_hires(connection, counts)
+        else:
+            refresh_hires(connection)
+    click.echo("Rebuilt hires rollup")
 
-    # Load the fetched data into a Pandas DataFrame
-    engine = db.engine
-    df = pd.read_sql_table(table_name="employees", con=engine)
-    df.drop(columns=["id", "name"], inplace=True)
-    click.echo(f"Loaded {len(df)} employees, columns: {df.columns}")
-
-    # Clean up the data
-    department_to_int = {department: i for i, department in enumerate(departments)}
-    df["department"] = df["department"].map(department_to_int)
-    df["hire_date"] = df["hire_date"].apply(lambda x: x.timestamp())
-    click.echo(f"Cleaned up data")
-
-    # Define the columns to be transformed
-    categorical_cols = ['department']
-    numerical_cols = ['hire_date']
-
-    # Define the transformers
-    categorical_transformer = Pipeline(steps=[
-        ('onehot', OneHotEncoder(handle_unknown='ignore'))
-    ])
-
-    numerical_transformer = Pipeline(steps=[
-        ('scaler', StandardScaler())
-    ])
-
-    # Combine the transformers using ColumnTransformer
-    preprocessor = ColumnTransformer(
-        transformers=[
-            ('cat', categorical_transformer, categorical_cols),
-            ('num', numerical_transformer, numerical_cols)
-        ],
-        remainder='passthrough'
-    )
 
-    # Train a model to predict salaries
-    # used Ridge regression because it performed better on random data
-    # however would use Lasso or MultiLinearRegression for real data
-    model = Pipeline(steps=[
-        ('preprocessor', preprocessor),
-        ('regressor', Ridge(alpha=1.0))
-    ])
-
-    # Split the data into train and test sets
-    X_train, X_test, y_train, y_test = train_test_split(
-        df[["department", "hire_date"]], df["salary"], test_size=0.25
+@blp.cli.command("train-salary-model")
+@click.option(
+    "--search",
+    is_flag=True,
+    help="Cross-validate several estimators in parallel and keep the best",
+)
+@click.option(
+    "--jobs", type=int, default=None, help="Worker processes of the search"
+)
+@click.option(
+    "--folds", type=int, default=None, help="Cross-validation folds of the search"
+)
+def train_salary_prediction_model(
+    search: bool = False, jobs: Optional[int] = None, folds: Optional[int] = None
+):
+    """Train a model to predict salaries"""
+    config = current_app.config
+    if not search:
+        train_salary_model(
+            db.engine,
+            config["SALARY_MODEL_PATH"],
+            report=lambda message, progress: click.echo(message),
+            employee_engines=employee_partitions.engines,
+        )
+        return
+    search_salary_model(
+        db.engine,
+        config["SALARY_MODEL_PATH"],
+        os.path.join(
+            current_app.instance_path, config["SALARY_MODEL_FEATURE_CACHE_DIR"]
+        ),
+        n_jobs=jobs if jobs is not None else config["SALARY_MODEL_SEARCH_JOBS"],
+        folds=folds or config["SALARY_MODEL_SEARCH_FOLDS"],
+        report=lambda message, progress: click.echo(message),
+        employee_engines=employee_partitions.engines,
     )
-    click.echo(f"Split data into train and test sets")
-
-    # Fit the model
-    model.fit(X_train, y_train)
 
-    # Evaluate the model
-    score = model.score(X_test, y_test)
-    click.echo(f"Model score: {score}")
 
-    # Save the model
-    joblib.dump(model, "model.pkl")
-    click.echo(f"Trained model")
+@blp.cli.command("import-employees")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--format",
+    "file_format",
+    type=click.Choice(FORMATS),
+    default=None,
+    help="Format of the file, guessed from its extension by default",
+)
+@click.option("--chunk-size", type=int, default=None, help="Rows per commit")
+@click.option("--strict", is_flag=True, help="Fail on the first invalid row")
+@click.option(
+    "--restart", is_flag=True, help="Start over instead of resuming a previous run"
+)
+def import_employees_command(
+    path: str,
+    file_format: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+    strict: bool = False,
+    restart: bool = False,
+):
+    """Import employees from a CSV, NDJSON or Parquet file
+
+    Rows need name, department, salary and hire_date columns. An interrupted
+    import resumes after the last committed chunk when run again.
+    """
+    config = current_app.config
+    try:
+        result = import_employees(
+            path,
+            file_format=file_format,
+            chunk_size=chunk_size or config["IMPORT_CHUNK_SIZE"],
+            min_salary=config["IMPORT_MIN_SALARY"],
+            max_salary=config["IMPORT_MAX_SALARY"],
+            strict=strict,
+            restart=restart,
+            report=lambda message, progress: click.echo(message),
+        )
+    except ImportFailed as e:
+        raise click.ClickException(str(e))
+    if result["skipped"] and not result["inserted"] and not result["rejected"]:
+        click.echo(f"{path} was already imported, use --restart to import it again")
+        return
+    click.echo(
+        f"Imported {result['inserted']} employees, rejected {result['rejected']}"
+        f" rows in {result['seconds']:.1f}s ({result['rows_per_second']:.0f} rows/s)"
+    )
+    if result["rejected"]:
+        click.echo(f"Rejected rows were written to {path}.rejects.csv")
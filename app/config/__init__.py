@@ -1,13 +1,45 @@
 """Module containing default config values."""
 import logging
-from os import urandom
+from os import environ, urandom
 
-from .default import DefaultConfig, LogConfig
+from .default import (
+    DefaultConfig,
+    LogConfig,
+    SalaryModelConfig,
+    CompressionConfig,
+    ChangelogConfig,
+    JobsConfig,
+    AnalyticsConfig,
+    AdmissionConfig,
+    MetricsConfig,
+    ProfilerConfig,
+    ImportConfig,
+    PartitionConfig,
+    GroupCommitConfig,
+    AsyncReadsConfig,
+    WarmupConfig,
+)
 from .smorest_config import SmorestProductionConfig, SmorestDebugConfig
 from .sqlalchemy_config import SQLAchemyProductionConfig, SQLAchemyDebugConfig
 
 
-class MainConfig(DefaultConfig, LogConfig):
+class MainConfig(
+    DefaultConfig,
+    LogConfig,
+    SalaryModelConfig,
+    CompressionConfig,
+    ChangelogConfig,
+    JobsConfig,
+    AnalyticsConfig,
+    AdmissionConfig,
+    MetricsConfig,
+    ProfilerConfig,
+    ImportConfig,
+    PartitionConfig,
+    GroupCommitConfig,
+    AsyncReadsConfig,
+    WarmupConfig,
+):
     API_TITLE = "Employees API"
     API_VERSION = 0.1
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -16,13 +48,15 @@ class MainConfig(DefaultConfig, LogConfig):
 
 class ProductionConfig(MainConfig, SQLAchemyProductionConfig, SmorestProductionConfig):
     ENV = "production"
-    SECRET_KEY = urandom(32)
+    # must be shared by all the workers (and hosts) serving the application
+    SECRET_KEY = environ.get("SECRET_KEY") or urandom(32)
 
     REVERSE_PROXY_COUNT = 0
 
     DEBUG = False
     TESTING = False
     LOG_LEVEL = logging.INFO
+    LOG_ASYNC = True
 
     JSON_SORT_KEYS = False
     JSONIFY_PRETTYPRINT_REGULAR = False
@@ -1,11 +1,19 @@
 from logging import DEBUG
+from os import environ
 
 
 class DefaultConfig:
     API_TITLE: str = "Flask API"
     API_VERSION: float = 0.1
     PER_PAGE_LIMIT: int = 25
+    # hard maximum of the per_page query argument
+    MAX_PER_PAGE_LIMIT: int = 100
     TOP_RESULT_LIMIT: int = 10
+    SALARY_HISTOGRAM_BINS: int = 10
+    # default span of /hires/timeseries, in years up to the current month
+    HIRES_TIMESERIES_YEARS: int = 10
+    # sub-requests of a POST /batch request
+    BATCH_MAX_REQUESTS: int = 20
 
 
 class LogConfig:
@@ -14,3 +22,173 @@ class LogConfig:
     )
     LOG_DATE_FORMAT: str = "%Y-%m-%d %H:%M:%S"
     LOG_LEVEL: int = DEBUG
+    # one JSON object per record, with the request id and timing fields
+    LOG_JSON: bool = False
+    # format and write records in a background thread instead of the request's
+    LOG_ASYNC: bool = False
+    # records beyond this many waiting for the background thread are dropped
+    LOG_QUEUE_SIZE: int = 10000
+    # log method, path, status and duration of every request (INFO)
+    LOG_REQUESTS: bool = False
+    LOG_REQUEST_ID_HEADER: str = "X-Request-ID"
+
+
+class SalaryModelConfig:
+    SALARY_MODEL_PATH: str = "model.pkl"
+    # seconds between checks of the model artifact for changes
+    SALARY_MODEL_CHECK_INTERVAL: float = 1.0
+    # hire dates are bucketed to this granularity when memoizing predictions
+    # one of: second, day, week, month, quarter, year
+    SALARY_PREDICTION_DATE_GRANULARITY: str = "day"
+    SALARY_PREDICTION_CACHE_SIZE: int = 1024
+    SALARY_PREDICTION_CACHE_TTL: float = 3600
+    # feature matrices cached by train-salary-model --search, in the instance
+    # folder
+    SALARY_MODEL_FEATURE_CACHE_DIR: str = "features"
+    # worker processes of the cross-validated search, -1 for one per core
+    SALARY_MODEL_SEARCH_JOBS: int = -1
+    SALARY_MODEL_SEARCH_FOLDS: int = 5
+
+
+class CompressionConfig:
+    COMPRESS_ENABLED: bool = True
+    # server preference order, encodings without their package are skipped
+    COMPRESS_ALGORITHMS: tuple = ("br", "zstd", "gzip")
+    COMPRESS_LEVELS: dict = {"br": 4, "zstd": 3, "gzip": 6}
+    # responses smaller than this (in bytes) are sent uncompressed
+    COMPRESS_MIN_SIZE: int = 500
+    COMPRESS_MIMETYPES: tuple = (
+        "application/json",
+        "text/html",
+        "text/css",
+        "text/plain",
+        "text/csv",
+        "application/x-ndjson",
+        "application/javascript",
+    )
+    # payloads without ETag whose compressed bytes are cached and reused
+    COMPRESS_CACHE_PATHS: tuple = ("/api/api-spec.json",)
+    COMPRESS_CACHE_SIZE: int = 64
+
+
+class ChangelogConfig:
+    # keep only the latest change of each employee in the change log
+    EMPLOYEE_CHANGES_COMPACT_ON_WRITE: bool = True
+    # tombstones older than this (in days) are purged by compact-employee-changes,
+    # None keeps them forever; clients that did not sync for longer must resync
+    EMPLOYEE_CHANGES_RETENTION_DAYS: float = 30
+    EMPLOYEE_CHANGES_PAGE_LIMIT: int = 1000
+
+
+class JobsConfig:
+    # size of the thread pool running background jobs
+    JOBS_MAX_WORKERS: int = 1
+    # jobs waiting for a thread beyond this are refused
+    JOBS_MAX_QUEUED: int = 10
+    # finished jobs remembered for status queries
+    JOBS_HISTORY_SIZE: int = 100
+
+
+class AnalyticsConfig:
+    # answer the analytical endpoints from an in-memory columnar snapshot of
+    # employees, False falls back to SQL
+    ANALYTICS_SNAPSHOT_ENABLED: bool = False
+    # snapshots older than this (in seconds) are rebuilt, it must stay below
+    # EMPLOYEE_CHANGES_RETENTION_DAYS for deletions not to be missed
+    ANALYTICS_SNAPSHOT_MAX_AGE: float = 24 * 3600
+    # rebuild rather than refresh when this fraction of employees changed
+    ANALYTICS_SNAPSHOT_REBUILD_RATIO: float = 0.25
+
+
+class AdmissionConfig:
+    ADMISSION_ENABLED: bool = True
+    # endpoint -> class, endpoints not listed belong to the "default" class
+    ADMISSION_ENDPOINT_CLASSES: dict = {
+        "Employees.AverageSalary": "aggregate",
+        "Employees.SalaryDistribution": "aggregate",
+        "Employees.TopEarners": "aggregate",
+        "Employees.MostRecentHires": "aggregate",
+        "Employees.EmployeeSearch": "aggregate",
+        "Employees.PredictSalary": "prediction",
+    }
+    # requests in flight per class and seconds a request may wait for a slot,
+    # classes not listed are not limited
+    ADMISSION_LIMITS: dict = {
+        "aggregate": {"concurrency": 4, "queue_timeout": 0.5},
+        "prediction": {"concurrency": 2, "queue_timeout": 0.5},
+    }
+    # token bucket per client, e.g. {"rate": 50, "burst": 100}; None disables it
+    ADMISSION_RATE_LIMIT: dict = None
+    # header identifying the client, the remote address is used without it
+    ADMISSION_CLIENT_KEY_HEADER: str = "X-API-Key"
+    # value of the Retry-After header of refused requests, in seconds
+    ADMISSION_RETRY_AFTER: int = 1
+    ADMISSION_EXEMPT_ENDPOINTS: tuple = ("metrics", "healthz", "readyz")
+
+
+class MetricsConfig:
+    METRICS_ENABLED: bool = True
+    METRICS_PATH: str = "/metrics"
+
+
+class ProfilerConfig:
+    PROFILER_ENABLED: bool = False
+    # requests with PROFILER_HEADER set to this secret are profiled
+    PROFILER_SECRET: str = environ.get("PROFILER_SECRET")
+    PROFILER_HEADER: str = "X-Profile"
+    # "cprofile" (pstats) or "sample" (collapsed stacks)
+    PROFILER_MODE: str = "cprofile"
+    # fraction of all requests profiled with the sampling profiler
+    PROFILER_SAMPLE_RATE: float = 0.0
+    # seconds between two stack samples
+    PROFILER_SAMPLE_INTERVAL: float = 0.005
+    # relative to the instance folder
+    PROFILER_DIR: str = "profiles"
+
+
+class ImportConfig:
+    # rows validated and committed together by import-employees
+    IMPORT_CHUNK_SIZE: int = 10000
+    # rows with a salary outside these bounds are rejected
+    IMPORT_MIN_SALARY: float = 0
+    IMPORT_MAX_SALARY: float = 10_000_000
+
+
+class PartitionConfig:
+    # SQLALCHEMY_BINDS keys of the databases employees are partitioned over by
+    # department, empty stores them in the main database; the number of
+    # partitions must not change once employees are stored
+    EMPLOYEE_PARTITIONS: tuple = ()
+
+
+class GroupCommitConfig:
+    # commit concurrent employee creates and updates of a process together
+    GROUP_COMMIT_ENABLED: bool = False
+    # seconds the first write of a batch waits for others
+    GROUP_COMMIT_WINDOW: float = 0.002
+    # a full batch is committed without waiting for the window to end
+    GROUP_COMMIT_MAX_SIZE: int = 64
+
+
+class AsyncReadsConfig:
+    # list endpoints run as coroutines on an asyncio engine when served by an
+    # ASGI server (asgi.py), needs the async extra
+    ASYNC_READS_ENABLED: bool = False
+    # the async driver of SQLALCHEMY_DATABASE_URI by default
+    ASYNC_SQLALCHEMY_DATABASE_URI: str = None
+    ASYNC_POOL_SIZE: int = 5
+    ASYNC_MAX_OVERFLOW: int = 10
+    # threads running the requests without async view
+    ASYNC_WSGI_THREADS: int = 16
+
+
+class WarmupConfig:
+    # warm up every process before reporting it ready on /readyz
+    WARMUP_ENABLED: bool = False
+    # warm up in a thread, serving /healthz (and answering 503 on /readyz)
+    # meanwhile, instead of inside create_app
+    WARMUP_BACKGROUND: bool = True
+    # any of: connections, model, indexes, caches
+    WARMUP_STEPS: tuple = ("connections", "model", "indexes", "caches")
+    # pool connections opened at once, the pool size by default
+    WARMUP_CONNECTIONS: int = None
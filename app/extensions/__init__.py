@@ -1,13 +1,38 @@
 """Extensions initialization"""
 
-from . import database
+from . import (
+    admission,
+    async_reads,
+    compression,
+    database,
+    group_commit,
+    jobs,
+    metrics,
+    partitions,
+    profiler,
+    salary_model,
+    warmup,
+)
 from .api import Api
 
 
 def create_api(app):
     api = Api(app)
 
-    for extension in (database,):
+    for extension in (
+        database,
+        async_reads,
+        partitions,
+        group_commit,
+        salary_model,
+        compression,
+        jobs,
+        metrics,
+        admission,
+        profiler,
+        # last, warms up the other extensions
+        warmup,
+    ):
         extension.init_app(app)
 
     return api
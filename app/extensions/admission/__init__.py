@@ -0,0 +1,182 @@
+"""Admission control
+
+Endpoints are grouped in classes (``ADMISSION_ENDPOINT_CLASSES``), each with
+its own concurrency limit and queue deadline (``ADMISSION_LIMITS``), so that
+slow aggregate or prediction requests cannot take every thread of a worker
+and starve cheap reads. A request waits at most ``queue_timeout`` seconds
+for a slot of its class, and is otherwise refused at once with a 503 and a
+``Retry-After`` header instead of queueing up behind the slow ones.
+
+Clients are also rate limited with a token bucket per client key (the
+``ADMISSION_CLIENT_KEY_HEADER`` header, or the remote address), answered
+with a 429 when empty. Limits apply per process.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from flask import g, request
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+from app.extensions.metrics import metrics
+
+DEFAULT_CLASS = "default"
+
+
+class ConcurrencyLimit:
+    """Bounded number of requests in flight, with a deadline to get a slot"""
+
+    def __init__(self, concurrency: Optional[int], queue_timeout: float = 0.0):
+        self.concurrency = concurrency
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._semaphore = (
+            threading.BoundedSemaphore(concurrency) if concurrency else None
+        )
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        if self._semaphore is not None and not self._semaphore.acquire(
+            timeout=self.queue_timeout
+        ):
+            return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+
+class TokenBucketLimiter:
+    """Token bucket per client key, refilled at ``rate`` tokens per second"""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> float:
+        """Take a token, returning 0 or the seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            # forget the least recently seen clients, their bucket is full again
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class AdmissionControl:
+    """Per endpoint class concurrency limits and per client rate limits"""
+
+    def __init__(self, app=None):
+        self.endpoint_classes: Dict[str, str] = {}
+        self.limits: Dict[str, ConcurrencyLimit] = {}
+        self.rate_limiter: Optional[TokenBucketLimiter] = None
+        self.client_key_header: Optional[str] = None
+        self.retry_after = 1
+        self.exempt_endpoints = frozenset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        if not config.get("ADMISSION_ENABLED", True):
+            return
+        self.endpoint_classes = dict(config.get("ADMISSION_ENDPOINT_CLASSES", {}))
+        self.limits = {
+            name: ConcurrencyLimit(
+                limit.get("concurrency"), limit.get("queue_timeout", 0.0)
+            )
+            for name, limit in config.get("ADMISSION_LIMITS", {}).items()
+        }
+        rate_limit = config.get("ADMISSION_RATE_LIMIT")
+        self.rate_limiter = (
+            TokenBucketLimiter(
+                rate_limit["rate"],
+                rate_limit.get("burst", rate_limit["rate"]),
+                rate_limit.get("max_clients", 10000),
+            )
+            if rate_limit
+            else None
+        )
+        self.client_key_header = config.get("ADMISSION_CLIENT_KEY_HEADER")
+        self.retry_after = config.get("ADMISSION_RETRY_AFTER", self.retry_after)
+        self.exempt_endpoints = frozenset(config.get("ADMISSION_EXEMPT_ENDPOINTS", ()))
+
+        metrics.describe(
+            "admission_rejected_total", "counter", "Requests refused by admission"
+        )
+        metrics.describe(
+            "admission_queue_seconds",
+            "histogram",
+            "Time spent waiting for a concurrency slot",
+        )
+        metrics.describe("admission_in_flight", "gauge", "Requests being handled")
+        app.before_request(self.admit)
+        app.teardown_request(self.release)
+
+    def client_key(self) -> str:
+        if self.client_key_header:
+            key = request.headers.get(self.client_key_header)
+            if key:
+                return key
+        return request.remote_addr or "-"
+
+    def admit(self):
+        if request.endpoint in self.exempt_endpoints:
+            return
+        if self.rate_limiter is not None:
+            wait = self.rate_limiter.acquire(self.client_key())
+            if wait:
+                metrics.inc("admission_rejected_total", reason="rate_limit")
+                raise TooManyRequests(retry_after=math.ceil(wait))
+
+        name = self.endpoint_classes.get(request.endpoint, DEFAULT_CLASS)
+        limit = self.limits.get(name)
+        if limit is None:
+            return
+        started = time.perf_counter()
+        admitted = limit.acquire()
+        waited = time.perf_counter() - started
+        metrics.observe("admission_queue_seconds", waited, endpoint_class=name)
+        if not admitted:
+            metrics.inc(
+                "admission_rejected_total", reason="concurrency", endpoint_class=name
+            )
+            raise ServiceUnavailable(
+                f"Too many {name} requests in progress, retry later",
+                retry_after=self.retry_after,
+            )
+        g.admission = name, limit
+        metrics.set("admission_in_flight", limit.in_flight, endpoint_class=name)
+
+    def release(self, exc=None):
+        admitted = g.pop("admission", None)
+        if admitted is not None:
+            name, limit = admitted
+            limit.release()
+            metrics.set("admission_in_flight", limit.in_flight, endpoint_class=name)
+
+
+admission = AdmissionControl()
+
+
+def init_app(app):
+    """Initialize admission control extension"""
+    admission.init_app(app)
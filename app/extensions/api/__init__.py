@@ -2,13 +2,63 @@
 
 Override base classes here to allow painless customization in the future.
 """
+import json
+from typing import Optional
+
 import marshmallow as ma
+import sqlalchemy as sa
+from flask import Response, current_app, jsonify, request
 from flask_smorest import Api as ApiOrig, Blueprint as BlueprintOrig, Page
+from flask_smorest.pagination import (
+    PaginationParameters,
+    _pagination_parameters_schema_factory,
+)
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
 
+from app.extensions.database import db
+
 
 class Blueprint(BlueprintOrig):
-    """Blueprint override"""
+    """Blueprint override
+
+    The ``page_parameters``, ``pagination_headers`` and ``etag_response``
+    helpers give views running outside the smorest decorators (the async
+    views) the behaviour of ``paginate`` and ``etag``.
+    """
+
+    def page_parameters(self) -> PaginationParameters:
+        """The ``paginate`` query arguments of the request"""
+        schema = _pagination_parameters_schema_factory(
+            self.DEFAULT_PAGINATION_PARAMETERS["page"],
+            self.DEFAULT_PAGINATION_PARAMETERS["page_size"],
+            self.DEFAULT_PAGINATION_PARAMETERS["max_page_size"],
+        )
+        return self.PAGINATION_ARGUMENTS_PARSER.parse(
+            schema(), request, location="query"
+        )
+
+    def pagination_headers(self, page_params: PaginationParameters) -> dict:
+        """The ``paginate`` headers of a page whose ``item_count`` is set"""
+        metadata = self._make_pagination_metadata(
+            page_params.page, page_params.page_size, page_params.item_count
+        )
+        return {self.PAGINATION_HEADER_NAME: json.dumps(metadata)}
+
+    def etag_response(self, data, headers: Optional[dict] = None) -> Response:
+        """JSON response of dumped data with the ETag ``etag`` gives it,
+        aborting with 304 when the request has it already"""
+        response = jsonify(data)
+        response.headers.update(headers or {})
+        if not current_app.config.get("ETAG_DISABLED", False):
+            extra_data = tuple(
+                (key, value)
+                for key, value in response.headers
+                if key in self.ETAG_INCLUDE_HEADERS
+            )
+            etag = self._generate_etag(data, extra_data)
+            self._check_not_modified(etag)
+            response.set_etag(etag)
+        return response
 
 
 # Define custom converter to schema function
@@ -42,6 +92,24 @@ class PaginationSchema(ma.Schema):
     total_items = ma.fields.Integer()
 
 
+class PageArgsSchema(ma.Schema):
+    """Page query arguments, ``per_page`` bounded by ``MAX_PER_PAGE_LIMIT``"""
+    page = ma.fields.Integer(load_default=1, validate=ma.validate.Range(min=1))
+    per_page = ma.fields.Integer(validate=ma.validate.Range(min=1))
+
+    @ma.post_load
+    def apply_per_page_limits(self, data, **kwargs):
+        config = current_app.config
+        per_page = data.get("per_page", config["PER_PAGE_LIMIT"])
+        max_per_page = config["MAX_PER_PAGE_LIMIT"]
+        if per_page > max_per_page:
+            raise ma.ValidationError(
+                f"Must be less than or equal to {max_per_page}.", "per_page"
+            )
+        data["per_page"] = per_page
+        return data
+
+
 class BasePaginatedSchema(ma.Schema):
     """Base paginated schema"""
     data = ma.fields.List(ma.fields.Nested(Schema()))
@@ -67,5 +135,31 @@ class AutoSchema(SQLAlchemyAutoSchema):
 
 
 class SQLCursorPage(Page):
-    """SQL cursor pager"""
-    pass
+    """SQL cursor pager
+
+    Pages through an ORM query, or a Core select whose rows are read as
+    mappings.
+    """
+
+    @property
+    def items(self):
+        first = self.page_params.first_item
+        last = self.page_params.last_item
+        if isinstance(self.collection, sa.Select):
+            return (
+                db.session.execute(
+                    self.collection.offset(first).limit(last - first + 1)
+                )
+                .mappings()
+                .all()
+            )
+        return self.collection.offset(first).limit(last - first + 1).all()
+
+    @property
+    def item_count(self):
+        if isinstance(self.collection, sa.Select):
+            sub = self.collection.order_by(None).subquery()
+            return db.session.execute(
+                sa.select(sa.func.count()).select_from(sub)
+            ).scalar()
+        return self.collection.count()
@@ -0,0 +1,313 @@
+"""Async read path, served through ASGI
+
+With ``ASYNC_READS_ENABLED`` and the application served by an ASGI server
+(``uvicorn asgi:application``, see ``asgi.py``), the read-only list endpoints
+registered with ``async_reads.view`` run as coroutines in the event loop of
+the server. Their statements go through an SQLAlchemy asyncio engine
+(aiosqlite, asyncpg or aiomysql, from the ``async`` extra), so a request
+waiting on the database holds neither a thread nor a connection: a process
+serves as many of them at once as the pool (``ASYNC_POOL_SIZE``) lets
+statements run. The page and the total count of a list are queried
+concurrently.
+
+Every other request, and the async endpoints when their view cannot serve
+the request (e.g. partitioned employees), runs the WSGI application in a pool
+of ``ASYNC_WSGI_THREADS`` threads, as a threaded WSGI server would.
+
+The async views run in a request context like any view: the
+``before_request``, ``after_request`` and ``teardown_request`` hooks (request
+logging, admission, compression...) run around them, in the event loop.
+Admission control should then not queue (``queue_timeout`` of 0), a waiting
+request would block the loop.
+"""
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+from flask import Flask, Response
+from werkzeug.exceptions import HTTPException
+
+from app.extensions.database import db
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+# a view, and whether it serves the current request (all requests if None)
+AsyncView = Tuple[Callable[[], Awaitable[Response]], Optional[Callable[[], bool]]]
+
+
+def async_url(url: sa.URL) -> sa.URL:
+    """The URL of the async driver of a database"""
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+class AsyncReads:
+    """Async engine and views of the read-only endpoints"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.url: Optional[sa.URL] = None
+        self.engine_options: dict = {}
+        self.wsgi_threads = 16
+        # views by endpoint, registered when the views are imported
+        self.views: Dict[str, AsyncView] = {}
+        self._engine = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("ASYNC_READS_ENABLED", False)
+        self.wsgi_threads = config.get("ASYNC_WSGI_THREADS", self.wsgi_threads)
+        if not self.enabled:
+            return
+        url = config.get("ASYNC_SQLALCHEMY_DATABASE_URI")
+        if url is None:
+            with app.app_context():
+                url = async_url(db.engine.url)
+        self.url = sa.make_url(url)
+        self.engine_options = {
+            "pool_size": config.get("ASYNC_POOL_SIZE", 5),
+            "max_overflow": config.get("ASYNC_MAX_OVERFLOW", 10),
+        }
+
+    def view(self, endpoint: str, when: Optional[Callable[[], bool]] = None):
+        """Register a coroutine serving the GET requests of an endpoint,
+        those for which ``when()`` is true if given"""
+
+        def decorator(func):
+            self.views[endpoint] = func, when
+            return func
+
+        return decorator
+
+    @property
+    def engine(self):
+        # connections belong to the event loop they were opened in
+        loop = asyncio.get_running_loop()
+        if self._engine is None or self._loop is not loop:
+            from sqlalchemy.ext.asyncio import create_async_engine
+
+            self._engine = create_async_engine(self.url, **self.engine_options)
+            self._loop = loop
+        return self._engine
+
+    async def dispose(self) -> None:
+        """Close the connections of the engine"""
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+
+    async def all(self, statement: sa.Executable) -> List[sa.RowMapping]:
+        """The rows of a read-only statement"""
+        async with self.engine.connect() as connection:
+            return (await connection.execute(statement)).mappings().all()
+
+    async def count(self, select: sa.Select) -> int:
+        """The number of rows of a select"""
+        sub = select.order_by(None).subquery()
+        count = sa.select(sa.func.count().label("count")).select_from(sub)
+        return (await self.all(count))[0]["count"]
+
+    async def page(
+        self, select: sa.Select, offset: int, limit: int
+    ) -> Tuple[List[sa.RowMapping], int]:
+        """The rows of a page of a select and the total count, queried
+        concurrently"""
+        rows, total = await asyncio.gather(
+            self.all(select.limit(limit).offset(offset)), self.count(select)
+        )
+        return rows, total
+
+    async def paginated_response(self, blp, select: sa.Select, schema) -> Response:
+        """A page of the rows of a select dumped by ``schema``, as the sync
+        views decorated with ``blp.paginate(SQLCursorPage)`` answer it"""
+        page_params = blp.page_parameters()
+        rows, page_params.item_count = await self.page(
+            select, page_params.first_item, page_params.page_size
+        )
+        return blp.etag_response(schema.dump(rows), blp.pagination_headers(page_params))
+
+
+async_reads = AsyncReads()
+
+
+def init_app(app):
+    """Initialize async read path extension"""
+    async_reads.init_app(app)
+
+
+def wsgi_environ(scope: dict, body: bytes) -> dict:
+    """The WSGI environ of an ASGI HTTP request"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin1"),
+        "PATH_INFO": scope["path"].encode().decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        value = value.decode("latin1")
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def _response_start(status: int, headers) -> dict:
+    return {
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (name.lower().encode("latin1"), value.encode("latin1"))
+            for name, value in headers
+        ],
+    }
+
+
+class AsgiApplication:
+    """ASGI application running the async views in the event loop and the
+    WSGI application in threads"""
+
+    def __init__(self, app: Flask, reads: AsyncReads = async_reads):
+        self.app = app
+        self.reads = reads
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # created in the serving process, threads do not survive fork
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.reads.wsgi_threads, thread_name_prefix="wsgi"
+            )
+        return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope: {scope['type']}")
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        environ = wsgi_environ(scope, body)
+        view = self.async_view(environ)
+        if view is None or not await self.run_async(view, environ, send):
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                self.executor, self.run_wsgi, environ, send, loop
+            )
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.reads.dispose()
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def async_view(self, environ: dict) -> Optional[AsyncView]:
+        """The async view of a request, if it has one"""
+        if not self.reads.enabled or environ["REQUEST_METHOD"] != "GET":
+            return None
+        adapter = self.app.url_map.bind_to_environ(
+            environ, server_name=self.app.config["SERVER_NAME"]
+        )
+        try:
+            endpoint, _ = adapter.match()
+        except HTTPException:
+            return None
+        return self.reads.views.get(endpoint)
+
+    async def run_async(self, view: AsyncView, environ: dict, send) -> bool:
+        """Dispatch a request to a coroutine, as ``Flask.wsgi_app`` does to a
+        view function
+
+        Returns:
+            bool: Whether the view served the request, ``False`` leaves it to
+            the WSGI application.
+        """
+        func, when = view
+        app = self.app
+        ctx = app.request_context(environ)
+        error = None
+        ctx.push()
+        try:
+            if when is not None and not when():
+                return False
+            try:
+                try:
+                    response = app.preprocess_request()
+                    if response is None:
+                        response = await func()
+                    response = app.make_response(response)
+                except Exception as e:
+                    response = app.make_response(app.handle_user_exception(e))
+                response = app.process_response(response)
+            except Exception as e:
+                error = e
+                response = app.handle_exception(e)
+            await send(_response_start(response.status_code, response.headers.items()))
+            await send({"type": "http.response.body", "body": response.get_data()})
+            return True
+        finally:
+            ctx.pop(error)
+
+    def run_wsgi(self, environ: dict, send, loop: asyncio.AbstractEventLoop) -> None:
+        """Run the WSGI application in the current (pool) thread, sending
+        the response chunks through the event loop as they come"""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = headers
+
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        chunks = self.app(environ, start_response)
+        try:
+            call(_response_start(started["status"], started["headers"]))
+            for chunk in chunks:
+                if chunk:
+                    call(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+            call({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
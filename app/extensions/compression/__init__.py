@@ -0,0 +1,187 @@
+"""Response compression
+
+Compresses responses with the best encoding the client accepts (brotli,
+zstd or gzip, in the order of ``COMPRESS_ALGORITHMS``). brotli and zstd are
+only offered when the ``brotli`` and ``zstandard`` packages are installed.
+
+Streamed responses are compressed chunk by chunk and flushed after every
+chunk so clients keep receiving data incrementally. The compressed bytes of
+responses carrying an ETag, and of the paths listed in
+``COMPRESS_CACHE_PATHS`` (e.g. the OpenAPI spec), are cached by the digest
+of the body and reused.
+"""
+import hashlib
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from flask import request
+
+from app.utils.cache import LRUCache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+COMPRESSORS = {"gzip": GzipCompressor}
+if brotli is not None:
+    COMPRESSORS["br"] = BrotliCompressor
+if zstandard is not None:
+    COMPRESSORS["zstd"] = ZstdCompressor
+
+
+def compress_stream(chunks: Iterable[bytes], compressor) -> Iterator[bytes]:
+    """Compress an iterable of chunks, flushing after each one"""
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = compressor.compress(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+class Compression:
+    """Negotiated response compression"""
+
+    def __init__(self, app=None):
+        self.algorithms = ("gzip",)
+        self.levels = {}
+        self.min_size = 500
+        self.mimetypes = frozenset()
+        self.cache_paths = frozenset()
+        self.cache = LRUCache(max_size=0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        if not config.get("COMPRESS_ENABLED", True):
+            return
+        self.algorithms = tuple(
+            algorithm
+            for algorithm in config.get("COMPRESS_ALGORITHMS", self.algorithms)
+            if algorithm in COMPRESSORS
+        )
+        self.levels = config.get("COMPRESS_LEVELS", self.levels)
+        self.min_size = config.get("COMPRESS_MIN_SIZE", self.min_size)
+        self.mimetypes = frozenset(config.get("COMPRESS_MIMETYPES", ()))
+        self.cache_paths = frozenset(config.get("COMPRESS_CACHE_PATHS", ()))
+        self.cache = LRUCache(max_size=config.get("COMPRESS_CACHE_SIZE", 64))
+        app.after_request(self.compress_response)
+
+    def choose_encoding(self) -> Optional[str]:
+        """Pick the accepted encoding with the best quality, ties going to
+        the server's preference order"""
+        accepted = request.accept_encodings
+        best, best_quality = None, 0
+        for algorithm in self.algorithms:
+            quality = accepted.quality(algorithm)
+            if quality > best_quality:
+                best, best_quality = algorithm, quality
+        return best
+
+    def _cache_key(self, response, encoding: str) -> Optional[tuple]:
+        # keyed on the body: an ETag alone is no proof of the bytes (versions
+        # restart at 1 for new rows)
+        etag, weak = response.get_etag()
+        if (etag and not weak) or request.path in self.cache_paths:
+            digest = hashlib.blake2b(response.get_data(), digest_size=16).digest()
+            return encoding, request.path, digest
+        return None
+
+    def compress_response(self, response):
+        if response.mimetype not in self.mimetypes:
+            return response
+        response.vary.add("Accept-Encoding")
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or "no-transform" in response.headers.get("Cache-Control", "")
+        ):
+            return response
+        if not response.is_streamed and (
+            response.content_length is not None
+            and response.content_length < self.min_size
+        ):
+            return response
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return response
+
+        compressor = COMPRESSORS[encoding](self.levels.get(encoding, 6))
+        if response.is_streamed:
+            response.response = compress_stream(response.response, compressor)
+            response.direct_passthrough = False
+            response.headers.pop("Content-Length", None)
+        else:
+            key = self._cache_key(response, encoding)
+            data = self.cache.get(key) if key is not None else None
+            if data is None:
+                data = compressor.compress(response.get_data()) + compressor.finish()
+                if key is not None:
+                    self.cache.set(key, data)
+            response.set_data(data)
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+
+compression = Compression()
+
+
+def init_app(app):
+    """Initialize response compression extension"""
+    compression.init_app(app)
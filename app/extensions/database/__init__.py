@@ -7,8 +7,15 @@ db = SQLAlchemy()  # pylint: disable=invalid-name
 
 def init_app(app):
     """Initialize relational database extension"""
+    # imported here, the models import ``db``
+    from app.models.upgrades import upgrade_schema
+
     db.init_app(app)
     # Create an application context
     with app.app_context():
         # Create all the tables in the database
         db.create_all()
+        # Bring tables created by earlier versions up to date
+        with db.engine.begin() as connection:
+            for upgrade in upgrade_schema(connection):
+                app.logger.info("Upgraded database schema: %s", upgrade)
@@ -0,0 +1,165 @@
+"""Group commit of concurrent writes
+
+Every write committed on its own pays for a transaction, and on SQLite for
+an fsync. With ``GROUP_COMMIT_ENABLED``, writes submitted with ``run`` by
+concurrent requests are gathered into batches committed in a single
+transaction. The first write of a batch waits up to ``GROUP_COMMIT_WINDOW``
+seconds, or until the batch holds ``GROUP_COMMIT_MAX_SIZE`` writes, and then
+runs the whole batch in its own request thread while the other callers wait
+for their result. Batches are committed one at a time, the next one
+gathering writes meanwhile.
+
+Each caller gets its own result or its own exception: when a write of a
+batch fails the transaction is rolled back and the writes of the batch are
+run again one transaction each. Writes must therefore only touch the
+database, and return values that do not depend on the session (no ORM
+objects), as they are run by another request thread. Batching only happens
+within a process.
+"""
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+from app.extensions.database import db
+from app.extensions.metrics import metrics
+
+# A write, run in the session of the thread committing the batch
+Write = Callable[[], Any]
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+WAIT_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class _PendingWrite:
+    __slots__ = ("write", "submitted", "done", "result", "error")
+
+    def __init__(self, write: Write):
+        self.write = write
+        self.submitted = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class GroupCommit:
+    """Batches concurrent writes into shared transactions"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.window = 0.002
+        self.max_size = 64
+        self._lock = threading.Lock()
+        self._batch_closed = threading.Condition(self._lock)
+        self._pending: Optional[List[_PendingWrite]] = None
+        # one batch is committed at a time
+        self._commit_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("GROUP_COMMIT_ENABLED", False)
+        self.window = config.get("GROUP_COMMIT_WINDOW", self.window)
+        self.max_size = config.get("GROUP_COMMIT_MAX_SIZE", self.max_size)
+        metrics.describe(
+            "group_commit_batch_size",
+            "histogram",
+            "Writes committed together",
+            buckets=BATCH_SIZE_BUCKETS,
+        )
+        metrics.describe(
+            "group_commit_wait_seconds",
+            "histogram",
+            "Time a write waited for its batch to start",
+            buckets=WAIT_BUCKETS,
+        )
+        metrics.describe(
+            "group_commit_fallbacks_total",
+            "counter",
+            "Batches run again one write at a time after a failure",
+        )
+
+    def run(self, write: Write) -> Any:
+        """Run a write and commit it, with the concurrent ones if enabled
+
+        Returns:
+            The return value of ``write``, whose exceptions are raised again.
+        """
+        if not self.enabled:
+            result = write()
+            db.session.commit()
+            return result
+
+        pending = _PendingWrite(write)
+        with self._lock:
+            batch = self._pending
+            leader = batch is None
+            if leader:
+                batch = self._pending = [pending]
+            else:
+                batch.append(pending)
+                if len(batch) >= self.max_size:
+                    self._pending = None
+                    self._batch_closed.notify_all()
+
+        if leader:
+            self._gather(batch)
+            with self._commit_lock:
+                self._commit(batch)
+        else:
+            pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _gather(self, batch: List[_PendingWrite]) -> None:
+        """Wait for the window to end or the batch to be full, and close it"""
+        deadline = time.monotonic() + self.window
+        with self._lock:
+            while self._pending is batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._pending = None
+                    break
+                self._batch_closed.wait(remaining)
+
+    def _commit(self, batch: List[_PendingWrite]) -> None:
+        started = time.perf_counter()
+        metrics.observe("group_commit_batch_size", len(batch))
+        for pending in batch:
+            metrics.observe("group_commit_wait_seconds", started - pending.submitted)
+        try:
+            try:
+                results = [pending.write() for pending in batch]
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                if len(batch) == 1:
+                    raise
+                metrics.inc("group_commit_fallbacks_total")
+                for pending in batch:
+                    self._commit_one(pending)
+            else:
+                for pending, result in zip(batch, results):
+                    pending.result = result
+        except Exception as e:
+            batch[0].error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+    def _commit_one(self, pending: _PendingWrite) -> None:
+        try:
+            pending.result = pending.write()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            pending.error = e
+
+
+group_commit = GroupCommit()
+
+
+def init_app(app):
+    """Initialize group commit extension"""
+    group_commit.init_app(app)
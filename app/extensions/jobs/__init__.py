@@ -0,0 +1,142 @@
+"""Background jobs
+
+Runs long operations (model training, data generation...) in a bounded
+thread pool inside the application process, so that they do not tie up a
+request worker. Jobs are tracked in memory: their status is only known to
+the process that runs them.
+"""
+import datetime as dt
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TooManyJobs(Exception):
+    """Raised when the queue of pending jobs is full"""
+
+
+class Job:
+    """A unit of background work and its progress"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = self.QUEUED
+        self.progress = 0.0
+        self.message: Optional[str] = None
+        self.result = None
+        self.error: Optional[str] = None
+        self.created_at = dt.datetime.utcnow()
+        self.started_at: Optional[dt.datetime] = None
+        self.finished_at: Optional[dt.datetime] = None
+        self._created = time.monotonic()
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+
+    def report(self, message: str, progress: float) -> None:
+        """Record the progress of the job, ``progress`` being between 0 and 1"""
+        self.message = message
+        self.progress = progress
+        logger.debug("Job %s (%s): %s", self.id, self.name, message)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+    @property
+    def queued_seconds(self) -> Optional[float]:
+        if self._started is None:
+            return None
+        return self._started - self._created
+
+    @property
+    def run_seconds(self) -> Optional[float]:
+        if self._started is None:
+            return None
+        return (self._finished or time.monotonic()) - self._started
+
+
+class JobRunner:
+    """Bounded thread pool running jobs in an application context"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_queued = 10
+        self.history_size = 100
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.app = app
+        self.max_queued = config.get("JOBS_MAX_QUEUED", self.max_queued)
+        self.history_size = config.get("JOBS_HISTORY_SIZE", self.history_size)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.get("JOBS_MAX_WORKERS", 1),
+            thread_name_prefix="job",
+        )
+
+    def submit(self, name: str, func: Callable, *args, **kwargs) -> Job:
+        """Queue ``func(job, *args, **kwargs)`` to run in the background
+
+        Raises:
+            TooManyJobs: when ``JOBS_MAX_QUEUED`` jobs are already pending.
+        """
+        job = Job(name)
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if j.status == Job.QUEUED)
+            if pending >= self.max_queued:
+                raise TooManyJobs(f"{pending} jobs are already queued")
+            self._jobs[job.id] = job
+            # forget the oldest finished jobs
+            for old in [j for j in self._jobs.values() if j.finished]:
+                if len(self._jobs) <= self.history_size:
+                    break
+                del self._jobs[old.id]
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job: Job, func: Callable, args: tuple, kwargs: dict) -> None:
+        job._started = time.monotonic()
+        job.started_at = dt.datetime.utcnow()
+        job.status = Job.RUNNING
+        try:
+            with self.app.app_context():
+                job.result = func(job, *args, **kwargs)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception("Job %s (%s) failed", job.id, job.name)
+            job.error = str(e)
+            status = Job.FAILED
+        else:
+            job.progress = 1.0
+            status = Job.SUCCEEDED
+        job._finished = time.monotonic()
+        job.finished_at = dt.datetime.utcnow()
+        job.status = status
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+
+jobs = JobRunner()
+
+
+def init_app(app):
+    """Initialize background jobs extension"""
+    jobs.init_app(app)
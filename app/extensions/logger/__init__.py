@@ -1,16 +1,118 @@
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
 
 import colorlog
+from flask import g, has_request_context, request
 from flask.logging import default_handler
 
+# the listener of the asynchronous mode, see LoggingConfig.get_handler
+_listener: Optional[QueueListener] = None
+
+
+class RequestContextFilter(logging.Filter):
+    """Tag records with the id of the current request and the time elapsed
+    since it started"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if has_request_context():
+            record.request_id = g.get("request_id")
+            started = g.get("request_started")
+            if started is not None:
+                record.elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    FIELDS = ("request_id", "elapsed_ms", "method", "path", "status", "duration_ms")
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hand records over to the listener thread without blocking
+
+    Only what cannot cross threads is done by the logging thread: merging the
+    arguments into the message and rendering the traceback. Records are
+    dropped, and counted, when the queue is full.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _start_listener():
+    if _listener is not None and _listener._thread is None:
+        _listener.start()
+
+
+# the listener thread does not survive fork (gunicorn preload), drain the
+# queue before forking and start a thread again on both sides
+os.register_at_fork(
+    before=_stop_listener,
+    after_in_parent=_start_listener,
+    after_in_child=_start_listener,
+)
+atexit.register(_stop_listener)
+
 
 class LoggingConfig:
     def __init__(self, config):
         self.LOG_LEVEL = config.get('LOG_LEVEL', logging.INFO)
         self.LOG_FORMAT = config.get('LOG_FORMAT')
         self.LOG_DATE_FORMAT = config.get('LOG_DATE_FORMAT')
+        self.LOG_JSON = config.get('LOG_JSON', False)
+        self.LOG_ASYNC = config.get('LOG_ASYNC', False)
+        self.LOG_QUEUE_SIZE = config.get('LOG_QUEUE_SIZE', 10000)
 
     def get_formatter(self):
+        if self.LOG_JSON:
+            return JsonFormatter(datefmt=self.LOG_DATE_FORMAT)
         formatter = colorlog.ColoredFormatter(
             self.LOG_FORMAT,
             datefmt=self.LOG_DATE_FORMAT,
@@ -26,10 +128,23 @@ class LoggingConfig:
 
     def get_handler(self):
         handler = default_handler
-        handler.setFormatter(self.get_formatter())
         handler.setLevel(self.LOG_LEVEL)
         handler.setFormatter(self.get_formatter())
-        return handler
+        if not self.LOG_ASYNC:
+            if not any(isinstance(f, RequestContextFilter) for f in handler.filters):
+                handler.addFilter(RequestContextFilter())
+            return handler
+
+        # formatting and I/O happen in the listener thread
+        global _listener
+        _stop_listener()
+        log_queue = queue.Queue(maxsize=self.LOG_QUEUE_SIZE)
+        _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+        _listener.start()
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        queue_handler.setLevel(self.LOG_LEVEL)
+        queue_handler.addFilter(RequestContextFilter())
+        return queue_handler
 
     def configure(self, logger: logging.Logger):
         if logger.hasHandlers():
@@ -41,3 +156,43 @@ class LoggingConfig:
         logger = logging.getLogger(logger_name)
         self.configure(logger)
         return logger
+
+
+def init_request_logging(app):
+    """Give every request an id, echoed in the ``LOG_REQUEST_ID_HEADER``
+    response header, and optionally log one access record per request"""
+    header = app.config.get("LOG_REQUEST_ID_HEADER", "X-Request-ID")
+    access_logger = logging.getLogger(f"{app.name}.access")
+
+    @app.before_request
+    def start_request():
+        g.request_started = time.perf_counter()
+        # ids set by a proxy are kept, within reason
+        g.request_id = request.headers.get(header, "")[:128] or uuid.uuid4().hex
+
+    @app.after_request
+    def end_request(response):
+        request_id = g.get("request_id")
+        if request_id is not None:
+            response.headers[header] = request_id
+        started = g.get("request_started")
+        if (
+            started is not None
+            and app.config.get("LOG_REQUESTS")
+            and access_logger.isEnabledFor(logging.INFO)
+        ):
+            duration_ms = round((time.perf_counter() - started) * 1000, 3)
+            access_logger.info(
+                "%s %s %s %.3fms",
+                request.method,
+                request.path,
+                response.status_code,
+                duration_ms,
+                extra={
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "duration_ms": duration_ms,
+                },
+            )
+        return response
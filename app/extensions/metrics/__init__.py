@@ -0,0 +1,146 @@
+"""Application metrics
+
+In-process counters, gauges and histograms, exposed in the Prometheus text
+format on ``METRICS_PATH``. Each process keeps its own values: with several
+workers every one of them has to be scraped.
+"""
+import bisect
+import threading
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+from flask import Response
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, **extra) -> str:
+    pairs = list(labels) + [(key, str(value)) for key, value in extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        position = bisect.bisect_left(self.buckets, value)
+        if position < len(self.counts):
+            self.counts[position] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """Registry of the metrics of the process"""
+
+    def __init__(self, app=None):
+        self._types: Dict[str, str] = {}
+        self._help: Dict[str, str] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._values: Dict[str, Dict[Labels, float]] = defaultdict(dict)
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = defaultdict(dict)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get("METRICS_ENABLED", True):
+            return
+        app.add_url_rule(
+            app.config.get("METRICS_PATH", "/metrics"),
+            endpoint="metrics",
+            view_func=self.view,
+        )
+
+    def describe(
+        self, name: str, kind: str, help_text: str, buckets: Optional[tuple] = None
+    ) -> None:
+        """Declare a metric, ``kind`` being counter, gauge or histogram
+
+        Histograms use ``DEFAULT_BUCKETS`` (seconds) unless given ``buckets``.
+        """
+        self._types[name] = kind
+        self._help[name] = help_text
+        if buckets is not None:
+            self._buckets[name] = tuple(buckets)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            values = self._values[name]
+            values[key] = values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._values[name][_labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            histogram = self._histograms[name].get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = Histogram(
+                    self._buckets.get(name, DEFAULT_BUCKETS)
+                )
+            histogram.observe(value)
+
+    def value(self, name: str, **labels) -> Optional[float]:
+        return self._values.get(name, {}).get(_labels(labels))
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        return self._histograms.get(name, {}).get(_labels(labels))
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            names = sorted(set(self._values) | set(self._histograms))
+            for name in names:
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                kind = self._types.get(
+                    name, "histogram" if name in self._histograms else "untyped"
+                )
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(self._values.get(name, {}).items()):
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+                histograms = self._histograms.get(name, {})
+                for labels, histogram in sorted(histograms.items()):
+                    cumulative = 0
+                    for bucket, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        bucket_labels = _format_labels(labels, le=f"{bucket:g}")
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    inf_labels = _format_labels(labels, le="+Inf")
+                    lines.append(f"{name}_bucket{inf_labels} {histogram.count}")
+                    suffix = _format_labels(labels)
+                    lines.append(f"{name}_sum{suffix} {histogram.sum:g}")
+                    lines.append(f"{name}_count{suffix} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def view(self):
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+
+metrics = Metrics()
+
+
+def init_app(app):
+    """Initialize metrics extension"""
+    metrics.init_app(app)
@@ -0,0 +1,462 @@
+"""Department-partitioned employee storage
+
+With ``EMPLOYEE_PARTITIONS`` set to a list of ``SQLALCHEMY_BINDS`` keys,
+employees are stored in the ``employees`` table of those databases instead
+of the main one, each department in the partition picked by the CRC32 of
+its name. Writes to different partitions no longer lock each other.
+
+Department-scoped queries run on a single partition. Global queries run on
+every partition in a thread pool, each returning rows already sorted, and
+the sorted results are merged with a k-way heap merge.
+
+Partitions number their rows independently, so the id exposed by the API
+encodes the partition: ``local_id * len(partitions) + partition``. The
+number of partitions cannot change once employees are stored. An employee
+moved to a department of another partition is moved to that partition, and
+gets a new id.
+
+Only the employees are partitioned: the change log, the department
+headcounts and the monthly hires stay in the main database, and are written
+by the callers once the partitions are committed.
+"""
+import heapq
+import itertools
+import operator
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus as status
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+import sqlalchemy as sa
+from flask import abort
+
+from app.extensions.database import db
+from app.models.employees import Employee
+from app.models.upgrades import upgrade_schema
+from app.utils.updates import check_version
+
+Rows = List[sa.RowMapping]
+# Conditions on the employees table of each partition to visit
+Criteria = Mapping[int, list]
+
+
+class EmployeePartitions:
+    """Routing and scatter-gather over the employee partitions"""
+
+    table = Employee.__table__
+
+    def __init__(self, app=None):
+        self.engines: Tuple[sa.Engine, ...] = ()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        keys = tuple(app.config.get("EMPLOYEE_PARTITIONS") or ())
+        if not keys:
+            return
+        missing = set(keys) - set(app.config.get("SQLALCHEMY_BINDS") or {})
+        if missing:
+            missing = ", ".join(sorted(missing))
+            raise ValueError(f"Unknown partition binds: {missing}")
+        with app.app_context():
+            self.setup([db.engines[key] for key in keys])
+
+    def setup(self, engines: Sequence[sa.Engine]) -> None:
+        """Use the given databases as partitions, creating their table"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.engines = tuple(engines)
+        if not self.engines:
+            return
+        for engine in self.engines:
+            self.table.create(engine, checkfirst=True)
+            with engine.begin() as connection:
+                upgrade_schema(connection)
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(self.engines), thread_name_prefix="partition"
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    def partition(self, department: str) -> int:
+        """The partition of a department"""
+        return zlib.crc32(department.encode()) % len(self.engines)
+
+    def encode_id(self, partition: int, local_id: int) -> int:
+        return local_id * len(self.engines) + partition
+
+    def decode_id(self, employee_id: int) -> Tuple[int, int]:
+        """The partition and the local id of an employee id"""
+        return employee_id % len(self.engines), employee_id // len(self.engines)
+
+    def columns(self, partition: int, fields: Optional[Iterable[str]] = None):
+        """Columns of the table, ``id`` being the global id of the employee"""
+        columns = []
+        for column in self.table.c:
+            if fields is not None and column.key not in fields:
+                continue
+            if column.key == "id":
+                column = (column * len(self.engines) + partition).label("id")
+            columns.append(column)
+        return columns
+
+    def execute(self, partition: int, statement) -> Rows:
+        with self.engines[partition].connect() as connection:
+            return connection.execute(statement).mappings().all()
+
+    def insert(self, data: dict) -> sa.RowMapping:
+        partition = self.partition(data["department"])
+        statement = (
+            self.table.insert().values(**data).returning(*self.columns(partition))
+        )
+        with self.engines[partition].begin() as connection:
+            return connection.execute(statement).mappings().one()
+
+    def insert_many(self, rows: Sequence[dict]) -> List[int]:
+        """Insert employees in their partitions, one transaction per partition
+
+        Returns:
+            list: The ids of the inserted employees, grouped by partition.
+        """
+        grouped: Dict[int, List[dict]] = {}
+        for row in rows:
+            grouped.setdefault(self.partition(row["department"]), []).append(row)
+        ids = []
+        for partition, partition_rows in sorted(grouped.items()):
+            statement = self.table.insert().returning(
+                *self.columns(partition, ["id"])
+            )
+            with self.engines[partition].begin() as connection:
+                ids += connection.execute(statement, partition_rows).scalars()
+        return ids
+
+    def get(self, employee_id: int) -> Optional[sa.RowMapping]:
+        partition, local_id = self.decode_id(employee_id)
+        rows = self.execute(
+            partition,
+            sa.select(*self.columns(partition)).where(self.table.c.id == local_id),
+        )
+        return rows[0] if rows else None
+
+    def get_many(
+        self, employee_ids: Iterable[int], fields: Optional[Iterable[str]] = None
+    ) -> Dict[int, sa.RowMapping]:
+        """The employees found among some ids, keyed by id"""
+        wanted: Dict[int, List[int]] = {}
+        for employee_id in employee_ids:
+            partition, local_id = self.decode_id(employee_id)
+            wanted.setdefault(partition, []).append(local_id)
+        found = {}
+        for partition, local_ids in wanted.items():
+            employee_id = self.columns(partition, ["id"])[0]
+            rows = self.execute(
+                partition,
+                sa.select(
+                    *self.columns(partition, fields), employee_id.label("key")
+                ).where(self.table.c.id.in_(local_ids)),
+            )
+            found.update((row["key"], row) for row in rows)
+        return found
+
+    def update(
+        self, employee_id: int, data: dict, expected_versions: Optional[Set[int]]
+    ) -> Tuple[dict, dict]:
+        """Update an employee, moving it if its new department belongs to
+        another partition
+
+        Aborts with 404 when the employee does not exist, and with 412 when
+        it has none of the ``expected_versions``.
+
+        Returns:
+            tuple: The employee before and after the update, whose id changes
+                when it moved.
+        """
+        table = self.table
+        partition, local_id = self.decode_id(employee_id)
+        with self.engines[partition].begin() as connection:
+            current = (
+                connection.execute(sa.select(table).where(table.c.id == local_id))
+                .mappings()
+                .first()
+            )
+            if current is None:
+                abort(status.NOT_FOUND)
+            check_version(current["version"], expected_versions)
+            values = {
+                **{key: value for key, value in current.items() if key != "id"},
+                **data,
+                "version": current["version"] + 1,
+            }
+            target = self.partition(values["department"])
+            # the version is checked again, in case of a concurrent write
+            where = (table.c.id == local_id, table.c.version == current["version"])
+            if target == partition:
+                result = connection.execute(
+                    sa.update(table)
+                    .where(*where)
+                    .values(**data, version=values["version"])
+                )
+                new_id = local_id
+            else:
+                result = connection.execute(sa.delete(table).where(*where))
+            if not result.rowcount:
+                abort(status.PRECONDITION_FAILED)
+            if target != partition:
+                with self.engines[target].begin() as target_connection:
+                    new_id = target_connection.execute(
+                        table.insert().values(**values).returning(table.c.id)
+                    ).scalar_one()
+        previous = {**current, "id": employee_id}
+        return previous, {**values, "id": self.encode_id(target, new_id)}
+
+    def delete(self, employee_id: int, expected_versions: Optional[Set[int]]) -> dict:
+        """Delete an employee, aborting like ``update``
+
+        Returns:
+            dict: The deleted employee.
+        """
+        table = self.table
+        partition, local_id = self.decode_id(employee_id)
+        with self.engines[partition].begin() as connection:
+            current = (
+                connection.execute(sa.select(table).where(table.c.id == local_id))
+                .mappings()
+                .first()
+            )
+            if current is None:
+                abort(status.NOT_FOUND)
+            check_version(current["version"], expected_versions)
+            result = connection.execute(
+                sa.delete(table).where(
+                    table.c.id == local_id, table.c.version == current["version"]
+                )
+            )
+            if not result.rowcount:
+                abort(status.PRECONDITION_FAILED)
+        return {**current, "id": employee_id}
+
+    def bulk_update(
+        self,
+        criteria: Criteria,
+        salary_multiplier: Optional[float] = None,
+        department: Optional[str] = None,
+    ) -> List[Tuple[sa.RowMapping, int]]:
+        """Update the employees matching some criteria in every partition
+
+        Employees staying in their partition are updated with one UPDATE per
+        partition, those moving to the partition of ``department`` are
+        copied there and deleted.
+
+        Returns:
+            list: The matching employees before the update, each with its id
+                after the update.
+        """
+        table = self.table
+        values = {"version": table.c.version + 1}
+        if salary_multiplier is not None:
+            values["salary"] = table.c.salary * salary_multiplier
+        if department is not None:
+            values["department"] = department
+        updated = []
+        for partition, conditions in criteria.items():
+            target = partition if department is None else self.partition(department)
+            with self.engines[partition].begin() as connection:
+                previous = connection.execute(
+                    sa.select(*self.columns(partition), table.c.id.label("local_id"))
+                    .where(*conditions)
+                    .order_by(table.c.id)
+                ).mappings().all()
+                if not previous:
+                    continue
+                local_ids = [row["local_id"] for row in previous]
+                if target == partition:
+                    connection.execute(
+                        sa.update(table)
+                        .where(table.c.id.in_(local_ids))
+                        .values(**values)
+                    )
+                    updated += [(row, row["id"]) for row in previous]
+                    continue
+                moved = [
+                    {
+                        "name": row["name"],
+                        "department": department,
+                        "salary": row["salary"] * salary_multiplier
+                        if salary_multiplier is not None
+                        else row["salary"],
+                        "hire_date": row["hire_date"],
+                        "version": row["version"] + 1,
+                    }
+                    for row in previous
+                ]
+                with self.engines[target].begin() as target_connection:
+                    new_ids = target_connection.execute(
+                        table.insert().returning(*self.columns(target, ["id"])),
+                        moved,
+                    ).scalars().all()
+                connection.execute(sa.delete(table).where(table.c.id.in_(local_ids)))
+                updated += list(zip(previous, new_ids))
+        return updated
+
+    def bulk_delete(self, criteria: Criteria) -> Rows:
+        """Delete the employees matching some criteria in every partition
+
+        Returns:
+            list: The deleted employees.
+        """
+        table = self.table
+        deleted = []
+        for partition, conditions in criteria.items():
+            with self.engines[partition].begin() as connection:
+                previous = connection.execute(
+                    sa.select(*self.columns(partition), table.c.id.label("local_id"))
+                    .where(*conditions)
+                ).mappings().all()
+                local_ids = [row["local_id"] for row in previous]
+                if local_ids:
+                    connection.execute(
+                        sa.delete(table).where(table.c.id.in_(local_ids))
+                    )
+                deleted += previous
+        return deleted
+
+    def scatter(self, make_statement: Callable[[int], sa.Executable]) -> List[Rows]:
+        """Run a statement on every partition in parallel
+
+        Args:
+            make_statement: Callable: Builds the statement of a partition.
+
+        Returns:
+            list: The rows of every partition, in partition order.
+        """
+        futures = [
+            self._executor.submit(self.execute, partition, make_statement(partition))
+            for partition in range(len(self.engines))
+        ]
+        return [future.result() for future in futures]
+
+    def merge(
+        self,
+        results: List[Rows],
+        key: Union[str, Sequence[str]],
+        reverse: bool = False,
+        limit: Optional[int] = None,
+    ) -> Rows:
+        """k-way merge of rows sorted on ``key`` (or on several columns) in
+        every partition"""
+        keys = (key,) if isinstance(key, str) else tuple(key)
+        merged = heapq.merge(*results, key=operator.itemgetter(*keys), reverse=reverse)
+        return list(itertools.islice(merged, limit))
+
+    def count(self, *criteria, partition: Optional[int] = None) -> int:
+        """Count the employees of one partition, or of all of them"""
+        statement = (
+            sa.select(sa.func.count().label("count"))
+            .select_from(self.table)
+            .where(*criteria)
+        )
+        if partition is not None:
+            return self.execute(partition, statement)[0]["count"]
+        return sum(rows[0]["count"] for rows in self.scatter(lambda p: statement))
+
+    def sorted_page(
+        self,
+        page: int,
+        per_page: int,
+        key: str,
+        descending: bool = False,
+        fields: Optional[Iterable[str]] = None,
+        limit: Optional[int] = None,
+    ) -> Tuple[Rows, int]:
+        """A page of the employees of all partitions sorted on a column
+
+        Every partition returns its first ``page * per_page`` rows (at most
+        ``limit``), which are merged and sliced.
+
+        Returns:
+            tuple: The rows of the page and the total number of rows.
+        """
+        wanted = page * per_page if limit is None else min(limit, page * per_page)
+
+        def statement(partition: int):
+            sort_key = self.columns(partition, [key])[0].label("sort_key")
+            return (
+                sa.select(*self.columns(partition, fields), sort_key)
+                .order_by(sort_key.desc() if descending else sort_key)
+                .limit(wanted)
+            )
+
+        rows = self.merge(
+            self.scatter(statement), "sort_key", reverse=descending, limit=wanted
+        )
+        total = self.count()
+        if limit is not None:
+            total = min(total, limit)
+        return rows[(page - 1) * per_page :], total
+
+    def ranked_page(
+        self,
+        make_statement: Callable[[int], sa.Select],
+        keys: Sequence[str],
+        page: int,
+        per_page: int,
+    ) -> Tuple[Rows, int]:
+        """A page of rows of all partitions, each partition's statement
+        returning its rows sorted on the ``keys`` columns
+
+        Returns:
+            tuple: The rows of the page and the total number of rows.
+        """
+        wanted = page * per_page
+        rows = self.merge(
+            self.scatter(lambda partition: make_statement(partition).limit(wanted)),
+            keys,
+            limit=wanted,
+        )
+        total = sum(
+            counts[0]["count"]
+            for counts in self.scatter(
+                lambda partition: sa.select(sa.func.count().label("count")).select_from(
+                    make_statement(partition).order_by(None).subquery()
+                )
+            )
+        )
+        return rows[(page - 1) * per_page :], total
+
+    def hire_counts(self) -> Dict[Tuple[str, int, int], int]:
+        """The number of employees hired per department and month"""
+        table = self.table
+        year = sa.extract("year", table.c.hire_date).label("year")
+        month = sa.extract("month", table.c.hire_date).label("month")
+        statement = sa.select(
+            table.c.department, year, month, sa.func.count().label("hires")
+        ).group_by(table.c.department, year, month)
+        counts: Dict[Tuple[str, int, int], int] = {}
+        for rows in self.scatter(lambda partition: statement):
+            for row in rows:
+                key = (row["department"], int(row["year"]), int(row["month"]))
+                counts[key] = counts.get(key, 0) + row["hires"]
+        return counts
+
+
+employee_partitions = EmployeePartitions()
+
+
+def init_app(app):
+    """Initialize partitioned employee storage extension"""
+    employee_partitions.init_app(app)
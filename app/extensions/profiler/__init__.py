@@ -0,0 +1,237 @@
+"""On-demand request profiling
+
+With ``PROFILER_ENABLED``, a request carrying the ``PROFILER_HEADER`` header
+set to ``PROFILER_SECRET`` is profiled, and so is a random
+``PROFILER_SAMPLE_RATE`` fraction of all requests. Two profilers are
+available, chosen with the ``X-Profile-Mode`` header (``PROFILER_MODE`` by
+default, sampled requests always use the sampling profiler):
+
+- ``cprofile``: deterministic, exact call counts, written as ``.pstats``.
+  Its overhead makes slow Python code look slower than it is.
+- ``sample``: a thread records the stack of the request thread every
+  ``PROFILER_SAMPLE_INTERVAL`` seconds, written as collapsed stacks
+  (``.collapsed``), ready for ``flamegraph.pl`` or speedscope. Its overhead
+  is low enough for continuous use.
+
+The SQL statements run by the request and their durations are written next
+to the profile (``.sql.json``). The name of the files is returned in the
+``X-Profile-Id`` response header.
+"""
+import cProfile
+import datetime as dt
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+import sqlalchemy as sa
+from flask import g, has_request_context, request
+
+MODES = ("cprofile", "sample")
+
+# characters kept from the client's request id in the names of the files
+UNSAFE_CHARACTERS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})".replace(
+        ";", ":"
+    )
+
+
+class SamplingProfiler:
+    """Samples the stack of a thread from a background thread"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: str) -> None:
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class DeterministicProfiler:
+    """cProfile, only one at a time per process"""
+
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self) -> bool:
+        if not self._lock.acquire(blocking=False):
+            return False
+        self._profile.enable()
+        return True
+
+    def stop(self):
+        self._profile.disable()
+        self._lock.release()
+
+    def write(self, path: str) -> None:
+        self._profile.dump_stats(path)
+
+
+class Profiler:
+    """Per-request profiling hooks"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.secret: Optional[str] = None
+        self.header = "X-Profile"
+        self.mode = "cprofile"
+        self.sample_rate = 0.0
+        self.sample_interval = 0.005
+        self.directory = "profiles"
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get("PROFILER_ENABLED", False)
+        self.secret = config.get("PROFILER_SECRET")
+        self.header = config.get("PROFILER_HEADER", self.header)
+        self.mode = config.get("PROFILER_MODE", self.mode)
+        if self.mode not in MODES:
+            raise ValueError(f"Unknown profiler mode: {self.mode}")
+        self.sample_rate = config.get("PROFILER_SAMPLE_RATE", self.sample_rate)
+        self.sample_interval = config.get(
+            "PROFILER_SAMPLE_INTERVAL", self.sample_interval
+        )
+        self.directory = os.path.join(
+            app.instance_path, config.get("PROFILER_DIR", self.directory)
+        )
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.teardown_request(self.discard)
+        # the listeners are cheap when no request is being profiled
+        if not sa.event.contains(sa.Engine, "before_cursor_execute", _before_sql):
+            sa.event.listen(sa.Engine, "before_cursor_execute", _before_sql)
+            sa.event.listen(sa.Engine, "after_cursor_execute", _after_sql)
+
+    def requested_mode(self) -> Optional[str]:
+        """The profiler the current request asks for, if any"""
+        if not self.enabled:
+            return None
+        token = request.headers.get(self.header)
+        if token and self.secret and hmac.compare_digest(token, self.secret):
+            mode = request.headers.get("X-Profile-Mode", self.mode)
+            return mode if mode in MODES else self.mode
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    def start(self):
+        mode = self.requested_mode()
+        if mode is None:
+            return
+        if mode == "sample":
+            profiler = SamplingProfiler(threading.get_ident(), self.sample_interval)
+            profiler.start()
+        else:
+            profiler = DeterministicProfiler()
+            if not profiler.start():
+                return
+        g.profile = {"profiler": profiler, "mode": mode, "sql": []}
+
+    def finish(self, response):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return response
+        profiler = profile["profiler"]
+        profiler.stop()
+
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = "{}-{}-{}".format(
+            dt.datetime.utcnow().strftime("%Y%m%dT%H%M%S%f"),
+            request.endpoint or "unknown",
+            UNSAFE_CHARACTERS.sub("_", g.get("request_id") or str(os.getpid())),
+        )
+        base = os.path.join(self.directory, profile_id)
+        extension = "pstats" if profile["mode"] == "cprofile" else "collapsed"
+        profiler.write(f"{base}.{extension}")
+        with open(f"{base}.sql.json", "w") as f:
+            json.dump(
+                {
+                    "method": request.method,
+                    "path": request.full_path,
+                    "status": response.status_code,
+                    "statements": profile["sql"],
+                    "sql_ms": round(sum(s["duration_ms"] for s in profile["sql"]), 3),
+                },
+                f,
+                indent=2,
+            )
+        response.headers["X-Profile-Id"] = profile_id
+        return response
+
+
+    def discard(self, exc=None):
+        """Stop the profiler of a request whose ``finish`` did not run (an
+        earlier ``after_request`` hook failed), so that cProfile is not left
+        enabled and locked for the rest of the process"""
+        profile = g.pop("profile", None)
+        if profile is not None:
+            profile["profiler"].stop()
+
+
+def _profiled_statements() -> Optional[list]:
+    if not has_request_context():
+        return None
+    profile = g.get("profile")
+    return profile["sql"] if profile is not None else None
+
+
+def _before_sql(conn, cursor, statement, parameters, context, executemany):
+    if _profiled_statements() is not None:
+        conn.info.setdefault("profiler_started", []).append(time.perf_counter())
+
+
+def _after_sql(conn, cursor, statement, parameters, context, executemany):
+    statements = _profiled_statements()
+    if statements is None or not conn.info.get("profiler_started"):
+        return
+    started = conn.info["profiler_started"].pop()
+    statements.append(
+        {
+            "statement": statement,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+    )
+
+
+profiler = Profiler()
+
+
+def init_app(app):
+    """Initialize request profiling extension"""
+    profiler.init_app(app)
@@ -0,0 +1,174 @@
+"""Salary prediction model
+
+Loads the trained model artifact once per process and memoizes predictions.
+Predictions only depend on the department and the hire date, so they are
+cached in a bounded LRU keyed on ``(department, hire date bucket)``. The
+cache is dropped whenever the model artifact on disk changes.
+"""
+import datetime as dt
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import joblib
+import pandas as pd
+
+from app.constants import departments
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DATE_GRANULARITIES = ("second", "day", "week", "month", "quarter", "year")
+
+# the encoding of the department feature, that of the trained models
+DEPARTMENT_CODES = {department: i for i, department in enumerate(departments)}
+
+_MISSING = object()
+
+
+class UnknownDepartment(ValueError):
+    """The models were not trained with the department, e.g. one created
+    through ``POST /departments``"""
+
+
+def truncate_date(value: dt.datetime, granularity: str) -> dt.datetime:
+    """Truncate a date to the start of its bucket
+
+    Args:
+        value: datetime: The date to truncate.
+        granularity: str: One of ``DATE_GRANULARITIES``.
+
+    Returns:
+        datetime: The first instant of the bucket ``value`` belongs to.
+    """
+    if not isinstance(value, dt.datetime):
+        value = dt.datetime.combine(value, dt.time())
+    if granularity == "second":
+        return value.replace(microsecond=0)
+    day = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - dt.timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    if granularity == "quarter":
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    if granularity == "year":
+        return day.replace(month=1, day=1)
+    raise ValueError(f"Unknown date granularity: {granularity}")
+
+
+class SalaryModel:
+    """Salary prediction model loaded from a joblib artifact"""
+
+    def __init__(self, app=None):
+        self.path: str = "model.pkl"
+        self.granularity: str = "day"
+        self.check_interval: float = 1.0
+        self.cache = LRUCache()
+        self.reloads = 0
+        self._model = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.path = config.get("SALARY_MODEL_PATH", self.path)
+        self.granularity = config.get(
+            "SALARY_PREDICTION_DATE_GRANULARITY", self.granularity
+        )
+        if self.granularity not in DATE_GRANULARITIES:
+            raise ValueError(f"Unknown date granularity: {self.granularity}")
+        self.check_interval = config.get(
+            "SALARY_MODEL_CHECK_INTERVAL", self.check_interval
+        )
+        self.cache = LRUCache(
+            max_size=config.get("SALARY_PREDICTION_CACHE_SIZE", 1024),
+            ttl=config.get("SALARY_PREDICTION_CACHE_TTL"),
+        )
+        self._model = None
+        self._signature = None
+        self.load()
+
+    def _stat_signature(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def load(self) -> None:
+        """(Re)load the model artifact and drop memoized predictions"""
+        with self._lock:
+            signature = self._stat_signature()
+            self._model = joblib.load(self.path)
+            self._signature = signature
+            self._checked_at = time.monotonic()
+            self.cache.clear()
+            self.reloads += 1
+        logger.info("Loaded salary model from %s", self.path)
+
+    def _ensure_fresh(self) -> None:
+        now = time.monotonic()
+        if self._model is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        if self._model is None or self._stat_signature() != self._signature:
+            self.load()
+
+    @property
+    def model(self):
+        self._ensure_fresh()
+        return self._model
+
+    def predict(self, department: str, hire_date: dt.datetime) -> float:
+        """Predict the salary for a department and hire date
+
+        Args:
+            department: str: The department of the employee.
+            hire_date: datetime: The hire date of the employee.
+
+        Returns:
+            float: predicted salary.
+
+        Raises:
+            UnknownDepartment: The model cannot encode the department.
+        """
+        if department not in DEPARTMENT_CODES:
+            raise UnknownDepartment(f"No salary model for department {department}")
+        model = self.model
+        bucket = truncate_date(hire_date, self.granularity)
+        key = (department, bucket)
+        prediction = self.cache.get(key, _MISSING)
+        if prediction is not _MISSING:
+            return prediction
+
+        df = pd.DataFrame(
+            {"department": department, "hire_date": bucket.timestamp()}, index=[0]
+        )
+        df["department"] = df["department"].map(DEPARTMENT_CODES)
+        prediction = float(model.predict(df)[0])
+
+        self.cache.set(key, prediction)
+        return prediction
+
+    def stats(self) -> dict:
+        return {
+            **self.cache.stats(),
+            "granularity": self.granularity,
+            "model_reloads": self.reloads,
+        }
+
+
+salary_model = SalaryModel()
+
+
+def init_app(app):
+    """Initialize salary model extension"""
+    salary_model.init_app(app)
@@ -0,0 +1,284 @@
+"""Salary prediction model training
+
+``train_salary_model`` fits a ridge regression on the employees table.
+``search_salary_model`` compares candidate estimators instead: the feature
+matrix is built once per version of the data and cached as a ``.npy`` file
+which the cross-validation workers memory-map, so that they share it rather
+than each receiving a copy, and the candidates are fitted in parallel.
+
+With partitioned storage, ``employee_engines`` are the engines of the
+partitions, the employees being read from all of them.
+"""
+import glob
+import hashlib
+import os
+import time
+from typing import Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import Lasso, Ridge
+from sklearn.model_selection import GridSearchCV, KFold, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.tree import DecisionTreeRegressor
+
+from app.extensions.salary_model import DEPARTMENT_CODES
+from app.models import Employee, EmployeeChange
+from app.utils.progress import Reporter, ignore
+
+FEATURES = ["department", "hire_date"]
+
+# Estimators and hyperparameters compared by search_salary_model
+CANDIDATES = [
+    {"regressor": [Ridge()], "regressor__alpha": [0.1, 1.0, 10.0, 100.0]},
+    {"regressor": [Lasso(max_iter=10000)], "regressor__alpha": [1.0, 10.0, 100.0]},
+    {"regressor": [DecisionTreeRegressor(random_state=0)],
+     "regressor__max_depth": [2, 4, 8]},
+]
+
+
+def _read_employees(engine, employee_engines: Sequence = ()) -> pd.DataFrame:
+    """The department, hire date and salary of every employee, skipping
+    the departments the models cannot encode (``DEPARTMENT_CODES``)"""
+    statement = sa.select(
+        Employee.department, Employee.hire_date, Employee.salary
+    ).where(Employee.department.in_(DEPARTMENT_CODES))
+    return pd.concat(
+        [pd.read_sql(statement, e) for e in employee_engines or (engine,)],
+        ignore_index=True,
+    )
+
+
+def train_salary_model(
+    engine,
+    model_path: str,
+    report: Optional[Reporter] = None,
+    employee_engines: Sequence = (),
+) -> dict:
+    """Train a model to predict salaries and save it to ``model_path``
+
+    Args:
+        engine: The engine of the database holding the employees.
+        model_path: str: Where to save the trained model.
+        report: Callable: Called with progress messages.
+        employee_engines: The engines of the employee partitions, if any.
+
+    Returns:
+        dict: The number of employees trained on and the test score.
+    """
+    report = report or ignore
+
+    # Load the fetched data into a Pandas DataFrame
+    df = _read_employees(engine, employee_engines)
+    report(f"Loaded {len(df)} employees, columns: {df.columns}", 0.2)
+
+    # Clean up the data
+    df["department"] = df["department"].map(DEPARTMENT_CODES)
+    df["hire_date"] = df["hire_date"].apply(lambda x: x.timestamp())
+    report("Cleaned up data", 0.4)
+
+    # Train a model to predict salaries
+    # used Ridge regression because it performed better on random data
+    # however would use Lasso or MultiLinearRegression for real data
+    model = _pipeline(Ridge(alpha=1.0))
+
+    # Split the data into train and test sets
+    X_train, X_test, y_train, y_test = train_test_split(
+        df[["department", "hire_date"]], df["salary"], test_size=0.25
+    )
+    report("Split data into train and test sets", 0.5)
+
+    # Fit the model
+    model.fit(X_train, y_train)
+
+    # Evaluate the model
+    score = model.score(X_test, y_test)
+    report(f"Model score: {score}", 0.9)
+
+    _save(model, model_path)
+    report("Trained model", 1.0)
+    return {"employees": len(df), "score": score}
+
+
+def _pipeline(regressor) -> Pipeline:
+    """The preprocessing of the features followed by ``regressor``"""
+    # Define the columns to be transformed
+    categorical_cols = ['department']
+    numerical_cols = ['hire_date']
+
+    # Define the transformers
+    categorical_transformer = Pipeline(steps=[
+        ('onehot', OneHotEncoder(handle_unknown='ignore'))
+    ])
+
+    numerical_transformer = Pipeline(steps=[
+        ('scaler', StandardScaler())
+    ])
+
+    # Combine the transformers using ColumnTransformer
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('cat', categorical_transformer, categorical_cols),
+            ('num', numerical_transformer, numerical_cols)
+        ],
+        remainder='passthrough'
+    )
+
+    return Pipeline(steps=[
+        ('preprocessor', preprocessor),
+        ('regressor', regressor)
+    ])
+
+
+def _save(model: Pipeline, model_path: str) -> None:
+    # Save the model
+    # write to a temporary file first so that running servers, which reload
+    # the artifact when it changes, never see a partially written model
+    tmp_path = f"{model_path}.tmp"
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, model_path)
+
+
+def data_version(engine, employee_engines: Sequence = ()) -> str:
+    """A key that changes whenever employees are written through the API
+
+    Every write records a change with a new sequence number, the count and
+    the highest id cover writes made without the changelog.
+    """
+    key = []
+    for employee_engine in employee_engines or (engine,):
+        with employee_engine.connect() as connection:
+            count, max_id = connection.execute(
+                sa.select(sa.func.count(), sa.func.max(Employee.id))
+            ).one()
+        key.append(f"{count}:{max_id}")
+    with engine.connect() as connection:
+        sequence = connection.execute(
+            sa.select(sa.func.max(EmployeeChange.sequence))
+        ).scalar()
+    key = f"{':'.join(key)}:{sequence}"
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def feature_matrix(
+    engine, cache_dir: str, employee_engines: Sequence = ()
+) -> Tuple[np.ndarray, bool]:
+    """The features and salaries of the employees, memory-mapped from the
+    cache, one row per employee with the columns of ``FEATURES`` then the
+    salary
+
+    Returns:
+        tuple: The matrix and whether it was read from the cache.
+    """
+    version = data_version(engine, employee_engines)
+    path = os.path.join(cache_dir, f"salary-features-{version}.npy")
+    if os.path.exists(path):
+        return np.load(path, mmap_mode="r"), True
+
+    df = _read_employees(engine, employee_engines)
+    matrix = np.column_stack(
+        [
+            df["department"].map(DEPARTMENT_CODES).to_numpy(dtype=float),
+            df["hire_date"].map(lambda x: x.timestamp()).to_numpy(dtype=float),
+            df["salary"].to_numpy(dtype=float),
+        ]
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    # matrices of older versions of the data are not read anymore
+    for stale in glob.glob(os.path.join(cache_dir, "salary-features-*.npy")):
+        os.remove(stale)
+    tmp_path = os.path.join(cache_dir, f".salary-features-{version}.tmp.npy")
+    np.save(tmp_path, matrix)
+    os.replace(tmp_path, path)
+    return np.load(path, mmap_mode="r"), False
+
+
+def search_salary_model(
+    engine,
+    model_path: str,
+    cache_dir: str,
+    n_jobs: Optional[int] = -1,
+    folds: int = 5,
+    report: Optional[Reporter] = None,
+    employee_engines: Sequence = (),
+) -> dict:
+    """Cross-validate the ``CANDIDATES`` and save the best one to
+    ``model_path``, refitted on all the employees
+
+    Args:
+        engine: The engine of the database holding the employees.
+        model_path: str: Where to save the best model.
+        cache_dir: str: Where to cache the feature matrix.
+        n_jobs: int: Number of worker processes, -1 for one per core.
+        folds: int: Number of cross-validation folds.
+        report: Callable: Called with progress messages.
+        employee_engines: The engines of the employee partitions, if any.
+
+    Returns:
+        dict: The number of employees, the fit time and score of every
+            candidate, best first, and the best candidate.
+    """
+    report = report or ignore
+
+    started = time.perf_counter()
+    matrix, cached = feature_matrix(engine, cache_dir, employee_engines)
+    source = "cached" if cached else "built"
+    report(
+        f"{source.capitalize()} the feature matrix of {len(matrix)} employees"
+        f" in {time.perf_counter() - started:.3f}s",
+        0.1,
+    )
+    # views of the memory-mapped matrix, not copies
+    X = pd.DataFrame(matrix[:, :2], columns=FEATURES, copy=False)
+    y = matrix[:, 2]
+
+    search = GridSearchCV(
+        _pipeline(Ridge()),
+        CANDIDATES,
+        cv=KFold(n_splits=folds, shuffle=True, random_state=0),
+        n_jobs=n_jobs,
+        refit=True,
+    )
+    search.fit(X, y)
+    results = search.cv_results_
+    candidates = sorted(
+        (
+            {
+                "estimator": type(params["regressor"]).__name__,
+                "params": {
+                    name.split("__", 1)[1]: value
+                    for name, value in params.items()
+                    if name != "regressor"
+                },
+                "fit_seconds": float(fit_time),
+                "score": float(score),
+            }
+            for params, fit_time, score in zip(
+                results["params"],
+                results["mean_fit_time"],
+                results["mean_test_score"],
+            )
+        ),
+        key=lambda candidate: -candidate["score"],
+    )
+    for candidate in candidates:
+        report(
+            f"{candidate['estimator']} {candidate['params']}:"
+            f" score {candidate['score']:.4f},"
+            f" fit {candidate['fit_seconds'] * 1000:.1f}ms",
+            0.8,
+        )
+
+    _save(search.best_estimator_, model_path)
+    report(f"Saved {candidates[0]['estimator']} {candidates[0]['params']}", 1.0)
+    return {
+        "employees": len(matrix),
+        "cached_features": cached,
+        "candidates": candidates,
+        "best": candidates[0],
+        "score": candidates[0]["score"],
+    }
@@ -0,0 +1,181 @@
+"""Warm-up and health endpoints
+
+With ``WARMUP_ENABLED``, every process warms up when the application is
+created, before it is reported ready, running the ``WARMUP_STEPS``:
+
+- ``connections``: open ``WARMUP_CONNECTIONS`` pool connections (the pool
+  size by default) at once, and one per employee partition.
+- ``model``: run one salary prediction, importing the lazy code paths.
+- ``indexes``: run the queries of the hot endpoints once, reading the pages
+  of their indexes into the database page cache.
+- ``caches``: load the department names, the salary index and the
+  analytics snapshot (when enabled).
+
+``/healthz`` answers 200 as long as the process serves requests. ``/readyz``
+answers 503 until the warm-up is done, then 200 with the duration of every
+step. A failing step is logged and reported, it does not keep the process
+from being ready. With ``WARMUP_BACKGROUND`` the warm-up runs in a thread
+so that the process serves ``/healthz`` meanwhile, and it starts again in
+processes forked from a warmed-up one (gunicorn ``preload_app``).
+"""
+import datetime as dt
+import os
+import threading
+import time
+from contextlib import ExitStack
+from http import HTTPStatus as status
+from typing import Dict, Optional
+
+import sqlalchemy as sa
+from flask import jsonify
+
+from app.extensions.database import db
+from app.extensions.metrics import metrics
+from app.extensions.partitions import employee_partitions
+from app.extensions.salary_model import salary_model
+from app.models import Employee, MonthlyHires
+from app.utils.analytics import employee_snapshot
+from app.utils.departments import department_names
+from app.utils.salary_index import salary_index
+
+STEPS = ("connections", "model", "indexes", "caches")
+
+
+class Warmup:
+    """Warm-up steps and readiness of the process"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.background = True
+        self.steps = STEPS
+        self.connections: Optional[int] = None
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self._ready = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.app = app
+        self.enabled = config.get("WARMUP_ENABLED", False)
+        self.background = config.get("WARMUP_BACKGROUND", self.background)
+        self.steps = tuple(config.get("WARMUP_STEPS", self.steps))
+        unknown = set(self.steps) - set(STEPS)
+        if unknown:
+            raise ValueError(f"Unknown warm-up steps: {', '.join(sorted(unknown))}")
+        self.connections = config.get("WARMUP_CONNECTIONS")
+        app.add_url_rule("/healthz", endpoint="healthz", view_func=self.healthz)
+        app.add_url_rule("/readyz", endpoint="readyz", view_func=self.readyz)
+        metrics.describe("warmup_seconds", "gauge", "Duration of the warm-up steps")
+        self.start()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self) -> None:
+        self._ready.clear()
+        self.timings, self.errors = {}, {}
+        if not self.enabled:
+            self._ready.set()
+        elif self.background:
+            threading.Thread(target=self.run, name="warmup", daemon=True).start()
+        else:
+            self.run()
+
+    def restart_after_fork(self) -> None:
+        if self.app is None or not self.enabled:
+            return
+        # connections opened before fork belong to the parent
+        with self.app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+        self.start()
+
+    def run(self) -> None:
+        """Run every warm-up step, then report the process ready"""
+        logger = self.app.logger
+        started = time.perf_counter()
+        with self.app.app_context():
+            for step in self.steps:
+                step_started = time.perf_counter()
+                try:
+                    getattr(self, f"warm_{step}")()
+                except Exception as e:
+                    self.errors[step] = str(e)
+                    logger.warning("Warm-up step %s failed: %s", step, e)
+                finally:
+                    db.session.rollback()
+                seconds = time.perf_counter() - step_started
+                self.timings[step] = round(seconds * 1000, 3)
+                metrics.set("warmup_seconds", seconds, step=step)
+        seconds = time.perf_counter() - started
+        self.timings["total"] = round(seconds * 1000, 3)
+        metrics.set("warmup_seconds", seconds, step="total")
+        logger.info(
+            "Warmed up in %.1fms (%s)",
+            seconds * 1000,
+            ", ".join(f"{step} {self.timings[step]:.1f}ms" for step in self.steps),
+        )
+        self._ready.set()
+
+    def warm_connections(self) -> None:
+        pool = db.engine.pool
+        count = self.connections
+        if count is None:
+            count = pool.size() if hasattr(pool, "size") else 1
+        with ExitStack() as stack:
+            for _ in range(count):
+                connection = stack.enter_context(db.engine.connect())
+                connection.execute(sa.text("SELECT 1"))
+        for engine in employee_partitions.engines:
+            with engine.connect() as connection:
+                connection.execute(sa.text("SELECT 1"))
+
+    def warm_model(self) -> None:
+        names = sorted(department_names.get())
+        if names:
+            salary_model.predict(names[0], dt.datetime.utcnow())
+
+    def warm_indexes(self) -> None:
+        limit = self.app.config.get("TOP_RESULT_LIMIT", 10)
+        statements = (
+            sa.select(Employee.department, sa.func.count())
+            .group_by(Employee.department),
+            sa.select(Employee.id).order_by(Employee.salary.desc()).limit(limit),
+            sa.select(Employee.id).order_by(Employee.hire_date.desc()).limit(limit),
+            sa.select(Employee.id).order_by(Employee.name).limit(1),
+            sa.select(sa.func.sum(MonthlyHires.hires)),
+        )
+        for statement in statements:
+            db.session.execute(statement).all()
+
+    def warm_caches(self) -> None:
+        department_names.invalidate()
+        for name in department_names.get():
+            salary_index.get(name)
+        if employee_snapshot.enabled():
+            employee_snapshot.get()
+
+    def healthz(self):
+        return jsonify({"status": "ok"})
+
+    def readyz(self):
+        response = jsonify(
+            {"ready": self.ready, "timings": self.timings, "errors": self.errors}
+        )
+        if not self.ready:
+            response.status_code = status.SERVICE_UNAVAILABLE
+        return response
+
+
+warmup = Warmup()
+
+os.register_at_fork(after_in_child=warmup.restart_after_fork)
+
+
+def init_app(app):
+    """Initialize warm-up extension"""
+    warmup.init_app(app)
@@ -2,4 +2,8 @@
 
 from .members import Member  # noqa
 from .teams import Team  # noqa
-from .employees import Employee  # noqa
\ No newline at end of file
+from .employees import Employee  # noqa
+from .employee_changes import EmployeeChange  # noqa
+from .departments import Department  # noqa
+from .imports import ImportCheckpoint  # noqa
+from .hires import MonthlyHires  # noqa
@@ -0,0 +1,108 @@
+"""Departments model"""
+
+from typing import Mapping
+
+import sqlalchemy as sa
+
+from app.constants import departments
+from app.extensions.database import db
+from .employees import Employee
+
+
+class Department(db.Model):
+    """Department model class
+
+    ``headcount`` caches the number of employees of the department. ORM
+    writes of employees keep it up to date through the mapper events below,
+    set-based writes call ``refresh_headcounts``.
+    """
+
+    __tablename__ = "departments"
+
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    name = sa.Column(sa.String(length=50), nullable=False, unique=True)
+    headcount = sa.Column(sa.Integer, nullable=False, default=0, server_default="0")
+
+
+def refresh_headcounts(connection: sa.Connection, names=None) -> None:
+    """Recount the employees of some departments, or of all of them"""
+    count = (
+        sa.select(sa.func.count(Employee.id))
+        .where(Employee.department == Department.name)
+        .scalar_subquery()
+    )
+    statement = sa.update(Department).values(headcount=count)
+    if names is not None:
+        statement = statement.where(Department.name.in_(list(names)))
+    connection.execute(statement)
+
+
+def move_headcount(connection: sa.Connection, employee_id: int, name: str) -> None:
+    """Move an employee to another department in the headcounts, to run
+    before the employee itself is updated"""
+    current = (
+        sa.select(Employee.department)
+        .where(Employee.id == employee_id)
+        .scalar_subquery()
+    )
+    connection.execute(
+        sa.update(Department)
+        .where(Department.name == current)
+        .values(headcount=Department.headcount - 1)
+    )
+    _change_headcount(connection, name, 1)
+
+
+def add_headcounts(connection: sa.Connection, counts: Mapping[str, int]) -> None:
+    """Add the employees inserted in bulk to the headcounts"""
+    if not counts:
+        return
+    connection.execute(
+        sa.update(Department)
+        .where(Department.name == sa.bindparam("department"))
+        .values(headcount=Department.headcount + sa.bindparam("count")),
+        [{"department": name, "count": count} for name, count in counts.items()],
+    )
+
+
+def _change_headcount(connection: sa.Connection, name: str, delta: int) -> None:
+    connection.execute(
+        sa.update(Department)
+        .where(Department.name == name)
+        .values(headcount=Department.headcount + delta)
+    )
+
+
+@sa.event.listens_for(Employee, "after_insert")
+def _employee_inserted(mapper, connection, target):
+    _change_headcount(connection, target.department, 1)
+
+
+@sa.event.listens_for(Employee, "after_delete")
+def _employee_deleted(mapper, connection, target):
+    _change_headcount(connection, target.department, -1)
+
+
+@sa.event.listens_for(Employee, "after_update")
+def _employee_updated(mapper, connection, target):
+    history = sa.inspect(target).attrs.department.history
+    if history.deleted and history.added:
+        _change_headcount(connection, history.deleted[0], -1)
+        _change_headcount(connection, history.added[0], 1)
+
+
+@sa.event.listens_for(Department.__table__, "after_create")
+def seed_departments(target, connection, **kw):
+    connection.execute(sa.insert(target), [{"name": name} for name in departments])
+    if sa.inspect(connection).has_table(Employee.__tablename__):
+        # departments of employees created before the departments table
+        known = sa.select(target.c.name)
+        connection.execute(
+            sa.insert(target).from_select(
+                ["name"],
+                sa.select(Employee.department)
+                .where(Employee.department.not_in(known))
+                .distinct(),
+            )
+        )
+        refresh_headcounts(connection)
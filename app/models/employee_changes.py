@@ -0,0 +1,52 @@
+"""Employee changes model"""
+
+import datetime as dt
+
+import sqlalchemy as sa
+
+from app.extensions.database import db
+from .employees import Employee
+
+
+class EmployeeChange(db.Model):
+    """Change log of the employees table, read by sync clients
+
+    Each row records that an employee was inserted, updated or deleted
+    (tombstone). Rows only reference the employee, its current state is
+    joined in when the changes are read.
+    """
+
+    __tablename__ = "employee_changes"
+    # sequence numbers are cursors of sync clients, they must never be handed
+    # out again once deleted (SQLite reuses the highest rowid otherwise)
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    INSERT = "insert"
+    UPDATE = "update"
+    DELETE = "delete"
+
+    sequence = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    employee_id = sa.Column(sa.Integer, nullable=False, index=True)
+    operation = sa.Column(sa.String(length=6), nullable=False)
+    changed_at = sa.Column(
+        sa.DateTime, nullable=False, default=dt.datetime.utcnow, index=True
+    )
+
+
+# created after employees, which it is seeded from
+EmployeeChange.__table__.add_is_dependent_on(Employee.__table__)
+
+
+@sa.event.listens_for(EmployeeChange.__table__, "after_create")
+def seed_employee_changes(target, connection, **kw):
+    # employees created before the change log existed are reported as inserts
+    connection.execute(
+        sa.insert(target).from_select(
+            ["employee_id", "operation", "changed_at"],
+            sa.select(
+                Employee.id,
+                sa.literal(EmployeeChange.INSERT),
+                sa.literal(dt.datetime.utcnow()),
+            ).order_by(Employee.id),
+        )
+    )
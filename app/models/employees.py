@@ -7,10 +7,89 @@ class Employee(db.Model):
     """Employee model class"""
 
     __tablename__ = "employees"
-    __table_args__ = {"extend_existing": True}
+    # ETags (If-Match) are versions, which restart at 1: a deleted employee's
+    # id must never be handed out again (SQLite reuses the highest rowid)
+    __table_args__ = {"extend_existing": True, "sqlite_autoincrement": True}
 
     id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
-    name = sa.Column(sa.String(length=50), nullable=False)
-    department = sa.Column(sa.String(length=50), nullable=False)
+    name = sa.Column(sa.String(length=50), nullable=False, index=True)
+    department = sa.Column(
+        sa.String(length=50),
+        sa.ForeignKey("departments.name"),
+        nullable=False,
+        index=True,
+    )
     salary = sa.Column(sa.Float, nullable=False, default=0.0)
     hire_date = sa.Column(sa.DateTime, nullable=False)
+    # bumped on every update, used for optimistic concurrency (If-Match)
+    version = sa.Column(sa.Integer, nullable=False, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
+
+
+# Full-text index on employee names, only available on SQLite (FTS5).
+# It is an external content table over ``employees`` kept in sync by triggers,
+# with prefix indexes so that prefix queries do not scan the token b-tree.
+SEARCH_INDEX_TABLE = "employees_fts"
+
+SEARCH_INDEX_DDL = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_INDEX_TABLE} USING fts5(
+        name, content='employees', content_rowid='id', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_INDEX_TABLE}_ai AFTER INSERT ON employees
+    BEGIN
+        INSERT INTO {SEARCH_INDEX_TABLE}(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_INDEX_TABLE}_ad AFTER DELETE ON employees
+    BEGIN
+        INSERT INTO {SEARCH_INDEX_TABLE}({SEARCH_INDEX_TABLE}, rowid, name)
+        VALUES ('delete', old.id, old.name);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_INDEX_TABLE}_au AFTER UPDATE OF name ON employees
+    BEGIN
+        INSERT INTO {SEARCH_INDEX_TABLE}({SEARCH_INDEX_TABLE}, rowid, name)
+        VALUES ('delete', old.id, old.name);
+        INSERT INTO {SEARCH_INDEX_TABLE}(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+)
+
+
+def create_search_index(connection: sa.Connection) -> bool:
+    """Create (if needed) and rebuild the full-text index of employee names
+
+    Returns:
+        bool: Whether the database supports the full-text index.
+    """
+    if connection.dialect.name != "sqlite":
+        return False
+    for statement in SEARCH_INDEX_DDL:
+        connection.exec_driver_sql(statement)
+    connection.exec_driver_sql(
+        f"INSERT INTO {SEARCH_INDEX_TABLE}({SEARCH_INDEX_TABLE}) VALUES ('rebuild')"
+    )
+    return True
+
+
+def drop_search_index(connection: sa.Connection) -> None:
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {SEARCH_INDEX_TABLE}")
+
+
+sa.event.listen(
+    Employee.__table__,
+    "after_create",
+    lambda target, connection, **kw: create_search_index(connection),
+)
+sa.event.listen(
+    Employee.__table__,
+    "before_drop",
+    lambda target, connection, **kw: drop_search_index(connection),
+)
@@ -0,0 +1,144 @@
+"""Monthly hires rollup model"""
+
+import datetime as dt
+from typing import Mapping, Optional, Tuple
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions.database import db
+from .employees import Employee
+
+# (department, year, month)
+Bucket = Tuple[str, int, int]
+
+
+class MonthlyHires(db.Model):
+    """Number of employees hired per department and month
+
+    Kept up to date like the department headcounts: ORM writes of employees
+    through the mapper events below, set-based writes with ``add_hires``,
+    ``move_hire`` or ``refresh_hires``. Its size only depends on the number
+    of departments and months, not on the number of employees.
+    """
+
+    __tablename__ = "monthly_hires"
+
+    department = sa.Column(sa.String(length=50), primary_key=True)
+    year = sa.Column(sa.Integer, primary_key=True)
+    month = sa.Column(sa.Integer, primary_key=True)
+    hires = sa.Column(sa.Integer, nullable=False, default=0, server_default="0")
+
+
+def bucket(department: str, hire_date: dt.datetime) -> Bucket:
+    return department, hire_date.year, hire_date.month
+
+
+def add_hires(connection: sa.Connection, counts: Mapping[Bucket, int]) -> None:
+    """Add hires (or remove them, with negative counts) to the rollup"""
+    rows = [
+        {"department": department, "year": year, "month": month, "hires": count}
+        for (department, year, month), count in counts.items()
+        if count
+    ]
+    if not rows:
+        return
+    table = MonthlyHires.__table__
+    dialects = {"sqlite": sqlite, "postgresql": postgresql}
+    dialect = dialects.get(connection.dialect.name)
+    if dialect is not None:
+        statement = dialect.insert(table)
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=[table.c.department, table.c.year, table.c.month],
+                set_={"hires": table.c.hires + statement.excluded.hires},
+            ),
+            rows,
+        )
+        return
+    for row in rows:
+        result = connection.execute(
+            sa.update(table)
+            .where(
+                table.c.department == row["department"],
+                table.c.year == row["year"],
+                table.c.month == row["month"],
+            )
+            .values(hires=table.c.hires + row["hires"])
+        )
+        if not result.rowcount:
+            connection.execute(sa.insert(table).values(**row))
+
+
+def move_hire(
+    connection: sa.Connection,
+    employee_id: int,
+    department: Optional[str] = None,
+    hire_date: Optional[dt.datetime] = None,
+) -> None:
+    """Move an employee to another department or month in the rollup, to run
+    before the employee itself is updated"""
+    if department is None and hire_date is None:
+        return
+    current = connection.execute(
+        sa.select(Employee.department, Employee.hire_date).where(
+            Employee.id == employee_id
+        )
+    ).first()
+    if current is None:
+        return
+    old = bucket(current.department, current.hire_date)
+    new = bucket(department or current.department, hire_date or current.hire_date)
+    if old != new:
+        add_hires(connection, {old: -1, new: 1})
+
+
+def refresh_hires(connection: sa.Connection, departments=None) -> None:
+    """Recount the hires of some departments, or of all of them"""
+    table = MonthlyHires.__table__
+    delete = sa.delete(table)
+    year = sa.extract("year", Employee.hire_date)
+    month = sa.extract("month", Employee.hire_date)
+    counts = (
+        sa.select(Employee.department, year, month, sa.func.count())
+        .group_by(Employee.department, year, month)
+    )
+    if departments is not None:
+        departments = list(departments)
+        delete = delete.where(table.c.department.in_(departments))
+        counts = counts.where(Employee.department.in_(departments))
+    connection.execute(delete)
+    connection.execute(
+        sa.insert(table).from_select(["department", "year", "month", "hires"], counts)
+    )
+
+
+@sa.event.listens_for(Employee, "after_insert")
+def _employee_inserted(mapper, connection, target):
+    add_hires(connection, {bucket(target.department, target.hire_date): 1})
+
+
+@sa.event.listens_for(Employee, "after_delete")
+def _employee_deleted(mapper, connection, target):
+    add_hires(connection, {bucket(target.department, target.hire_date): -1})
+
+
+@sa.event.listens_for(Employee, "after_update")
+def _employee_updated(mapper, connection, target):
+    attrs = sa.inspect(target).attrs
+    department, hire_date = attrs.department.history, attrs.hire_date.history
+    if not (department.deleted or hire_date.deleted):
+        return
+    old = bucket(
+        (department.deleted or [target.department])[0],
+        (hire_date.deleted or [target.hire_date])[0],
+    )
+    new = bucket(target.department, target.hire_date)
+    if old != new:
+        add_hires(connection, {old: -1, new: 1})
+
+
+@sa.event.listens_for(MonthlyHires.__table__, "after_create")
+def seed_hires(target, connection, **kw):
+    if sa.inspect(connection).has_table(Employee.__tablename__):
+        refresh_hires(connection)
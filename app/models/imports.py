@@ -0,0 +1,32 @@
+"""Import checkpoints model"""
+
+import datetime as dt
+
+import sqlalchemy as sa
+
+from app.extensions.database import db
+
+
+class ImportCheckpoint(db.Model):
+    """Progress of a bulk import, committed together with each chunk
+
+    ``rows`` counts the rows of the source already processed (inserted or
+    rejected), an interrupted import resumes after them. ``fingerprint``
+    identifies the version of the source file the progress applies to.
+    """
+
+    __tablename__ = "import_checkpoints"
+
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    source = sa.Column(sa.String(length=1024), nullable=False, unique=True)
+    fingerprint = sa.Column(sa.String(length=64), nullable=False)
+    rows = sa.Column(sa.Integer, nullable=False, default=0)
+    inserted = sa.Column(sa.Integer, nullable=False, default=0)
+    rejected = sa.Column(sa.Integer, nullable=False, default=0)
+    completed = sa.Column(sa.Boolean, nullable=False, default=False)
+    updated_at = sa.Column(
+        sa.DateTime,
+        nullable=False,
+        default=dt.datetime.utcnow,
+        onupdate=dt.datetime.utcnow,
+    )
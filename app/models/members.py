@@ -18,3 +18,7 @@ class Member(db.Model):
     birthdate = sa.Column(sa.DateTime)
     team_id = sa.Column(UUIDType, sa.ForeignKey("teams.id"))
     team = relationship("Team", backref=backref("members"))
+    # bumped on every update, used for optimistic concurrency (If-Match)
+    version = sa.Column(sa.Integer, nullable=False, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
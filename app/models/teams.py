@@ -14,3 +14,7 @@ class Team(db.Model):
 
     id = sa.Column(UUIDType, primary_key=True, default=uuid.uuid4)
     name = sa.Column(sa.String(length=40))
+    # bumped on every update, used for optimistic concurrency (If-Match)
+    version = sa.Column(sa.Integer, nullable=False, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
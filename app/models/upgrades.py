@@ -0,0 +1,89 @@
+"""Upgrades of databases created by earlier versions of the application
+
+``db.create_all`` creates the missing tables but never alters existing ones.
+``upgrade_schema`` runs at start-up, after it, and brings existing tables up
+to date. Every step checks the schema first, so running it again is a no-op.
+"""
+from typing import List
+
+import sqlalchemy as sa
+
+from .employee_changes import EmployeeChange
+from .employees import SEARCH_INDEX_TABLE, Employee, create_search_index
+from .members import Member
+from .teams import Team
+
+# tables which gained a ``version`` column for optimistic concurrency
+VERSIONED = (Employee, Team, Member)
+
+
+def upgrade_schema(connection: sa.Connection) -> List[str]:
+    """Apply the upgrades an existing database lacks
+
+    Returns:
+        list: The upgrades applied.
+    """
+    inspector = sa.inspect(connection)
+    applied = []
+    for model in VERSIONED:
+        table = model.__tablename__
+        if not inspector.has_table(table):
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table)}
+        if "version" not in columns:
+            connection.execute(
+                sa.text(
+                    f"ALTER TABLE {table}"
+                    " ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+                )
+            )
+            applied.append(f"{table}.version")
+
+    if (
+        connection.dialect.name == "sqlite"
+        and inspector.has_table(Employee.__tablename__)
+        and not inspector.has_table(SEARCH_INDEX_TABLE)
+    ):
+        create_search_index(connection)
+        applied.append(SEARCH_INDEX_TABLE)
+
+    if _reuses_ids(connection, inspector, EmployeeChange.__table__):
+        _rebuild_table(connection, EmployeeChange.__table__)
+        applied.append(f"{EmployeeChange.__tablename__}.sequence autoincrement")
+
+    if _reuses_ids(connection, inspector, Employee.__table__):
+        _rebuild_table(connection, Employee.__table__)
+        # the triggers of the full-text index went with the old table
+        create_search_index(connection)
+        applied.append(f"{Employee.__tablename__}.id autoincrement")
+    return applied
+
+
+def _reuses_ids(connection: sa.Connection, inspector, table: sa.Table) -> bool:
+    """Whether the table is a SQLite table created without AUTOINCREMENT,
+    which hands the highest deleted id out again"""
+    table = table.name
+    if connection.dialect.name != "sqlite" or not inspector.has_table(table):
+        return False
+    ddl = connection.execute(
+        sa.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": table},
+    ).scalar()
+    return "AUTOINCREMENT" not in ddl.upper()
+
+
+def _rebuild_table(connection: sa.Connection, table: sa.Table) -> None:
+    # SQLite cannot alter a primary key: copy the rows into a new table. The
+    # DDL is executed directly so that the table is not seeded again.
+    old = f"{table.name}_old"
+    connection.execute(sa.text(f"ALTER TABLE {table.name} RENAME TO {old}"))
+    for index in table.indexes:
+        connection.execute(sa.text(f"DROP INDEX IF EXISTS {index.name}"))
+    connection.execute(sa.schema.CreateTable(table))
+    for index in table.indexes:
+        connection.execute(sa.schema.CreateIndex(index))
+    columns = ", ".join(column.name for column in table.columns)
+    connection.execute(
+        sa.text(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old}")
+    )
+    connection.execute(sa.text(f"DROP TABLE {old}"))
@@ -1,17 +1,58 @@
+import asyncio
+import gzip
 import json
 import logging
+import os
+import pstats
+import queue
+import shutil
+import threading
+import time
 from datetime import datetime
 from http import HTTPStatus as status
 
+import pandas as pd
 import pytest
+import sqlalchemy as sa
 from faker import Faker
+from flask import g
 from flask.testing import FlaskClient
 from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
 
 from app import create_app
 from app.constants import departments
+from app.extensions.admission import (
+    ConcurrencyLimit,
+    TokenBucketLimiter,
+    admission,
+)
+from app.extensions.async_reads import AsgiApplication, async_reads, async_url
+from app.extensions.compression import compression
 from app.extensions.database import db as _db
-from app.models import Employee
+from app.extensions.group_commit import group_commit
+from app.extensions.logger import (
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    RequestContextFilter,
+)
+from app.extensions.metrics import metrics
+from app.extensions.partitions import employee_partitions
+from app.extensions.profiler import DeterministicProfiler, profiler
+from app.extensions.salary_model import SalaryModel, salary_model
+from app.extensions.salary_model.training import (
+    search_salary_model,
+    train_salary_model,
+)
+from app.extensions.warmup import warmup
+from app.models import Department, Employee, EmployeeChange, MonthlyHires
+from app.models.hires import refresh_hires
+from app.models.upgrades import upgrade_schema
+from app.utils.analytics import employee_snapshot
+from app.utils.changelog import compact_changes
+from app.utils import generation, importing, snapshots
+from app.utils.departments import department_names
+from app.utils.salary_index import salary_index
 
 fake = Faker()
 logger = logging.getLogger(__name__)
@@ -42,6 +83,9 @@ def client(app) -> FlaskClient:
 def session(app, db):
     with app.app_context():
         db.create_all()
+        salary_index.invalidate()
+        department_names.invalidate()
+        employee_snapshot.invalidate()
         yield db.session
         db.drop_all()
 
@@ -58,6 +102,90 @@ def create_employee(session: Session) -> Employee:
     return employee
 
 
+class TestSchemaUpgrade:
+    def test_upgrades_baseline_database(self, tmp_path):
+        engine = sa.create_engine(f"sqlite:///{tmp_path}/old.db")
+        with engine.begin() as connection:
+            # the tables as created before the version column existed
+            connection.exec_driver_sql(
+                "CREATE TABLE employees (id INTEGER PRIMARY KEY, name VARCHAR(50)"
+                " NOT NULL, department VARCHAR(50) NOT NULL, salary FLOAT NOT NULL,"
+                " hire_date DATETIME NOT NULL)"
+            )
+            connection.exec_driver_sql(
+                "INSERT INTO employees VALUES (1, 'Ada', 'Engineering', 10, '2021-01-01')"
+            )
+            connection.exec_driver_sql(
+                "CREATE TABLE teams (id CHAR(32) PRIMARY KEY, name VARCHAR(40))"
+            )
+            _db.metadata.create_all(connection)
+            assert sorted(upgrade_schema(connection)) == [
+                "employees.id autoincrement",
+                "employees.version",
+                "employees_fts",
+                "teams.version",
+            ]
+            assert upgrade_schema(connection) == []
+
+        with engine.connect() as connection:
+            employee = connection.execute(sa.select(Employee.__table__)).one()
+            assert employee.version == 1
+            assert connection.exec_driver_sql(
+                "SELECT rowid FROM employees_fts WHERE employees_fts MATCH 'ada'"
+            ).all() == [(1,)]
+            # the index follows the rebuilt table, whose ids are never reused
+            connection.execute(sa.delete(Employee.__table__))
+            employee_id = connection.execute(
+                sa.insert(Employee.__table__).values(
+                    name="Grace",
+                    department="Engineering",
+                    salary=10,
+                    hire_date=datetime(2021, 1, 1),
+                )
+            ).inserted_primary_key[0]
+            assert employee_id == 2
+            assert connection.exec_driver_sql(
+                "SELECT rowid FROM employees_fts WHERE employees_fts MATCH 'grace'"
+            ).all() == [(2,)]
+        engine.dispose()
+
+    def test_rebuilds_change_log_reusing_sequences(self, tmp_path):
+        engine = sa.create_engine(f"sqlite:///{tmp_path}/old.db")
+        with engine.begin() as connection:
+            _db.metadata.create_all(connection)
+            connection.exec_driver_sql("DROP TABLE employee_changes")
+            connection.exec_driver_sql(
+                "CREATE TABLE employee_changes (sequence INTEGER PRIMARY KEY,"
+                " employee_id INTEGER NOT NULL, operation VARCHAR(6) NOT NULL,"
+                " changed_at DATETIME NOT NULL)"
+            )
+            now = datetime.now()
+            connection.execute(
+                sa.insert(EmployeeChange),
+                [
+                    {"employee_id": i, "operation": "insert", "changed_at": now}
+                    for i in (1, 2, 3)
+                ],
+            )
+            assert upgrade_schema(connection) == [
+                "employee_changes.sequence autoincrement"
+            ]
+            assert upgrade_schema(connection) == []
+
+            connection.execute(
+                sa.delete(EmployeeChange).where(EmployeeChange.sequence == 3)
+            )
+            sequence = connection.execute(
+                sa.insert(EmployeeChange).values(
+                    employee_id=3, operation="update", changed_at=now
+                )
+            ).inserted_primary_key[0]
+            assert sequence == 4
+            indexes = sa.inspect(connection).get_indexes("employee_changes")
+            assert "ix_employee_changes_employee_id" in {i["name"] for i in indexes}
+        engine.dispose()
+
+
 class TestEmployeeEndpoint:
     def test_get_employees(self, client, session):
         employees = [create_employee(session) for i in range(5)]
@@ -65,6 +193,26 @@ class TestEmployeeEndpoint:
         assert response.status_code == status.OK
         assert len(response.json["data"]) == len(employees)
 
+    def test_get_employees_sparse_fieldset(self, client, session):
+        employees = [create_employee(session) for i in range(3)]
+        response = client.get("/employees/?fields=id,salary&per_page=2")
+        assert response.status_code == status.OK
+        assert response.json["data"] == [
+            {"id": e.id, "salary": e.salary} for e in employees[:2]
+        ]
+        assert response.json["pagination"]["per_page"] == 2
+        assert "fields=id%2Csalary" in response.json["pagination"]["next_url"]
+
+        response = client.get("/top_earners/?fields=name")
+        top_earner = max(employees, key=lambda e: e.salary)
+        assert response.json["data"][0] == {"name": top_earner.name}
+
+    def test_get_employees_invalid_list_arguments(self, client, session):
+        response = client.get("/employees/?fields=id,password")
+        assert response.status_code == status.UNPROCESSABLE_ENTITY
+        response = client.get("/employees/?per_page=100000")
+        assert response.status_code == status.UNPROCESSABLE_ENTITY
+
     def test_post_employee(self, client, session):
         data = {
             "name": fake.name(),
@@ -74,7 +222,7 @@ class TestEmployeeEndpoint:
                 start_date="-10y", end_date="now"
             ).strftime("%Y-%m-%d %H:%M:%S"),
         }
-        response = client.post("/employees/", json=data, headers={"If-Match": None})
+        response = client.post("/employees/", json=data)
         assert response.status_code == status.CREATED
         assert response.json["name"] == data["name"]
 
@@ -94,18 +242,291 @@ class TestEmployeeEndpoint:
                 start_date="-10y", end_date="now"
             ).strftime("%Y-%m-%d %H:%M:%S"),
         }
-        response = client.put(f"/employees/{employee.id}", json=data, headers={"If-Match": None})
+        response = client.put(
+            f"/employees/{employee.id}", json=data, headers={"If-Match": '"1"'}
+        )
         assert response.status_code == status.OK
         assert response.json["name"] == data["name"]
 
+    def test_patch_employee(self, client, session):
+        employee = create_employee(session)
+        name, hire_date = employee.name, employee.hire_date
+        response = client.patch(
+            f"/employees/{employee.id}",
+            json={"salary": 123456},
+            headers={"If-Match": '"1"'},
+        )
+        assert response.status_code == status.OK
+        assert response.json["salary"] == 123456
+        assert response.json["name"] == name
+        assert response.json["version"] == 2
+        assert response.headers["ETag"] == '"2"'
+
+        session.expire_all()
+        assert employee.hire_date == hire_date
+
+    def test_patch_employee_if_match(self, client, session):
+        employee = create_employee(session)
+        response = client.patch(
+            f"/employees/{employee.id}", json={"name": "A"}, headers={"If-Match": '"1"'}
+        )
+        assert response.status_code == status.OK
+        response = client.patch(
+            f"/employees/{employee.id}", json={"name": "B"}, headers={"If-Match": '"1"'}
+        )
+        assert response.status_code == status.PRECONDITION_FAILED
+        response = client.patch(
+            f"/employees/{employee.id}", json={"name": "B"}, headers={"If-Match": "*"}
+        )
+        assert response.status_code == status.OK
+        assert response.headers["ETag"] == '"3"'
+        response = client.patch(
+            "/employees/0", json={"name": "B"}, headers={"If-Match": '"1"'}
+        )
+        assert response.status_code == status.NOT_FOUND
+
+    def test_unknown_department_is_rejected(self, client, session):
+        employee = create_employee(session)
+        data = {
+            "name": "Jane Doe",
+            "department": "Bogus",
+            "salary": 1000,
+            "hire_date": "2022-01-01 00:00:00",
+        }
+        response = client.post("/employees/", json=data)
+        assert response.status_code == status.UNPROCESSABLE_ENTITY
+        headers = {"If-Match": '"1"'}
+        response = client.put(f"/employees/{employee.id}", json=data, headers=headers)
+        assert response.status_code == status.UNPROCESSABLE_ENTITY
+        response = client.patch(
+            f"/employees/{employee.id}", json={"department": "Bogus"}, headers=headers
+        )
+        assert response.status_code == status.UNPROCESSABLE_ENTITY
+        assert Employee.query.filter_by(department="Bogus").count() == 0
+
+    def test_item_etags_are_versions(self, client, session):
+        employee = create_employee(session)
+        response = client.get(f"/employees/{employee.id}")
+        etag = response.headers["ETag"]
+        assert etag == '"1"'
+        response = client.get(
+            f"/employees/{employee.id}", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == status.NOT_MODIFIED
+
+        # the ETag of a read is accepted by every write, and required
+        response = client.patch(f"/employees/{employee.id}", json={"name": "A"})
+        assert response.status_code == status.PRECONDITION_REQUIRED
+        response = client.patch(
+            f"/employees/{employee.id}", json={"name": "A"}, headers={"If-Match": etag}
+        )
+        assert response.status_code == status.OK
+        etag = response.headers["ETag"]
+        data = {key: response.json[key] for key in ("name", "department", "salary")}
+        data["hire_date"] = response.json["hire_date"]
+        data["name"] = "B"
+        response = client.put(
+            f"/employees/{employee.id}", json=data, headers={"If-Match": '"1"'}
+        )
+        assert response.status_code == status.PRECONDITION_FAILED
+        response = client.put(
+            f"/employees/{employee.id}", json=data, headers={"If-Match": etag}
+        )
+        assert response.status_code == status.OK
+        etag = response.headers["ETag"]
+        assert etag == '"3"'
+        response = client.delete(f"/employees/{employee.id}")
+        assert response.status_code == status.PRECONDITION_REQUIRED
+        response = client.delete(
+            f"/employees/{employee.id}", headers={"If-Match": etag}
+        )
+        assert response.status_code == status.NO_CONTENT
+
+    def test_deleted_employee_ids_are_not_reused(self, client, session):
+        employee = create_employee(session)
+        employee_id = employee.id
+        data = {
+            "name": "Ada",
+            "department": employee.department,
+            "salary": 1000,
+            "hire_date": "2021-01-01T00:00:00",
+        }
+        response = client.delete(
+            f"/employees/{employee_id}", headers={"If-Match": '"1"'}
+        )
+        assert response.status_code == status.NO_CONTENT
+
+        # the new employee starts at version 1 as well: the ETags of the
+        # deleted one must not match it
+        response = client.post("/employees/", json=data)
+        assert response.status_code == status.CREATED
+        assert response.json["id"] != employee_id
+        response = client.get(
+            f"/employees/{employee_id}", headers={"If-None-Match": '"1"'}
+        )
+        assert response.status_code == status.NOT_FOUND
+        response = client.delete(
+            f"/employees/{employee_id}", headers={"If-Match": '"1"'}
+        )
+        assert response.status_code == status.NOT_FOUND
+
+    def test_team_etags_are_versions(self, client, session):
+        response = client.post("/teams/", json={"name": "Core"})
+        team_id, etag = response.json["id"], response.headers["ETag"]
+        assert etag == '"1"'
+        assert client.get(f"/teams/{team_id}").headers["ETag"] == etag
+        response = client.patch(
+            f"/teams/{team_id}", json={"name": "Platform"}, headers={"If-Match": etag}
+        )
+        assert response.status_code == status.OK
+        etag = response.headers["ETag"]
+        response = client.put(
+            f"/teams/{team_id}", json={"name": "Infra"}, headers={"If-Match": etag}
+        )
+        assert response.headers["ETag"] == '"3"'
+        response = client.delete(f"/teams/{team_id}", headers={"If-Match": etag})
+        assert response.status_code == status.PRECONDITION_FAILED
+        response = client.delete(f"/teams/{team_id}", headers={"If-Match": '"3"'})
+        assert response.status_code == status.NO_CONTENT
+
     def test_delete_employee(self, client, session):
         employee = create_employee(session)
-        response = client.delete(f"/employees/{employee.id}", headers={"If-Match": None})
+        response = client.delete(
+            f"/employees/{employee.id}", headers={"If-Match": '"1"'}
+        )
         assert response.status_code == status.NO_CONTENT
         assert response.data == b""
         assert session.query(Employee).get(employee.id) is None
 
 
+    def test_bulk_update_employees(self, client, session):
+        employees = [create_employee(session) for i in range(4)]
+        for employee in employees:
+            employee.department, employee.salary = "Sales", 50000
+        employees[0].department = "Legal"
+        session.commit()
+        client.get("/salary_distribution/Sales")
+
+        data = {
+            "filter": {"department": "Sales"},
+            "update": {"salary_multiplier": 1.5, "department": "Finance"},
+        }
+        response = client.patch("/employees/bulk", json=data)
+        assert response.status_code == status.OK
+        assert response.json["affected"] == 3
+
+        session.expire_all()
+        assert Employee.query.filter_by(department="Finance").count() == 3
+        assert {e.salary for e in employees[1:]} == {75000}
+        assert employees[0].salary == 50000
+        response = client.get("/salary_distribution/Sales")
+        assert response.json["count"] == 0
+
+    def test_bulk_delete_employees(self, client, session):
+        employees = [create_employee(session) for i in range(4)]
+        ids = [e.id for e in employees[:2]]
+        response = client.delete("/employees/bulk", json={"filter": {"ids": ids}})
+        assert response.status_code == status.OK
+        assert response.json["affected"] == 2
+        assert Employee.query.count() == 2
+
+    def test_bulk_delete_requires_filter(self, client, session):
+        response = client.delete("/employees/bulk", json={"filter": {}})
+        assert response.status_code == status.UNPROCESSABLE_ENTITY
+
+    def test_get_employee_changes(self, client, session):
+        headers = {"If-Match": '"1"'}
+        data = {
+            "name": fake.name(),
+            "department": "Sales",
+            "hire_date": "2022-01-01 00:00:00",
+        }
+        ids = [client.post("/employees/", json=data).json["id"] for i in range(3)]
+        client.patch(f"/employees/{ids[0]}", json={"salary": 1000}, headers=headers)
+        client.delete(f"/employees/{ids[1]}", headers=headers)
+
+        response = client.get("/employees/changes?since=0&limit=2")
+        assert response.status_code == status.OK
+        assert response.json["has_more"]
+        changes = response.json["data"]
+        assert [(c["operation"], c["employee_id"]) for c in changes] == [
+            ("insert", ids[2]),
+            ("update", ids[0]),
+        ]
+        assert changes[1]["employee"]["salary"] == 1000
+
+        since = response.json["next_since"]
+        response = client.get(f"/employees/changes?since={since}")
+        assert not response.json["has_more"]
+        changes = response.json["data"]
+        assert [(c["operation"], c["employee_id"]) for c in changes] == [
+            ("delete", ids[1]),
+        ]
+        assert changes[0]["employee"] is None
+
+        response = client.get(f"/employees/changes?since={response.json['next_since']}")
+        assert response.json["data"] == []
+
+    def test_changes_of_the_latest_changed_employee(self, client, session):
+        # with compaction, the previous change of the employee is deleted
+        # before the new one is recorded: sequences must not be reused
+        employee_id = create_employee(session).id
+        for version in (1, 2):
+            response = client.patch(
+                f"/employees/{employee_id}",
+                json={"salary": 1000 * version},
+                headers={"If-Match": f'"{version}"'},
+            )
+            assert response.status_code == status.OK
+            if version == 1:
+                changes = client.get("/employees/changes?since=0").json
+                since = changes["next_since"]
+
+        changes = client.get(f"/employees/changes?since={since}").json["data"]
+        assert [(c["operation"], c["employee_id"]) for c in changes] == [
+            ("update", employee_id)
+        ]
+        assert changes[0]["employee"]["salary"] == 2000
+        assert changes[0]["sequence"] > since
+
+        client.delete(f"/employees/{employee_id}", headers={"If-Match": '"3"'})
+        compact_changes(retention_days=0)
+        data = {"name": "Ada", "department": "Sales", "hire_date": "2022-01-01 00:00:00"}
+        employee_id = client.post("/employees/", json=data).json["id"]
+        changes = client.get(f"/employees/changes?since={since}").json["data"]
+        assert [(c["operation"], c["employee_id"]) for c in changes] == [
+            ("insert", employee_id)
+        ]
+
+    def test_search_employees(self, client, session):
+        for name in ("Ada Lovelace", "Adam Smith", "Grace Hopper", "Alan Turing"):
+            create_employee(session).name = name
+        session.commit()
+
+        response = client.get("/employees/search?q=ad")
+        assert response.status_code == status.OK
+        names = {e["name"] for e in response.json["data"]}
+        assert names == {"Ada Lovelace", "Adam Smith"}
+
+        response = client.get("/employees/search?q=ada love")
+        assert [e["name"] for e in response.json["data"]] == ["Ada Lovelace"]
+
+        # the index follows updates and deletes
+        employee = Employee.query.filter_by(name="Grace Hopper").one()
+        employee.name = "Grace Adams"
+        session.commit()
+        session.delete(Employee.query.filter_by(name="Adam Smith").one())
+        session.commit()
+        response = client.get("/employees/search?q=ada")
+        names = {e["name"] for e in response.json["data"]}
+        assert names == {"Ada Lovelace", "Grace Adams"}
+        assert "q=ada" in response.json["pagination"]["current_url"]
+
+    def test_search_employees_requires_query(self, client, session):
+        response = client.get("/employees/search")
+        assert response.status_code == status.UNPROCESSABLE_ENTITY
+
+
 class TestDepartmentEndpoint:
     def test_get_departments(self, client, session):
         employees = [create_employee(session) for i in range(5)]
@@ -124,6 +545,57 @@ class TestDepartmentEndpoint:
         assert response.status_code == status.OK
         assert len(response.json["data"]) == len(employees)
 
+    def test_department_headcounts(self, client, session):
+        employees = [create_employee(session) for i in range(5)]
+        moved = employees[0]
+        target = next(d for d in departments if d != moved.department)
+        response = client.patch(
+            f"/employees/{moved.id}",
+            json={"department": target},
+            headers={"If-Match": '"1"'},
+        )
+        assert response.status_code == status.OK
+        response = client.delete(
+            "/employees/bulk", json={"filter": {"ids": [employees[1].id]}}
+        )
+        assert response.status_code == status.OK
+
+        session.expire_all()
+        expected = {}
+        for employee in Employee.query:
+            expected[employee.department] = expected.get(employee.department, 0) + 1
+        response = client.get("/departments/")
+        assert response.status_code == status.OK
+        assert {d["name"]: d["headcount"] for d in response.json["data"]} == expected
+
+    def test_create_department(self, client, session):
+        response = client.get("/departments/Robotics")
+        assert response.status_code == status.BAD_REQUEST
+        response = client.post("/departments/", json={"name": "Robotics"})
+        assert response.status_code == status.CREATED
+        assert response.json == {"name": "Robotics", "headcount": 0}
+        response = client.post("/departments/", json={"name": "Robotics"})
+        assert response.status_code == status.CONFLICT
+        # listed once it has employees, or when asking for empty ones
+        response = client.get("/departments/")
+        assert "Robotics" not in {d["name"] for d in response.json["data"]}
+        response = client.get("/departments/?include_empty=true")
+        assert {"name": "Robotics", "headcount": 0} in response.json["data"]
+
+        response = client.post(
+            "/employees/",
+            json={
+                "name": fake.name(),
+                "hire_date": "2020-01-01T00:00:00",
+                "salary": 50000,
+                "department": "Robotics",
+            },
+        )
+        assert response.status_code == status.CREATED
+        assert session.scalar(
+            _db.select(Department.headcount).filter_by(name="Robotics")
+        ) == 1
+
 
 class TestStatisticalEndpoint:
     def test_get_average_salary_by_department(self, client, session):
@@ -139,6 +611,88 @@ class TestStatisticalEndpoint:
         data_2 = sum(e.salary for e in employees) / len(employees) if employees else 0
         assert data_1 == data_2
 
+    def test_get_salary_distribution(self, client, session):
+        department = "Engineering"
+        for salary in (40000, 50000, 60000, 70000):
+            employee = create_employee(session)
+            employee.department, employee.salary = department, salary
+            session.commit()
+        response = client.get(f"/salary_distribution/{department}")
+        assert response.status_code == status.OK
+        assert response.json["count"] == 4
+
+        # write handlers keep the index up to date
+        employee = Employee.query.filter_by(department=department).first()
+        client.delete(
+            f"/employees/{employee.id}",
+            headers={"If-Match": f'"{employee.version}"'},
+        )
+        response = client.get(f"/salary_distribution/{department}")
+        salaries = sorted(
+            e.salary for e in Employee.query.filter_by(department=department)
+        )
+        assert response.json["count"] == 3
+        assert response.json["percentiles"]["p50"] == salaries[1]
+        assert sum(b["count"] for b in response.json["histogram"]) == 3
+        assert response.json["histogram"][0]["lower"] == salaries[0]
+        assert response.json["histogram"][-1]["upper"] == salaries[-1]
+
+    def test_salary_distribution_reads_the_index_once(
+        self, client, session, monkeypatch
+    ):
+        employee = create_employee(session)
+        get, calls = salary_index.get, []
+
+        def counting_get(department):
+            calls.append(department)
+            return get(department)
+
+        monkeypatch.setattr(salary_index, "get", counting_get)
+        response = client.get(f"/salary_distribution/{employee.department}")
+        assert response.status_code == status.OK
+        assert response.json["count"] == 1
+        assert sum(b["count"] for b in response.json["histogram"]) == 1
+        assert calls == [employee.department]
+
+    def test_salary_distribution_sees_other_writers(self, client, session):
+        employee = create_employee(session)
+        employee_id, department = employee.id, employee.department
+        response = client.get(f"/salary_distribution/{department}")
+        assert response.json["count"] == 1
+        builds = salary_index.builds
+
+        # the handlers of this process apply their writes to the index
+        data = {
+            "name": "Jane Doe",
+            "department": department,
+            "salary": 1000,
+            "hire_date": "2022-01-01 00:00:00",
+        }
+        response = client.post("/employees/", json=data)
+        assert response.status_code == status.CREATED
+        response = client.get(f"/salary_distribution/{department}")
+        assert response.json["count"] == 2
+        assert salary_index.builds == builds
+
+        # a write of another process only shows up in the change log
+        session.commit()
+        with _db.engine.begin() as connection:
+            connection.execute(
+                sa.update(Employee)
+                .where(Employee.id == employee_id)
+                .values(salary=10**9)
+            )
+            connection.execute(
+                sa.insert(EmployeeChange).values(
+                    employee_id=employee_id,
+                    operation=EmployeeChange.UPDATE,
+                    changed_at=datetime.utcnow(),
+                )
+            )
+        response = client.get(f"/salary_distribution/{department}")
+        assert response.json["histogram"][-1]["upper"] == 10**9
+        assert salary_index.builds == builds + 1
+
     def test_get_top_earners(self, client, session):
         employees = [create_employee(session) for i in range(5)]
         response = client.get("/top_earners/")
@@ -168,6 +722,1244 @@ class TestStatisticalEndpoint:
         assert "data" in data
         assert isinstance(data["data"], float)
 
+    def test_predict_salary_unknown_department(self, client, session):
+        data = {
+            "name": "John Doe",
+            "department": "Bogus",
+            "salary": 1000,
+            "hire_date": "2023-01-01 00:00:00",
+        }
+        response = client.post("/predict_salary/", json=data)
+        assert response.status_code == status.UNPROCESSABLE_ENTITY
+
+    def test_predict_salary_new_department(self, client, session):
+        response = client.post("/departments/", json={"name": "Robotics"})
+        assert response.status_code == status.CREATED
+        data = {
+            "name": "John Doe",
+            "department": "Robotics",
+            "salary": 1000,
+            "hire_date": "2023-01-01 00:00:00",
+        }
+        # a valid department, but the model was not trained with it
+        response = client.post("/predict_salary/", json=data)
+        assert response.status_code == status.UNPROCESSABLE_ENTITY
+        assert "Robotics" in response.json["message"]
+
+    def test_predict_salary_is_memoized(self, client, session):
+        data = {
+            "name": "John Doe",
+            "department": "Marketing",
+            "hire_date": datetime(2021, 6, 1, 9, 30).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        first = client.post("/predict_salary/", json=data)
+        before = client.get("/predict_salary/stats").json
+
+        data["hire_date"] = datetime(2021, 6, 1, 17, 0).strftime("%Y-%m-%d %H:%M:%S")
+        second = client.post("/predict_salary/", json=data)
+        after = client.get("/predict_salary/stats").json
+
+        assert first.json["data"] == second.json["data"]
+        assert after["hits"] == before["hits"] + 1
+        assert after["misses"] == before["misses"]
+        assert 0.0 < after["hit_rate"] <= 1.0
+
+    def test_predict_salary_cache_invalidated_on_model_change(self, app, tmp_path):
+        model_path = tmp_path / "model.pkl"
+        shutil.copy(app.config["SALARY_MODEL_PATH"], model_path)
+        model = SalaryModel()
+        model.path, model.check_interval = str(model_path), 0
+
+        model.predict("Sales", datetime(2022, 1, 1))
+        assert len(model.cache) == 1
+
+        model_path.write_bytes(model_path.read_bytes())
+        os.utime(model_path, ns=(0, 0))
+        model.predict("Sales", datetime(2022, 1, 1))
+        assert model.stats()["model_reloads"] == 2
+        assert len(model.cache) == 1
+
+
+
+def wait_for_job(client, job_id: str) -> dict:
+    for _ in range(200):
+        job = client.get(f"/jobs/{job_id}").json
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.05)
+    raise TimeoutError(job_id)
+
+
+class TestAnalyticsSnapshot:
+    @pytest.fixture
+    def snapshot(self, app):
+        app.config["ANALYTICS_SNAPSHOT_ENABLED"] = True
+        yield employee_snapshot
+        app.config["ANALYTICS_SNAPSHOT_ENABLED"] = False
+
+    def get_all(self, client, app, url):
+        data = {}
+        for enabled in (False, True):
+            app.config["ANALYTICS_SNAPSHOT_ENABLED"] = enabled
+            response = client.get(url)
+            assert response.status_code == status.OK
+            data[enabled] = response.json["data"]
+        return data
+
+    def test_snapshot_matches_sql(self, app, client, session, snapshot):
+        employees = [create_employee(session) for i in range(20)]
+        department = employees[0].department
+        for url in ("/top_earners/", "/most_recent_hires/"):
+            data = self.get_all(client, app, url)
+            assert [e["id"] for e in data[True]] == [e["id"] for e in data[False]]
+        data = self.get_all(client, app, f"/average_salary/{department}")
+        assert data[True] == pytest.approx(data[False])
+
+    def test_snapshot_refreshes_from_change_log(self, client, session, snapshot):
+        employees = [create_employee(session) for i in range(5)]
+        response = client.get("/top_earners/")
+        assert response.status_code == status.OK
+        builds = snapshot.builds
+
+        top = max(employees, key=lambda e: e.salary)
+        first_id, deleted_id = employees[0].id, employees[1].id
+        response = client.patch(
+            f"/employees/{first_id}",
+            json={"salary": top.salary + 1},
+            headers={"If-Match": '"1"'},
+        )
+        assert response.status_code == status.OK
+        response = client.delete(
+            "/employees/bulk", json={"filter": {"ids": [deleted_id]}}
+        )
+        assert response.status_code == status.OK
+
+        response = client.get("/top_earners/")
+        ids = [e["id"] for e in response.json["data"]]
+        assert ids[0] == first_id
+        assert deleted_id not in ids
+        assert snapshot.builds == builds
+
+        response = client.get("/analytics/stats")
+        assert response.status_code == status.OK
+        assert response.json["rows"] == 4
+        assert response.json["bytes"] == 4 * response.json["bytes_per_row"]
+
+    def test_snapshot_sees_repeated_edits(self, app, client, session, snapshot):
+        employee = create_employee(session)
+        employee_id, department = employee.id, employee.department
+        url = f"/average_salary/{department}"
+        # each update of the same employee compacts its previous change away
+        for version, salary in enumerate((150, 2550, 4000), start=1):
+            response = client.patch(
+                f"/employees/{employee_id}",
+                json={"salary": salary},
+                headers={"If-Match": f'"{version}"'},
+            )
+            assert response.status_code == status.OK
+            data = self.get_all(client, app, url)
+            assert data[True] == data[False] == salary
+
+
+class TestAdmissionControl:
+    def test_concurrency_limit_sheds_load(self, client, session, monkeypatch):
+        limit = ConcurrencyLimit(concurrency=1, queue_timeout=0.01)
+        monkeypatch.setitem(admission.limits, "aggregate", limit)
+        assert limit.acquire()
+        try:
+            response = client.get("/average_salary/Engineering")
+            assert response.status_code == status.SERVICE_UNAVAILABLE
+            assert response.headers["Retry-After"] == "1"
+            # other endpoint classes are not affected
+            response = client.get("/employees/")
+            assert response.status_code == status.OK
+        finally:
+            limit.release()
+        response = client.get("/average_salary/Engineering")
+        assert response.status_code == status.OK
+        assert limit.in_flight == 0
+
+        response = client.get("/metrics")
+        assert response.status_code == status.OK
+        assert (
+            'admission_rejected_total{endpoint_class="aggregate",reason="concurrency"}'
+            in response.text
+        )
+        assert 'admission_queue_seconds_count{endpoint_class="aggregate"}' in (
+            response.text
+        )
+
+    def test_rate_limit_per_client(self, client, session, monkeypatch):
+        monkeypatch.setattr(
+            admission, "rate_limiter", TokenBucketLimiter(rate=0.1, burst=2)
+        )
+        headers = {"X-API-Key": "client-1"}
+        for i in range(2):
+            assert client.get("/employees/", headers=headers).status_code == status.OK
+        response = client.get("/employees/", headers=headers)
+        assert response.status_code == status.TOO_MANY_REQUESTS
+        assert int(response.headers["Retry-After"]) >= 1
+        response = client.get("/employees/", headers={"X-API-Key": "client-2"})
+        assert response.status_code == status.OK
+
+
+class TestLogging:
+    def test_request_id_header(self, client, session):
+        response = client.get("/employees/")
+        assert len(response.headers["X-Request-ID"]) == 32
+        response = client.get("/employees/", headers={"X-Request-ID": "abc-123"})
+        assert response.headers["X-Request-ID"] == "abc-123"
+
+    def test_json_records_carry_request_fields(self, app):
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+        handler.addFilter(RequestContextFilter())
+        with app.test_request_context("/employees/"):
+            g.request_id, g.request_started = "abc-123", time.perf_counter()
+            record = logging.LogRecord(
+                "app", logging.INFO, __file__, 1, "salary: %s", ({"a": 1},), None
+            )
+            handler.handle(record)
+        prepared = handler.queue.get_nowait()
+        entry = json.loads(JsonFormatter().format(prepared))
+        assert entry["message"] == "salary: {'a': 1}"
+        assert entry["request_id"] == "abc-123"
+        assert entry["elapsed_ms"] >= 0
+
+        # a full queue drops records instead of blocking the request
+        handler.handle(record)
+        handler.handle(record)
+        assert handler.dropped == 1
+
+
+class TestProfiler:
+    @pytest.fixture
+    def profiling(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(profiler, "enabled", True)
+        monkeypatch.setattr(profiler, "secret", "s3cret")
+        monkeypatch.setattr(profiler, "directory", str(tmp_path))
+        return tmp_path
+
+    def test_profile_with_secret_header(self, client, session, profiling):
+        create_employee(session)
+        response = client.get("/employees/", headers={"X-Profile": "wrong"})
+        assert "X-Profile-Id" not in response.headers
+
+        response = client.get("/employees/", headers={"X-Profile": "s3cret"})
+        assert response.status_code == status.OK
+        base = profiling / response.headers["X-Profile-Id"]
+        stats = pstats.Stats(str(base) + ".pstats")
+        assert stats.total_calls > 0
+        with open(str(base) + ".sql.json") as f:
+            sql = json.load(f)
+        assert sql["status"] == status.OK
+        assert any("FROM employees" in s["statement"] for s in sql["statements"])
+
+    def test_profile_id_ignores_unsafe_request_ids(self, client, session, profiling):
+        headers = {"X-Profile": "s3cret", "X-Request-ID": "../a/b"}
+        response = client.get("/employees/", headers=headers)
+        assert response.status_code == status.OK
+        profile_id = response.headers["X-Profile-Id"]
+        assert profile_id.endswith("-.._a_b")
+        assert (profiling / f"{profile_id}.sql.json").exists()
+
+    def test_profiler_is_released_without_finish(self, app, profiling):
+        headers = {"X-Profile": "s3cret", "X-Profile-Mode": "cprofile"}
+        with app.test_request_context(headers=headers):
+            profiler.start()
+            assert DeterministicProfiler._lock.locked()
+            # the request ends without its after_request hooks
+            profiler.discard()
+        assert not DeterministicProfiler._lock.locked()
+
+    def test_sampled_profiles(self, client, session, profiling, monkeypatch):
+        monkeypatch.setattr(profiler, "sample_rate", 1.0)
+        monkeypatch.setattr(profiler, "sample_interval", 0.0001)
+        response = client.get("/employees/")
+        assert response.status_code == status.OK
+        base = profiling / response.headers["X-Profile-Id"]
+        with open(str(base) + ".collapsed") as f:
+            lines = f.read().splitlines()
+        assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in lines)
+
+
+class TestImportEmployees:
+    def write_csv(self, path, rows):
+        lines = ["name,department,salary,hire_date"]
+        lines += [",".join(str(value) for value in row) for row in rows]
+        path.write_text("\n".join(lines) + "\n")
+
+    def test_import_csv_skips_invalid_rows(self, app, session, tmp_path):
+        path = tmp_path / "employees.csv"
+        self.write_csv(
+            path,
+            [
+                ("Ada", "Engineering", 120000, "2020-01-02"),
+                ("Bob", "Nowhere", 50000, "2020-01-02"),
+                ("Cy", "Sales", -1, "2020-01-02"),
+                ("Di", "Sales", 60000, "not a date"),
+                ("Ed", "Sales", 60000, "2021-03-04T05:06:07"),
+            ],
+        )
+        result = app.test_cli_runner().invoke(
+            args=["import-employees", str(path), "--chunk-size", "2"]
+        )
+        assert result.exit_code == 0, result.output
+        assert "Imported 2 employees, rejected 3 rows" in result.output
+        assert sorted(e.name for e in Employee.query) == ["Ada", "Ed"]
+        rejects = (tmp_path / "employees.csv.rejects.csv").read_text()
+        assert "unknown department" in rejects
+        assert "salary out of bounds" in rejects
+        assert "invalid hire_date" in rejects
+        headcount = session.scalar(
+            _db.select(Department.headcount).filter_by(name="Sales")
+        )
+        assert headcount == 1
+
+        result = app.test_cli_runner().invoke(args=["import-employees", str(path)])
+        assert "already imported" in result.output
+        assert Employee.query.count() == 2
+
+    def test_import_resumes_after_failure(self, app, session, tmp_path, monkeypatch):
+        path = tmp_path / "employees.ndjson"
+        path.write_text(
+            "\n".join(
+                json.dumps(
+                    {
+                        "name": f"Employee {i}",
+                        "department": "Marketing",
+                        "salary": 40000 + i,
+                        "hire_date": "2019-05-06",
+                    }
+                )
+                for i in range(10)
+            )
+        )
+        insert, calls = importing._insert, []
+
+        def failing_insert(frame):
+            calls.append(len(frame))
+            if len(calls) == 3:
+                raise RuntimeError("connection lost")
+            return insert(frame)
+
+        monkeypatch.setattr(importing, "_insert", failing_insert)
+        with pytest.raises(RuntimeError):
+            importing.import_employees(str(path), chunk_size=3)
+        session.rollback()
+        assert Employee.query.count() == 6
+
+        monkeypatch.setattr(importing, "_insert", insert)
+        result = importing.import_employees(str(path), chunk_size=4)
+        assert result["skipped"] == 6
+        assert result["inserted"] == 4
+        names = sorted(e.name for e in Employee.query)
+        assert names == sorted(f"Employee {i}" for i in range(10))
+
+    def test_import_parquet(self, session, tmp_path):
+        pd = pytest.importorskip("pandas")
+        pytest.importorskip("pyarrow")
+        path = tmp_path / "employees.parquet"
+        pd.DataFrame(
+            {
+                "name": ["Ada", "Bob"],
+                "department": ["Engineering", "Sales"],
+                "salary": [100000.0, 90000.0],
+                "hire_date": pd.to_datetime(["2020-01-01", "2021-01-01"]),
+            }
+        ).to_parquet(path)
+        result = importing.import_employees(str(path))
+        assert result["inserted"] == 2
+        assert Employee.query.count() == 2
+
+    def test_resumed_import_writes_rejects_once(self, session, tmp_path, monkeypatch):
+        path = tmp_path / "employees.csv"
+        self.write_csv(
+            path,
+            [
+                (f"Employee {i}", "Nowhere" if i % 2 else "Sales", 50000, "2020-01-02")
+                for i in range(6)
+            ],
+        )
+        commit, calls = _db.session.commit, []
+
+        def failing_commit():
+            calls.append(1)
+            # the first commit is the checkpoint, then one per chunk
+            if len(calls) == 3:
+                raise RuntimeError("connection lost")
+            return commit()
+
+        monkeypatch.setattr(_db.session, "commit", failing_commit)
+        with pytest.raises(RuntimeError):
+            importing.import_employees(str(path), chunk_size=2)
+        monkeypatch.undo()
+        session.rollback()
+
+        result = importing.import_employees(str(path), chunk_size=2)
+        assert result["skipped"] == 2
+        assert result["rejected"] == 2
+        rejects = pd.read_csv(tmp_path / "employees.csv.rejects.csv")
+        assert list(rejects["row"]) == [1, 3, 5]
+        assert set(rejects["reason"]) == {"unknown department"}
+
+    def test_import_parquet_missing_columns(self, session, tmp_path):
+        pytest.importorskip("pyarrow")
+        path = tmp_path / "employees.parquet"
+        pd.DataFrame({"name": ["Ada"], "salary": [100000.0]}).to_parquet(path)
+        with pytest.raises(importing.ImportFailed, match="department, hire_date"):
+            importing.import_employees(str(path))
+
+
+class TestPartitionedStorage:
+    @pytest.fixture
+    def partitions(self, tmp_path):
+        engines = [
+            sa.create_engine(f"sqlite:///{tmp_path}/employees_{i}.db") for i in range(3)
+        ]
+        employee_partitions.setup(engines)
+        yield employee_partitions
+        employee_partitions.setup([])
+        for engine in engines:
+            engine.dispose()
+
+    def create(self, client, department, salary, hire_date):
+        response = client.post(
+            "/employees/",
+            json={
+                "name": fake.name(),
+                "department": department,
+                "salary": salary,
+                "hire_date": hire_date,
+            },
+        )
+        assert response.status_code == status.CREATED
+        return response.json
+
+    def test_routes_by_department(self, client, session, partitions):
+        created = [
+            self.create(client, department, 40000 + i * 1000, f"201{i}-01-01T00:00:00")
+            for i, department in enumerate(departments[:8])
+        ]
+        assert Employee.query.count() == 0
+        for employee in created:
+            partition, _ = partitions.decode_id(employee["id"])
+            assert partition == partitions.partition(employee["department"])
+            response = client.get(f"/employees/{employee['id']}")
+            assert response.json["name"] == employee["name"]
+
+        response = client.get("/employees/?per_page=3&page=2")
+        assert response.json["pagination"]["total_items"] == 8
+        all_ids = sorted(e["id"] for e in created)
+        assert [e["id"] for e in response.json["data"]] == all_ids[3:6]
+
+        response = client.get("/top_earners/?fields=id")
+        expected = sorted(created, key=lambda e: e["salary"], reverse=True)[:10]
+        assert response.json["data"] == [{"id": e["id"]} for e in expected]
+        response = client.get("/most_recent_hires/")
+        assert response.json["data"][0]["id"] == created[-1]["id"]
+
+        department = created[0]["department"]
+        response = client.get(f"/departments/{department}")
+        assert [e["id"] for e in response.json["data"]] == [created[0]["id"]]
+        response = client.get(f"/average_salary/{department}")
+        assert response.json["data"] == created[0]["salary"]
+
+    def departments(self, partitions):
+        """Two departments of the same partition and one of another"""
+        first = departments[0]
+        same = next(
+            d
+            for d in departments[1:]
+            if partitions.partition(d) == partitions.partition(first)
+        )
+        other = next(
+            d
+            for d in departments
+            if partitions.partition(d) != partitions.partition(first)
+        )
+        return first, same, other
+
+    def headcounts(self, session):
+        session.expire_all()
+        return {d.name: d.headcount for d in Department.query if d.headcount}
+
+    def test_updates_and_deletes(self, client, session, partitions):
+        first, same, other = self.departments(partitions)
+        employee = self.create(client, first, 50000, "2020-01-15T00:00:00")
+        url = f"/employees/{employee['id']}"
+
+        response = client.patch(url, json={"salary": 60000})
+        assert response.status_code == status.PRECONDITION_REQUIRED
+        response = client.patch(
+            url, json={"salary": 60000}, headers={"If-Match": '"2"'}
+        )
+        assert response.status_code == status.PRECONDITION_FAILED
+        response = client.patch(
+            url, json={"department": same}, headers={"If-Match": '"1"'}
+        )
+        assert response.status_code == status.OK
+        assert response.json["id"] == employee["id"]
+        assert response.json["version"] == 2
+        assert self.headcounts(session) == {same: 1}
+
+        # another partition, another id
+        data = {**employee, "department": other}
+        del data["id"], data["version"]
+        response = client.put(url, json=data, headers={"If-Match": '"2"'})
+        assert response.status_code == status.OK
+        moved = response.json
+        assert moved["id"] != employee["id"]
+        assert moved["version"] == 3
+        assert partitions.decode_id(moved["id"])[0] == partitions.partition(other)
+        assert client.get(url).status_code == status.NOT_FOUND
+        assert client.get(f"/employees/{moved['id']}").json["name"] == data["name"]
+        assert self.headcounts(session) == {other: 1}
+
+        response = client.get("/employees/changes")
+        changes = [(c["operation"], c["employee_id"]) for c in response.json["data"]]
+        assert changes == [
+            (EmployeeChange.DELETE, employee["id"]),
+            (EmployeeChange.INSERT, moved["id"]),
+        ]
+        assert response.json["data"][1]["employee"]["department"] == other
+
+        response = client.delete(
+            f"/employees/{moved['id']}", headers={"If-Match": '"3"'}
+        )
+        assert response.status_code == status.NO_CONTENT
+        assert partitions.count() == 0
+        assert self.headcounts(session) == {}
+        rollup = {(r.department, r.year, r.month): r.hires for r in MonthlyHires.query}
+        assert not any(rollup.values())
+
+    def test_bulk_operations(self, client, session, partitions):
+        first, same, other = self.departments(partitions)
+        created = [
+            self.create(client, department, 50000, "2020-01-15T00:00:00")
+            for department in (first, first, same, other)
+        ]
+        data = {
+            "filter": {"department": first},
+            "update": {"salary_multiplier": 2, "department": other},
+        }
+        response = client.patch("/employees/bulk", json=data)
+        assert response.json["affected"] == 2
+        assert self.headcounts(session) == {same: 1, other: 3}
+        response = client.get(f"/departments/{other}")
+        assert [e["salary"] for e in response.json["data"]] == [
+            50000,
+            100000,
+            100000,
+        ]
+        assert not {e["id"] for e in response.json["data"]} & {
+            e["id"] for e in created[:2]
+        }
+        response = client.get(f"/salary_distribution/{other}")
+        assert response.json["count"] == 3
+
+        data = {"filter": {"ids": [created[2]["id"], created[3]["id"]]}}
+        response = client.delete("/employees/bulk", json=data)
+        assert response.json["affected"] == 2
+        assert partitions.count() == 2
+        assert self.headcounts(session) == {other: 2}
+
+    def test_search_and_distribution(self, client, session, partitions):
+        names = ["Ada Lovelace", "Adam Smith", "Grace Hopper", "Adele Adkins"]
+        for i, name in enumerate(names):
+            response = client.post(
+                "/employees/",
+                json={
+                    "name": name,
+                    "department": departments[i],
+                    "salary": 1000 * (i + 1),
+                    "hire_date": "2020-01-15T00:00:00",
+                },
+            )
+            assert response.status_code == status.CREATED
+        response = client.get("/employees/search?q=ad&per_page=2")
+        assert response.json["pagination"]["total_items"] == 3
+        first_page = [e["name"] for e in response.json["data"]]
+        response = client.get("/employees/search?q=ad&per_page=2&page=2")
+        found = first_page + [e["name"] for e in response.json["data"]]
+        assert sorted(found) == ["Ada Lovelace", "Adam Smith", "Adele Adkins"]
+
+        response = client.get(f"/salary_distribution/{departments[2]}")
+        assert response.json["count"] == 1
+        assert response.json["percentiles"]["p50"] == 3000
+
+    def test_writers_route_by_department(
+        self, app, client, session, partitions, tmp_path
+    ):
+        response = client.post("/jobs/generate-employees", json={"count": 30})
+        job = wait_for_job(client, response.json["id"])
+        assert job["status"] == "succeeded"
+        assert Employee.query.count() == 0
+        assert partitions.count() == 30
+
+        path = tmp_path / "employees.csv"
+        path.write_text(
+            f"name,department,salary,hire_date\nAda,{departments[0]},1000,2020-01-02\n"
+        )
+        result = importing.import_employees(str(path))
+        assert result["inserted"] == 1
+        assert partitions.count() == 31
+        assert Employee.query.count() == 0
+        assert sum(self.headcounts(session).values()) == 31
+
+        response = client.get("/employees/changes?limit=100")
+        assert len(response.json["data"]) == 31
+        assert all(c["employee"] for c in response.json["data"])
+
+        rollup = {(r.department, r.year, r.month): r.hires for r in MonthlyHires.query}
+        result = app.test_cli_runner().invoke(args=["rebuild-hires-rollup"])
+        assert result.exit_code == 0, result.output
+        session.expire_all()
+        rebuilt = {(r.department, r.year, r.month): r.hires for r in MonthlyHires.query}
+        assert {k: v for k, v in rollup.items() if v} == rebuilt
+        assert sum(rebuilt.values()) == 31
+
+        result = train_salary_model(
+            _db.engine,
+            str(tmp_path / "model.pkl"),
+            employee_engines=partitions.engines,
+        )
+        assert result["employees"] == 31
+
+
+class TestHiresTimeseries:
+    @staticmethod
+    def expected(department=None):
+        hires = {}
+        for employee in Employee.query:
+            if department in (None, employee.department):
+                period = employee.hire_date.strftime("%Y-%m")
+                hires[period] = hires.get(period, 0) + 1
+        return hires
+
+    def test_rollup_follows_writes(self, client, session):
+        employees = [create_employee(session) for i in range(10)]
+        moved = employees[0]
+        target = next(d for d in departments if d != moved.department)
+        response = client.patch(
+            f"/employees/{moved.id}",
+            json={"department": target, "hire_date": "2023-02-15T00:00:00"},
+            headers={"If-Match": '"1"'},
+        )
+        assert response.status_code == status.OK
+        response = client.delete(
+            "/employees/bulk", json={"filter": {"ids": [employees[1].id]}}
+        )
+        assert response.status_code == status.OK
+
+        session.expire_all()
+        response = client.get("/hires/timeseries", query_string={"years": 11})
+        assert response.status_code == status.OK
+        data = response.json["data"]
+        assert len(data) == 11 * 12
+        assert {p["period"]: p["hires"] for p in data if p["hires"]} == self.expected()
+
+        response = client.get(
+            "/hires/timeseries", query_string={"years": 11, "department": target}
+        )
+        hires = {p["period"]: p["hires"] for p in response.json["data"] if p["hires"]}
+        assert hires == self.expected(target)
+
+        rollup = {(r.department, r.year, r.month): r.hires for r in MonthlyHires.query}
+        refresh_hires(session.connection())
+        session.commit()
+        rebuilt = {(r.department, r.year, r.month): r.hires for r in MonthlyHires.query}
+        assert {k: v for k, v in rollup.items() if v} == rebuilt
+
+    def test_quarters(self, client, session):
+        employees = [create_employee(session) for i in range(10)]
+        response = client.get(
+            "/hires/timeseries", query_string={"granularity": "quarter"}
+        )
+        assert response.status_code == status.OK
+        data = response.json["data"]
+        assert len(data) == 40
+        assert all("-Q" in p["period"] for p in data)
+        now = datetime.utcnow()
+        end = now.year * 12 + now.month - 1
+        start = end - end % 3 - 10 * 12 + 3
+        months = [e.hire_date.year * 12 + e.hire_date.month - 1 for e in employees]
+        assert sum(p["hires"] for p in data) == sum(m >= start for m in months)
+
+    def test_invalid_granularity(self, client, session):
+        response = client.get("/hires/timeseries", query_string={"granularity": "day"})
+        assert response.status_code == status.UNPROCESSABLE_ENTITY
+
+
+class TestWarmup:
+    def test_ready_after_warmup(self, client, session, monkeypatch):
+        employees = [create_employee(session) for i in range(5)]
+        monkeypatch.setattr(warmup, "enabled", True)
+        monkeypatch.setattr(warmup, "background", False)
+        warmup.start()
+
+        response = client.get("/readyz")
+        assert response.status_code == status.OK
+        assert response.json["ready"] is True
+        assert response.json["errors"] == {}
+        assert set(response.json["timings"]) == {
+            "connections",
+            "model",
+            "indexes",
+            "caches",
+            "total",
+        }
+        assert len(salary_index.get(employees[0].department)) > 0
+
+    def test_not_ready_while_warming_up(self, client, monkeypatch):
+        monkeypatch.setattr(warmup, "_ready", type(warmup._ready)())
+        response = client.get("/readyz")
+        assert response.status_code == status.SERVICE_UNAVAILABLE
+        assert response.json["ready"] is False
+        response = client.get("/healthz")
+        assert response.status_code == status.OK
+
+
+class TestGroupCommit:
+    @pytest.fixture
+    def batching(self, monkeypatch):
+        monkeypatch.setattr(group_commit, "enabled", True)
+        # batches only close when full
+        monkeypatch.setattr(group_commit, "window", 5.0)
+
+    @staticmethod
+    def concurrently(*calls):
+        responses = [None] * len(calls)
+
+        def call(i):
+            responses[i] = calls[i]()
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(len(calls))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    @staticmethod
+    def employee_data():
+        return {
+            "name": fake.name(),
+            "hire_date": fake.date_time_between(start_date="-10y").isoformat(),
+            "department": fake.random_element(elements=departments),
+            "salary": fake.random_int(min=30000, max=1000000),
+        }
+
+    def test_concurrent_creates_share_a_commit(
+        self, client, session, batching, monkeypatch
+    ):
+        monkeypatch.setattr(group_commit, "max_size", 5)
+        batches = metrics.histogram("group_commit_batch_size")
+        before = batches.count if batches else 0
+        responses = self.concurrently(
+            *[
+                lambda: client.post("/employees/", json=self.employee_data())
+                for i in range(5)
+            ]
+        )
+        assert [r.status_code for r in responses] == [status.CREATED] * 5
+        assert len({r.json["id"] for r in responses}) == 5
+        batches = metrics.histogram("group_commit_batch_size")
+        assert batches.count == before + 1
+        assert Employee.query.count() == 5
+
+    def test_each_caller_gets_its_own_error(
+        self, client, session, batching, monkeypatch
+    ):
+        employee_id = create_employee(session).id
+        monkeypatch.setattr(group_commit, "max_size", 3)
+        fallbacks = metrics.value("group_commit_fallbacks_total") or 0
+        data = self.employee_data()
+        etag = {"headers": {"If-Match": '"1"'}}
+        responses = self.concurrently(
+            lambda: client.post("/employees/", json=self.employee_data()),
+            lambda: client.put(f"/employees/{employee_id + 100}", json=data, **etag),
+            lambda: client.put(f"/employees/{employee_id}", json=data, **etag),
+        )
+        assert [r.status_code for r in responses] == [
+            status.CREATED,
+            status.NOT_FOUND,
+            status.OK,
+        ]
+        assert metrics.value("group_commit_fallbacks_total") == fallbacks + 1
+        session.expire_all()
+        assert Employee.query.count() == 2
+        assert session.get(Employee, employee_id).name == data["name"]
+
+
+async def asgi_request(application, method, path, query_string="", headers=()):
+    """Call an ASGI application, returning the status, headers and body"""
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "root_path": "",
+        "query_string": query_string.encode(),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+        "server": ("localhost", 80),
+        "client": ("127.0.0.1", 50000),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    start, *bodies = messages
+    headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    return start["status"], headers, b"".join(m.get("body", b"") for m in bodies)
+
+
+class TestAsyncReads:
+    @pytest.fixture
+    def application(self, app, session, monkeypatch):
+        monkeypatch.setattr(async_reads, "enabled", True)
+        monkeypatch.setattr(async_reads, "url", async_url(_db.engine.url))
+        application = AsgiApplication(app)
+        yield application
+        if application._executor is not None:
+            application._executor.shutdown()
+
+    def run(self, application, *requests):
+        async def main():
+            try:
+                return await asyncio.gather(
+                    *(asgi_request(application, *request) for request in requests)
+                )
+            finally:
+                await async_reads.dispose()
+
+        return asyncio.run(main())
+
+    def test_lists_match_sync_path(self, client, session, application, monkeypatch):
+        [create_employee(session) for i in range(12)]
+        team = client.post("/teams/", json={"name": "Core"}).json
+        client.post("/members/", json={"first_name": "Ada", "team_id": team["id"]})
+
+        def run_wsgi(*args):
+            raise AssertionError("served by the WSGI application")
+
+        monkeypatch.setattr(application, "run_wsgi", run_wsgi)
+        urls = [
+            ("/employees/", "per_page=5&page=2"),
+            ("/top_earners/", "per_page=3"),
+            ("/most_recent_hires/", "fields=id,hire_date"),
+            ("/teams/", ""),
+            ("/members/", f"team_id={team['id']}&page_size=1"),
+        ]
+        for (path, query), (code, headers, body) in zip(
+            urls, self.run(application, *(("GET", *url) for url in urls))
+        ):
+            expected = client.get(path, query_string=query)
+            assert code == expected.status_code == status.OK
+            assert json.loads(body) == expected.json
+            assert headers["etag"] == expected.headers["ETag"]
+            assert headers.get("x-pagination") == expected.headers.get("X-Pagination")
+
+        etag = headers["etag"]
+        (code, _, _), (bad_code, _, _) = self.run(
+            application,
+            ("GET", "/members/", urls[-1][1], [("If-None-Match", etag)]),
+            ("GET", "/employees/", "per_page=0"),
+        )
+        assert code == status.NOT_MODIFIED
+        assert bad_code == status.UNPROCESSABLE_ENTITY
+
+    def test_other_requests_run_the_wsgi_app(self, client, session, application):
+        employee_ids = [create_employee(session).id for i in range(2)]
+        (code, headers, body), (ids_code, _, ids_body) = self.run(
+            application,
+            ("GET", f"/employees/{employee_ids[0]}"),
+            ("GET", "/employees/", f"ids={employee_ids[1]}"),
+        )
+        assert code == status.OK
+        assert json.loads(body)["id"] == employee_ids[0]
+        assert headers["etag"] == '"1"'
+        assert ids_code == status.OK
+        assert [e["id"] for e in json.loads(ids_body)["data"]] == employee_ids[1:]
+
+    def test_waiting_requests_hold_no_thread(self, session, application):
+        [create_employee(session) for i in range(3)]
+        latency, concurrency = 0.2, 20
+
+        async def main():
+            engine = async_reads.engine.sync_engine
+
+            @sa.event.listens_for(engine, "before_cursor_execute")
+            def delay(*_):
+                await_only(asyncio.sleep(latency))
+
+            try:
+                started = time.perf_counter()
+                responses = await asyncio.gather(
+                    *(
+                        asgi_request(application, "GET", "/employees/")
+                        for i in range(concurrency)
+                    )
+                )
+                return responses, time.perf_counter() - started
+            finally:
+                await async_reads.dispose()
+
+        responses, elapsed = asyncio.run(main())
+        assert all(code == status.OK for code, _, _ in responses)
+        # the pool (5 + 10 overflow) bounds the statements running at once,
+        # not a thread per request: sequential requests would take 4s
+        assert latency <= elapsed < concurrency * latency / 4
+
+
+class TestTeams:
+    def test_teams_and_members(self, client, session):
+        team = client.post("/teams/", json={"name": "Core"}).json
+        for name in ("Ada", "Alan"):
+            response = client.post(
+                "/members/", json={"first_name": name, "team_id": team["id"]}
+            )
+            assert response.status_code == status.CREATED
+
+        response = client.get("/members/", query_string={"team_id": team["id"]})
+        assert response.status_code == status.OK
+        assert sorted(m["first_name"] for m in response.json) == ["Ada", "Alan"]
+        assert json.loads(response.headers["X-Pagination"])["total"] == 2
+
+        member_id = response.json[0]["id"]
+        response = client.get("/teams/", query_string={"member_id": member_id})
+        assert response.status_code == status.OK
+        assert [t["name"] for t in response.json] == ["Core"]
+
+        # reads and updates answer 200, only creations 201
+        response = client.get(f"/teams/{team['id']}")
+        assert response.status_code == status.OK
+        response = client.put(
+            f"/teams/{team['id']}",
+            json={"name": "Platform"},
+            headers={"If-Match": response.headers["ETag"]},
+        )
+        assert response.status_code == status.OK
+
+
+class TestBatch:
+    def test_multi_get_keeps_order(self, client, session):
+        employee_ids = [create_employee(session).id for i in range(4)]
+        ids = [employee_ids[2], employee_ids[0], employee_ids[2], 10**6]
+        response = client.get(
+            "/employees/", query_string={"ids": ",".join(map(str, ids))}
+        )
+        assert response.status_code == status.OK
+        assert [e["id"] for e in response.json["data"]] == [
+            employee_ids[2],
+            employee_ids[0],
+        ]
+        assert response.json["pagination"]["total_items"] == 2
+
+        response = client.get(
+            "/employees/",
+            query_string={"ids": ",".join(map(str, ids))},
+            headers={"If-None-Match": response.headers["ETag"]},
+        )
+        assert response.status_code == status.NOT_MODIFIED
+
+    def test_multi_get_limit(self, client, app, session):
+        limit = app.config["MAX_PER_PAGE_LIMIT"]
+        ids = ",".join(str(i) for i in range(1, limit + 2))
+        response = client.get("/employees/", query_string={"ids": ids})
+        assert response.status_code == status.UNPROCESSABLE_ENTITY
+
+    def test_batch(self, client, session):
+        employee = create_employee(session)
+        employee_id = employee.id
+        response = client.post(
+            "/batch",
+            json={
+                "requests": [
+                    {"path": f"/employees/{employee_id}"},
+                    {
+                        "method": "POST",
+                        "path": "/employees/",
+                        "body": {
+                            "name": "Ada Lovelace",
+                            "hire_date": "2020-01-01T00:00:00",
+                            "department": departments[0],
+                            "salary": 100000,
+                        },
+                    },
+                    {"path": "/employees/?per_page=5&fields=id"},
+                    {"path": f"/employees/{10**6}"},
+                    {"method": "POST", "path": "/batch", "body": {"requests": []}},
+                ]
+            },
+        )
+        assert response.status_code == status.OK
+        responses = response.json["responses"]
+        assert [r["status"] for r in responses] == [
+            status.OK,
+            status.CREATED,
+            status.OK,
+            status.NOT_FOUND,
+            status.BAD_REQUEST,
+        ]
+        assert responses[0]["body"]["id"] == employee_id
+        assert "ETag" in responses[0]["headers"]
+        assert responses[1]["body"]["name"] == "Ada Lovelace"
+        assert [e.keys() for e in responses[2]["body"]["data"]] == [{"id"}] * 2
+        assert _db.session.get(Employee, responses[1]["body"]["id"]) is not None
+
+    def test_batch_limit(self, client, app, session):
+        requests = [{"path": "/employees/"}] * (app.config["BATCH_MAX_REQUESTS"] + 1)
+        response = client.post("/batch", json={"requests": requests})
+        assert response.status_code == status.UNPROCESSABLE_ENTITY
+
+
+class TestSalaryModelSearch:
+    def test_search_caches_features(self, app, session, tmp_path):
+        for _ in range(30):
+            create_employee(session)
+        model_path = str(tmp_path / "model.pkl")
+        cache_dir = str(tmp_path / "features")
+
+        result = search_salary_model(
+            _db.engine, model_path, cache_dir, n_jobs=2, folds=3
+        )
+        assert result["employees"] == 30
+        assert not result["cached_features"]
+        scores = [candidate["score"] for candidate in result["candidates"]]
+        assert scores == sorted(scores, reverse=True)
+        assert result["best"] == result["candidates"][0]
+        assert all(c["fit_seconds"] >= 0 for c in result["candidates"])
+        model = SalaryModel()
+        model.path = model_path
+        assert model.predict(departments[0], datetime(2022, 1, 1)) > 0
+
+        result = search_salary_model(
+            _db.engine, model_path, cache_dir, n_jobs=1, folds=3
+        )
+        assert result["cached_features"]
+
+        create_employee(session)
+        # employees of departments the models cannot encode are left out
+        session.add(Department(name="Robotics"))
+        employee = create_employee(session)
+        employee.department = "Robotics"
+        session.commit()
+        result = search_salary_model(
+            _db.engine, model_path, cache_dir, n_jobs=1, folds=3
+        )
+        assert not result["cached_features"]
+        assert result["employees"] == 31
+        assert len(os.listdir(cache_dir)) == 1
+
+    def test_train_command_search(self, app, session, tmp_path, monkeypatch):
+        for _ in range(20):
+            create_employee(session)
+        monkeypatch.setitem(
+            app.config, "SALARY_MODEL_PATH", str(tmp_path / "model.pkl")
+        )
+        monkeypatch.setitem(
+            app.config, "SALARY_MODEL_FEATURE_CACHE_DIR", str(tmp_path / "features")
+        )
+        result = app.test_cli_runner().invoke(
+            args=["train-salary-model", "--search", "--jobs", "1", "--folds", "2"]
+        )
+        assert result.exit_code == 0, result.output
+        assert "Ridge {'alpha': 1.0}: score" in result.output
+        assert os.path.exists(tmp_path / "model.pkl")
+
+
+class TestSnapshots:
+    def employee_rows(self, engine):
+        with engine.connect() as connection:
+            return connection.execute(
+                sa.select(Employee.__table__).order_by(Employee.id)
+            ).all()
+
+    @pytest.mark.parametrize("compress", [False, True])
+    def test_backup_round_trip(self, session, tmp_path, compress):
+        for _ in range(5):
+            create_employee(session)
+        expected = self.employee_rows(_db.engine)
+        path = str(tmp_path / "snapshot.db")
+
+        result = snapshots.snapshot(_db.engine, path, compress=compress)
+        assert result["format"] == "backup"
+        assert snapshots.detect_format(path) == "backup"
+
+        session.execute(sa.delete(Employee))
+        session.commit()
+        create_employee(session)
+        result = snapshots.restore(_db.engine, path)
+        assert result["format"] == "backup"
+        assert self.employee_rows(_db.engine) == expected
+
+    def test_dump_restores_into_another_database(self, session, tmp_path):
+        for _ in range(5):
+            create_employee(session)
+        expected = self.employee_rows(_db.engine)
+        path = str(tmp_path / "snapshot.ndjson.gz")
+
+        result = snapshots.snapshot(
+            _db.engine, path, snapshot_format="dump", compress=True
+        )
+        assert result["format"] == "dump"
+        assert snapshots.detect_format(path) == "dump"
+
+        engine = sa.create_engine(f"sqlite:///{tmp_path}/copy.db")
+        result = snapshots.restore(engine, path, batch_size=2)
+        assert result["rows"] >= 5
+        assert self.employee_rows(engine) == expected
+        with engine.connect() as connection:
+            hires = connection.execute(sa.select(sa.func.sum(MonthlyHires.hires)))
+            assert hires.scalar() == 5
+        engine.dispose()
+
+    def test_commands(self, app, session, tmp_path):
+        for _ in range(3):
+            create_employee(session)
+        path = str(tmp_path / "snapshot.db.gz")
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=["snapshot-db", path, "--compress"])
+        assert result.exit_code == 0, result.output
+
+        create_employee(session)
+        result = runner.invoke(args=["restore-db", path, "--yes"])
+        assert result.exit_code == 0, result.output
+        assert "Restored the backup snapshot" in result.output
+        assert _db.session.scalar(sa.select(sa.func.count(Employee.id))) == 3
+
+    def test_restore_rejects_unknown_files(self, app, session, tmp_path):
+        path = tmp_path / "snapshot.ndjson"
+        path.write_text('{"format": "other"}\n')
+        result = app.test_cli_runner().invoke(args=["restore-db", str(path), "--yes"])
+        assert result.exit_code != 0
+        assert "Not a snapshot" in result.output
+
+
+class TestJobEndpoint:
+    def test_generate_employees_job(self, client, session):
+        response = client.post("/jobs/generate-employees", json={"count": 5})
+        assert response.status_code == status.ACCEPTED
+        assert response.json["status"] in ("queued", "running", "succeeded")
+
+        job = wait_for_job(client, response.json["id"])
+        assert job["status"] == "succeeded"
+        assert job["result"] == {"employees": 5}
+        assert job["progress"] == 1.0
+        assert job["run_seconds"] >= 0
+        assert Employee.query.count() == 5
+
+    def test_generation_updates_rollups_per_batch(self, session):
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        sa.event.listen(_db.engine, "before_cursor_execute", count)
+        try:
+            generation.generate_employees(2 * generation.BATCH_SIZE)
+        finally:
+            sa.event.remove(_db.engine, "before_cursor_execute", count)
+        # a bounded number of statements per batch, not per employee
+        assert len(statements) < generation.BATCH_SIZE / 10
+
+        headcounts = dict(
+            session.execute(_db.select(Department.name, Department.headcount)).all()
+        )
+        counts = dict(
+            session.execute(
+                _db.select(Employee.department, sa.func.count()).group_by(
+                    Employee.department
+                )
+            ).all()
+        )
+        assert {k: v for k, v in headcounts.items() if v} == counts
+        rollup = {(r.department, r.year, r.month): r.hires for r in MonthlyHires.query}
+        refresh_hires(session.connection())
+        rebuilt = {(r.department, r.year, r.month): r.hires for r in MonthlyHires.query}
+        assert {k: v for k, v in rollup.items() if v} == rebuilt
+        assert sum(rebuilt.values()) == 2 * generation.BATCH_SIZE
+        session.rollback()
+
+    def test_train_salary_model_job_swaps_model(
+        self, app, client, session, tmp_path, monkeypatch
+    ):
+        model_path = str(tmp_path / "model.pkl")
+        monkeypatch.setitem(app.config, "SALARY_MODEL_PATH", model_path)
+        monkeypatch.setattr(salary_model, "path", model_path)
+        for _ in range(20):
+            create_employee(session)
+        reloads = salary_model.reloads
+
+        response = client.post("/jobs/train-salary-model")
+        job = wait_for_job(client, response.json["id"])
+        assert job["status"] == "succeeded", job["error"]
+        assert job["result"]["employees"] == 20
+        assert salary_model.reloads == reloads + 1
+        assert os.path.exists(model_path)
+
+    def test_get_unknown_job(self, client):
+        assert client.get("/jobs/unknown").status_code == status.NOT_FOUND
+
+
+class TestResponseCompression:
+    def test_negotiates_encoding(self, client, session):
+        for _ in range(10):
+            create_employee(session)
+        plain = client.get("/employees/")
+        assert "Content-Encoding" not in plain.headers
+
+        response = client.get("/employees/", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert gzip.decompress(response.data) == plain.data
+
+        response = client.get(
+            "/employees/", headers={"Accept-Encoding": "gzip;q=0.5, br;q=0"}
+        )
+        assert response.headers["Content-Encoding"] == "gzip"
+
+    def test_small_responses_are_not_compressed(self, client, session):
+        response = client.get("/employees/", headers={"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in response.headers
+
+    def test_spec_compressed_bytes_are_reused(self, client):
+        headers = {"Accept-Encoding": "gzip"}
+        hits = compression.cache.hits
+        first = client.get("/api/api-spec.json", headers=headers)
+        second = client.get("/api/api-spec.json", headers=headers)
+        assert first.headers["Content-Encoding"] == "gzip"
+        assert first.data == second.data
+        assert compression.cache.hits == hits + 1
+
+    def test_cached_bytes_follow_the_body_not_the_etag(self, app):
+        bodies = [json.dumps({"name": name * 200}) for name in ("Ada", "Grace")]
+        for body in bodies:
+            with app.test_request_context(
+                "/employees/1", headers={"Accept-Encoding": "gzip"}
+            ):
+                response = app.response_class(body, mimetype="application/json")
+                response.set_etag("1")
+                response = compression.compress_response(response)
+                assert response.headers["Content-Encoding"] == "gzip"
+                assert gzip.decompress(response.get_data()) == body.encode()
+
+    def test_streamed_responses_are_compressed_incrementally(self, app):
+        chunks = [json.dumps({"id": i}).encode() + b"\n" for i in range(100)]
+        with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+            response = app.response_class(iter(chunks), mimetype="application/x-ndjson")
+            response = compression.compress_response(response)
+            compressed = list(response.response)
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert len(compressed) == len(chunks) + 1
+        assert gzip.decompress(b"".join(compressed)) == b"".join(chunks)
+
 
 """
 
@@ -0,0 +1,184 @@
+"""In-memory columnar snapshot of employees
+
+Keeps the columns the analytical endpoints need (id, department code,
+salary, hire date) as NumPy arrays, so that averages and top-k queries run
+as vectorized operations instead of table scans. The snapshot is built from
+the ``employees`` table on first use and then refreshed incrementally from
+the change log: on every read the highest change sequence is compared with
+the one the snapshot was built at, and only the employees changed since are
+reloaded. Changes made by other processes are picked up the same way.
+
+Compaction may purge tombstones from the change log, so snapshots older than
+``ANALYTICS_SNAPSHOT_MAX_AGE`` seconds are rebuilt from scratch.
+"""
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+import sqlalchemy as sa
+from flask import current_app
+
+from app.extensions.database import db
+from app.models import Employee, EmployeeChange
+
+_SELECT_CHUNK = 500
+
+# bytes per employee: id, department code, salary, hire date (epoch seconds)
+ROW_BYTES = sum(
+    np.dtype(dtype).itemsize for dtype in (np.int64, np.int16, np.float64, np.int64)
+)
+
+
+class Columns(NamedTuple):
+    ids: np.ndarray
+    departments: np.ndarray
+    salaries: np.ndarray
+    hire_dates: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self)
+
+
+class EmployeeSnapshot:
+    """Columnar copy of the ``employees`` table"""
+
+    def __init__(self):
+        self._columns: Optional[Columns] = None
+        self._sequence = 0
+        self._built_at = 0.0
+        self._codes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.refreshes = 0
+
+    @staticmethod
+    def enabled() -> bool:
+        return current_app.config.get("ANALYTICS_SNAPSHOT_ENABLED", False)
+
+    def code(self, department: str) -> int:
+        """The code of a department in the ``departments`` column"""
+        code = self._codes.get(department)
+        if code is None:
+            with self._lock:
+                code = self._codes.setdefault(department, len(self._codes))
+        return code
+
+    def _to_columns(self, rows: List[tuple]) -> Columns:
+        ids, departments, salaries, hire_dates = zip(*rows) if rows else ((),) * 4
+        return Columns(
+            np.array(ids, dtype=np.int64),
+            np.array([self.code(d) for d in departments], dtype=np.int16),
+            np.array(salaries, dtype=np.float64),
+            np.array(hire_dates, dtype="datetime64[s]").astype(np.int64),
+        )
+
+    def _select(self):
+        return sa.select(
+            Employee.id, Employee.department, Employee.salary, Employee.hire_date
+        )
+
+    def _max_sequence(self) -> int:
+        sequence = sa.select(sa.func.max(EmployeeChange.sequence))
+        return db.session.execute(sequence).scalar() or 0
+
+    def _build(self) -> Columns:
+        rows = db.session.execute(self._select().order_by(Employee.id)).all()
+        self.builds += 1
+        return self._to_columns(rows)
+
+    def _apply(
+        self, columns: Columns, since: int, sequence: int
+    ) -> Optional[Columns]:
+        changed = np.fromiter(
+            db.session.execute(
+                sa.select(EmployeeChange.employee_id)
+                .where(EmployeeChange.sequence > since)
+                .where(EmployeeChange.sequence <= sequence)
+                .distinct()
+            ).scalars(),
+            dtype=np.int64,
+        )
+        ratio = current_app.config.get("ANALYTICS_SNAPSHOT_REBUILD_RATIO", 0.25)
+        if len(changed) > max(len(columns.ids) * ratio, _SELECT_CHUNK):
+            # cheaper to read the whole table again
+            return None
+        rows = []
+        for start in range(0, len(changed), _SELECT_CHUNK):
+            chunk = changed[start : start + _SELECT_CHUNK].tolist()
+            rows += db.session.execute(
+                self._select().where(Employee.id.in_(chunk))
+            ).all()
+        keep = ~np.isin(columns.ids, changed)
+        fresh = self._to_columns(rows)
+        self.refreshes += 1
+        return Columns(
+            *(np.concatenate((old[keep], new)) for old, new in zip(columns, fresh))
+        )
+
+    def get(self) -> Columns:
+        """Get the columns, bringing them up to date with the change log"""
+        columns, since = self._columns, self._sequence
+        sequence = self._max_sequence()
+        max_age = current_app.config.get("ANALYTICS_SNAPSHOT_MAX_AGE", 86400)
+        if columns is not None and sequence == since:
+            if time.monotonic() - self._built_at < max_age:
+                return columns
+            columns = None
+        elif sequence < since:
+            # the change log was reset
+            columns = None
+
+        built_at = self._built_at
+        if columns is not None:
+            columns = self._apply(columns, since, sequence)
+        if columns is None:
+            columns = self._build()
+            built_at = time.monotonic()
+        with self._lock:
+            # keep whichever of the racing refreshes saw the latest changes
+            if self._columns is None or sequence >= self._sequence:
+                self._columns, self._sequence = columns, sequence
+                self._built_at = built_at
+        return columns
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._columns = None
+            self._sequence = 0
+
+    def average_salary(self, department: str) -> Optional[float]:
+        columns = self.get()
+        salaries = columns.salaries[columns.departments == self.code(department)]
+        return float(salaries.mean()) if len(salaries) else None
+
+    def top_ids(self, column: str, limit: int) -> List[int]:
+        """Ids of the employees with the highest values of a column, highest
+        first"""
+        columns = self.get()
+        values = getattr(columns, column)
+        if limit < len(values):
+            top = np.argpartition(values, len(values) - limit)[-limit:]
+        else:
+            top = np.arange(len(values))
+        top = top[np.argsort(values[top], kind="stable")[::-1]]
+        return columns.ids[top].tolist()
+
+    def stats(self) -> dict:
+        columns = self._columns
+        rows = len(columns.ids) if columns is not None else 0
+        nbytes = columns.nbytes if columns is not None else 0
+        return {
+            "enabled": self.enabled(),
+            "rows": rows,
+            "bytes": nbytes,
+            "bytes_per_row": ROW_BYTES,
+            "mb_per_million_rows": ROW_BYTES * 1_000_000 / 2**20,
+            "sequence": self._sequence,
+            "builds": self.builds,
+            "refreshes": self.refreshes,
+        }
+
+
+employee_snapshot = EmployeeSnapshot()
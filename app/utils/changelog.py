@@ -0,0 +1,170 @@
+"""Employee change log
+
+Write handlers record their changes with ``record_changes`` in the same
+transaction as the change itself. With ``EMPLOYEE_CHANGES_COMPACT_ON_WRITE``
+the log only keeps the latest change of each employee, so that reading it
+costs O(changed employees) rather than O(writes).
+"""
+import datetime as dt
+from typing import Iterable, List, Optional, Union
+
+import sqlalchemy as sa
+from flask import current_app
+
+from app.extensions.database import db
+from app.extensions.partitions import employee_partitions
+from app.models import Employee, EmployeeChange
+
+EmployeeIds = Union[Iterable[int], sa.Select]
+
+
+def record_changes(
+    operation: str, employee_ids: EmployeeIds
+) -> Optional[List[int]]:
+    """Record a change of some employees
+
+    Deletions must be recorded before the rows are deleted when
+    ``employee_ids`` is a select.
+
+    Args:
+        operation: str: One of ``EmployeeChange.INSERT``, ``UPDATE``, ``DELETE``.
+        employee_ids: A list of employee ids or a select of employee ids.
+
+    Returns:
+        list: The sequence numbers of the recorded changes, None when they
+            are not known (a select, or a database without RETURNING).
+    """
+    now = dt.datetime.utcnow()
+    if isinstance(employee_ids, sa.Select):
+        ids = employee_ids.scalar_subquery()
+        if current_app.config.get("EMPLOYEE_CHANGES_COMPACT_ON_WRITE"):
+            db.session.execute(
+                sa.delete(EmployeeChange).where(EmployeeChange.employee_id.in_(ids))
+            )
+        db.session.execute(
+            sa.insert(EmployeeChange).from_select(
+                ["employee_id", "operation", "changed_at"],
+                sa.select(
+                    employee_ids.subquery().c[0],
+                    sa.literal(operation),
+                    sa.literal(now),
+                ),
+            )
+        )
+        return None
+
+    employee_ids = list(employee_ids)
+    if not employee_ids:
+        return []
+    if current_app.config.get("EMPLOYEE_CHANGES_COMPACT_ON_WRITE"):
+        db.session.execute(
+            sa.delete(EmployeeChange).where(
+                EmployeeChange.employee_id.in_(employee_ids)
+            )
+        )
+    rows = [
+        {"employee_id": employee_id, "operation": operation, "changed_at": now}
+        for employee_id in employee_ids
+    ]
+    if not db.session.get_bind().dialect.insert_executemany_returning:
+        db.session.execute(sa.insert(EmployeeChange), rows)
+        return None
+    return db.session.execute(
+        sa.insert(EmployeeChange).returning(EmployeeChange.sequence), rows
+    ).scalars().all()
+
+
+def get_changes(since: int, limit: int) -> list:
+    """Changes recorded after a sequence number, oldest first
+
+    Inserts and updates come with the current state of the employee. Those
+    of employees deleted since are skipped, their tombstone comes later.
+    """
+    if employee_partitions.enabled:
+        return _partitioned_changes(since, limit)
+    statement = (
+        sa.select(EmployeeChange, Employee)
+        .outerjoin(Employee, Employee.id == EmployeeChange.employee_id)
+        .where(EmployeeChange.sequence > since)
+        .where(
+            sa.or_(
+                EmployeeChange.operation == EmployeeChange.DELETE,
+                Employee.id.is_not(None),
+            )
+        )
+        .order_by(EmployeeChange.sequence)
+        .limit(limit)
+    )
+    return [
+        {
+            "sequence": change.sequence,
+            "operation": change.operation,
+            "employee_id": change.employee_id,
+            "changed_at": change.changed_at,
+            "employee": employee if change.operation != EmployeeChange.DELETE else None,
+        }
+        for change, employee in db.session.execute(statement)
+    ]
+
+
+def _partitioned_changes(since: int, limit: int) -> list:
+    """``get_changes`` with the employees read from their partitions"""
+    changes = []
+    while len(changes) < limit:
+        batch = db.session.execute(
+            sa.select(EmployeeChange)
+            .where(EmployeeChange.sequence > since)
+            .order_by(EmployeeChange.sequence)
+            .limit(limit)
+        ).scalars().all()
+        if not batch:
+            break
+        employees = employee_partitions.get_many(
+            change.employee_id
+            for change in batch
+            if change.operation != EmployeeChange.DELETE
+        )
+        for change in batch:
+            employee = employees.get(change.employee_id)
+            if change.operation != EmployeeChange.DELETE and employee is None:
+                continue
+            changes.append(
+                {
+                    "sequence": change.sequence,
+                    "operation": change.operation,
+                    "employee_id": change.employee_id,
+                    "changed_at": change.changed_at,
+                    "employee": employee,
+                }
+            )
+        since = batch[-1].sequence
+    return changes[:limit]
+
+
+def compact_changes(retention_days: Optional[float] = None) -> int:
+    """Keep only the latest change of each employee and purge old tombstones
+
+    Args:
+        retention_days: float: Age after which tombstones are purged, None
+            keeps them forever.
+
+    Returns:
+        int: The number of changes removed.
+    """
+    latest = (
+        sa.select(sa.func.max(EmployeeChange.sequence))
+        .group_by(EmployeeChange.employee_id)
+        .scalar_subquery()
+    )
+    removed = db.session.execute(
+        sa.delete(EmployeeChange).where(EmployeeChange.sequence.not_in(latest))
+    ).rowcount
+    if retention_days is not None:
+        horizon = dt.datetime.utcnow() - dt.timedelta(days=retention_days)
+        removed += db.session.execute(
+            sa.delete(EmployeeChange)
+            .where(EmployeeChange.operation == EmployeeChange.DELETE)
+            .where(EmployeeChange.changed_at < horizon)
+        ).rowcount
+    db.session.commit()
+    return removed
@@ -0,0 +1,51 @@
+"""In-memory set of the department names
+
+Every request naming a department validates it against this set instead of
+querying the ``departments`` table. The set is loaded on first use and
+dropped whenever this process creates a department. A name missing from the
+set is looked up in the table before being rejected, so departments created
+by other processes are picked up on their first use.
+"""
+import threading
+from typing import FrozenSet, Optional
+
+import sqlalchemy as sa
+
+from app.extensions.database import db
+from app.models.departments import Department
+
+
+class DepartmentNames:
+    """Cached set of the names of the ``departments`` table"""
+
+    def __init__(self):
+        self._names: Optional[FrozenSet[str]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> FrozenSet[str]:
+        return frozenset(db.session.execute(sa.select(Department.name)).scalars())
+
+    def get(self) -> FrozenSet[str]:
+        names = self._names
+        if names is None:
+            names = self._load()
+            with self._lock:
+                self._names = names
+        return names
+
+    def __contains__(self, name: str) -> bool:
+        if name in self.get():
+            return True
+        exists = db.session.execute(
+            sa.select(Department.id).where(Department.name == name)
+        ).first()
+        if exists:
+            self.invalidate()
+        return exists is not None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._names = None
+
+
+department_names = DepartmentNames()
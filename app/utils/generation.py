@@ -0,0 +1,71 @@
+"""Fake employees generation"""
+import random
+from collections import Counter
+from typing import Optional
+
+import sqlalchemy as sa
+from faker import Faker
+
+from app.constants import departments
+from app.extensions.database import db
+from app.extensions.partitions import employee_partitions
+from app.models import Employee, EmployeeChange
+from app.models.departments import add_headcounts
+from app.models.hires import add_hires, bucket
+from app.utils.changelog import record_changes
+from app.utils.progress import Reporter
+from app.utils.salary_index import salary_index
+
+BATCH_SIZE = 1000
+
+
+def generate_employees(count: int, report: Optional[Reporter] = None) -> int:
+    """Generate random employees in a single transaction
+
+    Employees are inserted ``BATCH_SIZE`` at a time with multi-row INSERTs,
+    and the department headcounts and monthly hires of every batch are
+    added in one statement each, as imports do. With partitioned storage,
+    every batch is committed to the partitions as it is inserted.
+
+    Args:
+        count: int: Number of employees to generate.
+        report: Callable: Called with progress messages.
+
+    Returns:
+        int: The number of generated employees.
+    """
+    fake = Faker()
+
+    with db.session() as session:
+        for start in range(0, count, BATCH_SIZE):
+            rows = [
+                {
+                    "name": fake.name(),
+                    "department": random.choice(departments),
+                    "salary": fake.pyint(min_value=30000, max_value=1000000),
+                    "hire_date": fake.date_time_between(
+                        start_date="-10y", end_date="now"
+                    ),
+                }
+                for i in range(min(BATCH_SIZE, count - start))
+            ]
+            if employee_partitions.enabled:
+                ids = employee_partitions.insert_many(rows)
+            else:
+                ids = session.execute(
+                    sa.insert(Employee).returning(Employee.id), rows
+                ).scalars().all()
+            record_changes(EmployeeChange.INSERT, ids)
+            add_headcounts(
+                session.connection(), Counter(row["department"] for row in rows)
+            )
+            add_hires(
+                session.connection(),
+                Counter(bucket(row["department"], row["hire_date"]) for row in rows),
+            )
+            if report:
+                done = start + len(rows)
+                report(f"Generated {done} employees", done / count)
+        session.commit()
+    salary_index.invalidate()
+    return count
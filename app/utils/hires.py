@@ -0,0 +1,65 @@
+"""Hiring time series, read from the monthly hires rollup"""
+import datetime as dt
+from typing import List, Optional
+
+import sqlalchemy as sa
+
+from app.extensions.database import db
+from app.models.hires import MonthlyHires
+
+GRANULARITIES = ("month", "quarter")
+
+
+def _period(index: int, granularity: str) -> str:
+    """Name of the period of a month index (``year * 12 + month - 1``)"""
+    year, month = divmod(index, 12)
+    if granularity == "quarter":
+        return f"{year}-Q{month // 3 + 1}"
+    return f"{year}-{month + 1:02d}"
+
+
+def hires_timeseries(
+    granularity: str = "month",
+    department: Optional[str] = None,
+    years: int = 10,
+    today: Optional[dt.date] = None,
+) -> List[dict]:
+    """Hires per period over the last ``years`` years, oldest first
+
+    Every period is listed, those without hires with 0. The query reads at
+    most ``years * 12`` rows per department of the rollup, whatever the
+    number of employees.
+
+    Args:
+        granularity: str: One of ``GRANULARITIES``.
+        department: str: Only count the hires of this department.
+        years: int: Number of years up to the current month (or quarter).
+        today: date: The current date, defaults to today (UTC).
+
+    Returns:
+        list: The ``period`` and ``hires`` of every period.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    today = today or dt.datetime.utcnow().date()
+    step = 3 if granularity == "quarter" else 1
+    end = today.year * 12 + today.month - 1
+    end -= end % step
+    start = end - years * 12 + step
+
+    index = MonthlyHires.year * 12 + MonthlyHires.month - 1
+    statement = (
+        sa.select(index.label("index"), sa.func.sum(MonthlyHires.hires))
+        .where(index >= start, index < end + step)
+        .group_by(MonthlyHires.year, MonthlyHires.month)
+    )
+    if department is not None:
+        statement = statement.where(MonthlyHires.department == department)
+
+    hires = [0] * ((end - start) // step + 1)
+    for month, count in db.session.execute(statement):
+        hires[(month - start) // step] += count
+    return [
+        {"period": _period(start + i * step, granularity), "hires": count}
+        for i, count in enumerate(hires)
+    ]
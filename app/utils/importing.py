@@ -0,0 +1,294 @@
+"""Bulk import of employees from files
+
+Files are streamed in chunks of ``chunk_size`` rows: CSV, newline-delimited
+JSON (``.ndjson``/``.jsonl``) and Parquet (needs the ``parquet`` extra).
+Each chunk is validated with vectorized pandas operations, inserted with a
+single multi-row INSERT and committed together with the import checkpoint,
+so that an interrupted import resumes after the last committed chunk.
+With partitioned storage the rows of a chunk are committed to their
+partitions first, and are inserted again if the import stops before the
+checkpoint is committed.
+
+Rejected rows are skipped, and written with their row number and the reason
+of the rejection to a ``<file>.rejects.csv`` file next to the source, unless
+``strict`` is set. A resumed import first drops the rejects of the rows past
+the checkpoint, written by the chunk that was not committed.
+"""
+import os
+import time
+from collections import Counter
+from typing import Iterator, List, Optional
+
+import pandas as pd
+import sqlalchemy as sa
+
+from app.extensions.database import db
+from app.extensions.partitions import employee_partitions
+from app.models import Employee, EmployeeChange, ImportCheckpoint
+from app.models.departments import add_headcounts
+from app.models.hires import add_hires
+from app.utils.changelog import record_changes
+from app.utils.departments import department_names
+from app.utils.progress import Reporter
+from app.utils.salary_index import salary_index
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pq = None
+
+COLUMNS = ("name", "department", "salary", "hire_date")
+FORMATS = ("csv", "ndjson", "parquet")
+NAME_MAX_LENGTH = Employee.name.type.length
+
+
+class ImportFailed(Exception):
+    """Raised when a file cannot be imported"""
+
+
+def detect_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".ndjson", ".jsonl"):
+        return "ndjson"
+    if extension in (".parquet", ".pq"):
+        return "parquet"
+    return "csv"
+
+
+def check_columns(columns) -> None:
+    """Raise ImportFailed if one of ``COLUMNS`` is not in ``columns``"""
+    missing = [column for column in COLUMNS if column not in columns]
+    if missing:
+        raise ImportFailed(f"Missing columns: {', '.join(missing)}")
+
+
+def read_chunks(
+    path: str, file_format: str, chunk_size: int
+) -> Iterator[pd.DataFrame]:
+    """Stream a file as data frames of at most ``chunk_size`` rows"""
+    if file_format == "csv":
+        check_columns(pd.read_csv(path, nrows=0).columns)
+        yield from pd.read_csv(
+            path, chunksize=chunk_size, usecols=list(COLUMNS), dtype=str
+        )
+    elif file_format == "ndjson":
+        yield from pd.read_json(path, lines=True, chunksize=chunk_size, dtype=False)
+    elif file_format == "parquet":
+        if pq is None:
+            raise ImportFailed("Reading Parquet files needs pyarrow")
+        parquet = pq.ParquetFile(path)
+        check_columns(parquet.schema_arrow.names)
+        for batch in parquet.iter_batches(
+            batch_size=chunk_size, columns=list(COLUMNS)
+        ):
+            yield batch.to_pandas()
+    else:
+        raise ImportFailed(f"Unknown format: {file_format}")
+
+
+def validate_chunk(
+    chunk: pd.DataFrame, departments, min_salary: float, max_salary: float
+) -> pd.DataFrame:
+    """Normalize the columns of a chunk and find out the invalid rows
+
+    Returns:
+        DataFrame: The chunk with a ``reason`` column, None for valid rows.
+    """
+    check_columns(chunk.columns)
+    frame = pd.DataFrame(index=chunk.index)
+    frame["name"] = chunk["name"].astype("string").str.strip()
+    frame["department"] = chunk["department"].astype("string").str.strip()
+    frame["salary"] = pd.to_numeric(chunk["salary"], errors="coerce")
+    frame["hire_date"] = pd.to_datetime(
+        chunk["hire_date"], errors="coerce", format="ISO8601"
+    )
+    if getattr(frame["hire_date"].dt, "tz", None) is not None:
+        frame["hire_date"] = frame["hire_date"].dt.tz_convert(None)
+
+    reason = pd.Series(None, index=chunk.index, dtype="object")
+    checks = (
+        (frame["hire_date"].isna(), "invalid hire_date"),
+        (~frame["salary"].between(min_salary, max_salary), "salary out of bounds"),
+        (~frame["department"].isin(departments).fillna(False), "unknown department"),
+        (
+            frame["name"].isna()
+            | (frame["name"].str.len() == 0)
+            | (frame["name"].str.len() > NAME_MAX_LENGTH),
+            "invalid name",
+        ),
+    )
+    # the last failing check wins, they are listed from the least specific
+    for invalid, message in checks:
+        reason[invalid.fillna(True).astype(bool)] = message
+    frame["reason"] = reason
+    return frame
+
+
+def _fingerprint(path: str) -> str:
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _drop_rejects(path: str, rows: int) -> None:
+    """Drop the rejects of the rows from ``rows`` on"""
+    rejects = pd.read_csv(path, dtype=str)
+    keep = rejects["row"].astype(int) < rows
+    if not keep.all():
+        rejects[keep].to_csv(path, index=False)
+
+
+def _insert(frame: pd.DataFrame) -> List[int]:
+    rows = [
+        {
+            "name": name,
+            "department": department,
+            "salary": float(salary),
+            "hire_date": hire_date.to_pydatetime(),
+        }
+        for name, department, salary, hire_date in zip(
+            frame["name"], frame["department"], frame["salary"], frame["hire_date"]
+        )
+    ]
+    if not rows:
+        return []
+    if employee_partitions.enabled:
+        return employee_partitions.insert_many(rows)
+    return list(
+        db.session.execute(sa.insert(Employee).returning(Employee.id), rows).scalars()
+    )
+
+
+def import_employees(
+    path: str,
+    file_format: Optional[str] = None,
+    chunk_size: int = 10000,
+    min_salary: float = 0,
+    max_salary: float = float("inf"),
+    strict: bool = False,
+    restart: bool = False,
+    report: Optional[Reporter] = None,
+) -> dict:
+    """Import employees from a file, resuming an interrupted import
+
+    Args:
+        path: str: The file to import.
+        file_format: str: One of ``FORMATS``, guessed from the extension.
+        chunk_size: int: Number of rows validated and committed together.
+        min_salary: float: Lowest valid salary.
+        max_salary: float: Highest valid salary.
+        strict: bool: Fail on the first invalid row instead of skipping it.
+        restart: bool: Ignore the progress of a previous import of the file.
+        report: Callable: Called with progress messages.
+
+    Returns:
+        dict: The numbers of rows inserted and rejected, and the throughput.
+    """
+    file_format = file_format or detect_format(path)
+    source = os.path.abspath(path)
+    fingerprint = _fingerprint(path)
+    total = None
+    if file_format == "parquet" and pq is not None:
+        total = pq.ParquetFile(path).metadata.num_rows
+
+    checkpoint = db.session.execute(
+        sa.select(ImportCheckpoint).filter_by(source=source)
+    ).scalar_one_or_none()
+    if checkpoint is None:
+        checkpoint = ImportCheckpoint(source=source)
+        db.session.add(checkpoint)
+    if restart or checkpoint.fingerprint != fingerprint:
+        checkpoint.fingerprint = fingerprint
+        checkpoint.rows = checkpoint.inserted = checkpoint.rejected = 0
+        checkpoint.completed = False
+    db.session.commit()
+    if checkpoint.completed:
+        return {
+            "inserted": 0,
+            "rejected": 0,
+            "skipped": checkpoint.rows,
+            "seconds": 0.0,
+            "rows_per_second": 0.0,
+        }
+
+    rejects_path = f"{path}.rejects.csv"
+    if os.path.exists(rejects_path):
+        if checkpoint.rows == 0:
+            os.remove(rejects_path)
+        else:
+            _drop_rejects(rejects_path, checkpoint.rows)
+    departments = list(department_names.get())
+    skipped = done = checkpoint.rows
+    inserted = rejected = position = 0
+    touched = set()
+    started = time.perf_counter()
+
+    for chunk in read_chunks(path, file_format, chunk_size):
+        end = position + len(chunk)
+        if end <= done:
+            position = end
+            continue
+        # rows are numbered from the start of the file
+        chunk.index = pd.RangeIndex(position, end)
+        if position < done:
+            chunk = chunk.iloc[done - position :]
+        position = end
+
+        frame = validate_chunk(chunk, departments, min_salary, max_salary)
+        invalid = frame["reason"].notna()
+        if invalid.any():
+            if strict:
+                row = frame.index[invalid][0]
+                raise ImportFailed(f"Row {row}: {frame['reason'][row]}")
+            rejects = chunk[invalid].assign(reason=frame["reason"][invalid])
+            rejects.to_csv(
+                rejects_path,
+                mode="a",
+                header=not os.path.exists(rejects_path),
+                index_label="row",
+            )
+        valid = frame[~invalid]
+
+        ids = _insert(valid)
+        record_changes(EmployeeChange.INSERT, ids)
+        counts = Counter(valid["department"])
+        add_headcounts(db.session.connection(), counts)
+        add_hires(
+            db.session.connection(),
+            Counter(
+                (department, int(year), int(month))
+                for department, year, month in zip(
+                    valid["department"],
+                    valid["hire_date"].dt.year,
+                    valid["hire_date"].dt.month,
+                )
+            ),
+        )
+        touched.update(counts)
+        checkpoint.rows = position
+        checkpoint.inserted += len(ids)
+        checkpoint.rejected += int(invalid.sum())
+        db.session.commit()
+
+        inserted += len(ids)
+        rejected += int(invalid.sum())
+        if report:
+            elapsed = time.perf_counter() - started
+            report(
+                f"Imported {position} rows"
+                f" ({(inserted + rejected) / elapsed:.0f} rows/s),"
+                f" {rejected} rejected",
+                position / total if total else 0.0,
+            )
+
+    checkpoint.completed = True
+    db.session.commit()
+    salary_index.invalidate(touched)
+
+    seconds = time.perf_counter() - started
+    return {
+        "inserted": inserted,
+        "rejected": rejected,
+        "skipped": skipped,
+        "seconds": seconds,
+        "rows_per_second": (inserted + rejected) / seconds if seconds else 0.0,
+    }
@@ -1,15 +1,54 @@
+from urllib.parse import urlencode
+
+import sqlalchemy as sa
 from flask import request
-from flask_sqlalchemy.pagination import QueryPagination
+from flask_sqlalchemy.pagination import Pagination
+
+
+def _page_url(page: int) -> str:
+    # keep the other query arguments (filters, search terms...) of the request
+    args = request.args.copy()
+    args["page"] = page
+    return request.base_url + "?" + urlencode(list(args.items(multi=True)))
 
 
-def get_pagination(collection: QueryPagination) -> dict:
-    base_url = request.base_url
+def get_pagination(collection: Pagination) -> dict:
     pagination_data = {
-        "prev_url": base_url + f"?page={collection.prev_num}" if collection.has_prev else None,
-        "current_url": base_url + f"?page={collection.page}",
-        "next_url": base_url + f"?page={collection.next_num}" if collection.has_next else None,
+        "prev_url": _page_url(collection.prev_num) if collection.has_prev else None,
+        "current_url": _page_url(collection.page),
+        "next_url": _page_url(collection.next_num) if collection.has_next else None,
         "per_page": collection.per_page,
         "total_pages": collection.pages,
         "total_items": collection.total,
     }
     return pagination_data
+
+
+class ListPagination(Pagination):
+    """Pagination over items computed beforehand, e.g. merged from several
+    databases"""
+
+    def _query_items(self) -> list:
+        return self._query_args["items"]
+
+    def _query_count(self) -> int:
+        return self._query_args["total"]
+
+
+class RowPagination(Pagination):
+    """Pagination over a Core select, whose items are read-only row mappings
+
+    No ORM instance is built nor added to the identity map, the rows go
+    straight to serialization. Takes ``select`` and ``session`` arguments.
+    """
+
+    def _query_items(self) -> list:
+        select = self._query_args["select"]
+        select = select.limit(self.per_page).offset(self._query_offset)
+        return self._query_args["session"].execute(select).mappings().all()
+
+    def _query_count(self) -> int:
+        sub = self._query_args["select"].order_by(None).subquery()
+        return self._query_args["session"].execute(
+            sa.select(sa.func.count()).select_from(sub)
+        ).scalar()
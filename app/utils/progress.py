@@ -0,0 +1,13 @@
+"""Progress reporting of long running tasks
+
+Commands pass a ``Reporter`` to the tasks (imports, snapshots, training...),
+jobs one that updates the progress of the job.
+"""
+from typing import Callable
+
+# Called with a message and the fraction of the work done
+Reporter = Callable[[str, float], None]
+
+
+def ignore(message: str, progress: float) -> None:
+    """A reporter dropping the progress"""
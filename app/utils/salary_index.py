@@ -0,0 +1,189 @@
+"""In-memory sorted salary index per department
+
+Each department's salaries are kept in a sorted NumPy array that is built
+lazily from the ``employees`` table on first use and then maintained
+incrementally by the write handlers. Arrays are never mutated in place:
+writers swap in a new array under a lock, so readers need no locking.
+
+Writes of other processes (other workers, CLI imports) are noticed through
+the change log: reads compare its latest sequence with the one the arrays
+are in sync with, and drop the arrays when a change moved the log that the
+write handlers of this process have not acknowledged.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+import sqlalchemy as sa
+
+from app.extensions.database import db
+from app.extensions.partitions import employee_partitions
+from app.models import Employee, EmployeeChange
+
+PERCENTILES = (10, 25, 50, 75, 90, 95, 99)
+# Past this many changes to look through, the arrays are dropped right away
+MAX_UNSEEN_CHANGES = 1000
+
+
+class SalaryIndex:
+    """Sorted salary arrays keyed by department"""
+
+    def __init__(self):
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        # bumped on every write so that a build racing with a write is not kept
+        self._generation = 0
+        # the change log sequence the arrays are in sync with
+        self._sequence = 0
+        # sequences of changes already applied by the write handlers
+        self._acknowledged: Set[int] = set()
+        self.builds = 0
+
+    def _build(self, department: str) -> np.ndarray:
+        statement = (
+            db.select(Employee.salary)
+            .filter_by(department=department)
+            .order_by(Employee.salary)
+        )
+        if employee_partitions.enabled:
+            rows = employee_partitions.execute(
+                employee_partitions.partition(department), statement
+            )
+            salaries = (row["salary"] for row in rows)
+        else:
+            salaries = db.session.execute(statement).scalars()
+        self.builds += 1
+        return np.fromiter(salaries, dtype=np.float64)
+
+    def _sync(self) -> None:
+        """Drop the arrays if the change log moved past unacknowledged changes"""
+        since = self._sequence
+        sequence = db.session.execute(
+            sa.select(sa.func.max(EmployeeChange.sequence))
+        ).scalar() or 0
+        if sequence == since:
+            return
+        # a lower sequence means the log was replaced, by a restore say
+        stale = sequence < since
+        if not stale and self._arrays:
+            unseen = db.session.execute(
+                sa.select(EmployeeChange.sequence)
+                .where(EmployeeChange.sequence > since)
+                .where(EmployeeChange.sequence <= sequence)
+                .limit(MAX_UNSEEN_CHANGES + 1)
+            ).scalars().all()
+            stale = len(unseen) > MAX_UNSEEN_CHANGES
+            stale = stale or not self._acknowledged.issuperset(unseen)
+        with self._lock:
+            if self._sequence != since:
+                # synced by another thread meanwhile
+                return
+            if stale:
+                self._generation += 1
+                self._arrays.clear()
+            self._sequence = sequence
+            self._acknowledged = {s for s in self._acknowledged if s > sequence}
+
+    def acknowledge(self, sequences: Optional[Iterable[int]]) -> None:
+        """Mark changes as applied to the arrays by a write handler
+
+        To be called once the write is committed and applied. Unknown
+        sequences (None) are not acknowledged, and the next read rebuilds.
+        """
+        if sequences is None:
+            return
+        with self._lock:
+            self._acknowledged.update(s for s in sequences if s > self._sequence)
+
+    def get(self, department: str) -> np.ndarray:
+        """Get the sorted salaries of a department, building them if needed"""
+        self._sync()
+        salaries = self._arrays.get(department)
+        if salaries is None:
+            generation = self._generation
+            salaries = self._build(department)
+            with self._lock:
+                if generation == self._generation:
+                    salaries = self._arrays.setdefault(department, salaries)
+        return salaries
+
+    def insert(self, department: str, salary: float) -> None:
+        """Insert a salary keeping the department array sorted"""
+        with self._lock:
+            self._generation += 1
+            salaries = self._arrays.get(department)
+            if salaries is None:
+                # not built yet, the lazy build will pick the row up
+                return
+            position = np.searchsorted(salaries, salary)
+            self._arrays[department] = np.insert(salaries, position, salary)
+
+    def remove(self, department: str, salary: float) -> None:
+        """Remove one occurrence of a salary from the department array"""
+        with self._lock:
+            self._generation += 1
+            salaries = self._arrays.get(department)
+            if salaries is None:
+                return
+            position = np.searchsorted(salaries, salary)
+            if position < len(salaries) and salaries[position] == salary:
+                self._arrays[department] = np.delete(salaries, position)
+            else:
+                # out of sync with the table, rebuild on next read
+                del self._arrays[department]
+
+    def invalidate(self, departments: Optional[Iterable[str]] = None) -> None:
+        """Drop the arrays of the given departments, or of all of them"""
+        with self._lock:
+            self._generation += 1
+            if departments is None:
+                self._arrays.clear()
+                return
+            for department in departments:
+                self._arrays.pop(department, None)
+
+    def percentiles(
+        self, department: str, percents: Iterable[float] = PERCENTILES
+    ) -> Dict[str, float]:
+        """Percentiles of the salaries of a department, see ``percentiles``"""
+        return percentiles(self.get(department), percents)
+
+    def histogram(self, department: str, bins: int = 10) -> List[dict]:
+        """Histogram of the salaries of a department, see ``histogram``"""
+        return histogram(self.get(department), bins)
+
+
+def percentiles(
+    salaries: np.ndarray, percents: Iterable[float] = PERCENTILES
+) -> Dict[str, float]:
+    """Linearly interpolated percentiles, O(1) each on the sorted array"""
+    if not len(salaries):
+        return {}
+    percents = np.asarray(tuple(percents), dtype=np.float64)
+    positions = (len(salaries) - 1) * percents / 100
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.ceil(positions).astype(np.intp)
+    values = salaries[lower] + (salaries[upper] - salaries[lower]) * (
+        positions - lower
+    )
+    return {f"p{p:g}": float(v) for p, v in zip(percents, values)}
+
+
+def histogram(salaries: np.ndarray, bins: int = 10) -> List[dict]:
+    """Equal-width histogram between the lowest and highest salary
+
+    Bin edges are located with binary searches on the sorted array, so the
+    cost does not depend on the number of employees. As with
+    ``numpy.histogram`` every bin is half-open except the last one.
+    """
+    if not len(salaries):
+        return []
+    edges = np.linspace(salaries[0], salaries[-1], bins + 1)
+    bounds = np.searchsorted(salaries, edges[1:-1], side="left")
+    counts = np.diff(np.concatenate(([0], bounds, [len(salaries)])))
+    return [
+        {"lower": float(lower), "upper": float(upper), "count": int(count)}
+        for lower, upper, count in zip(edges[:-1], edges[1:], counts)
+    ]
+
+salary_index = SalaryIndex()
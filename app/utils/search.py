@@ -0,0 +1,125 @@
+"""Employee name search
+
+On SQLite, names are matched through the ``employees_fts`` FTS5 index and
+ranked with bm25. Other databases (or SQLite databases created before the
+index existed) fall back to ``LIKE`` matching on the indexed ``name`` column.
+
+``search_partition`` searches one employee partition, and adds the
+``SORT_KEYS`` columns its rows are sorted on, so that the results of every
+partition can be merged. bm25 ranks are computed per partition.
+"""
+import re
+from typing import List, Optional, Sequence
+
+import sqlalchemy as sa
+
+from app.extensions.database import db
+from app.models.employees import Employee, SEARCH_INDEX_TABLE
+
+_search_index = sa.table(SEARCH_INDEX_TABLE, sa.column("rowid"), sa.column("rank"))
+_engines_with_search_index = set()
+
+# columns the rows of search_partition are sorted on
+SORT_KEYS = ("sort_rank", "sort_name", "id")
+
+
+def tokenize(query: str) -> List[str]:
+    """Split a search query into word tokens"""
+    return re.findall(r"\w+", query.lower())
+
+
+def has_search_index(engine: Optional[sa.Engine] = None) -> bool:
+    """Whether a database, the current one by default, has the full-text
+    search index"""
+    engine = engine or db.engine
+    if engine.url in _engines_with_search_index:
+        return True
+    if engine.dialect.name != "sqlite":
+        return False
+    with engine.connect() as connection:
+        found = connection.execute(
+            sa.text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+            ),
+            {"name": SEARCH_INDEX_TABLE},
+        ).scalar()
+    if found:
+        _engines_with_search_index.add(engine.url)
+    return bool(found)
+
+
+def _full_text_query(
+    tokens: List[str], columns: Sequence, sort_columns: bool = False
+) -> sa.Select:
+    # every token has to match the start of a word of the name
+    match = " ".join(f'"{token}"*' for token in tokens)
+    rank = _search_index.c.rank
+    statement = sa.select(*columns)
+    if sort_columns:
+        statement = statement.add_columns(
+            rank.label("sort_rank"), sa.literal("").label("sort_name")
+        )
+    return (
+        statement.join(_search_index, _search_index.c.rowid == Employee.id)
+        .where(sa.text(f"{SEARCH_INDEX_TABLE} MATCH :match").bindparams(match=match))
+        .order_by(rank, Employee.id)
+    )
+
+
+def _fallback_query(
+    query: str, tokens: List[str], columns: Sequence, sort_columns: bool = False
+) -> sa.Select:
+    conditions = [
+        sa.or_(Employee.name.ilike(f"{token}%"), Employee.name.ilike(f"% {token}%"))
+        for token in tokens
+    ]
+    # names starting with the whole query rank first
+    starts_with_query = sa.case((Employee.name.ilike(f"{query}%"), 0), else_=1)
+    statement = sa.select(*columns)
+    if sort_columns:
+        statement = statement.add_columns(
+            starts_with_query.label("sort_rank"), Employee.name.label("sort_name")
+        )
+    return statement.where(*conditions).order_by(
+        starts_with_query, Employee.name, Employee.id
+    )
+
+
+def search_employees(query: str) -> sa.Select:
+    """Build a ranked select of the employees whose name matches the query
+
+    Args:
+        query: str: Words to look for, each one matched as a prefix.
+
+    Returns:
+        Select: The ranked employees select, ready to be paginated.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return sa.select(Employee).where(sa.false())
+    if has_search_index():
+        return _full_text_query(tokens, [Employee])
+    return _fallback_query(query.strip(), tokens, [Employee])
+
+
+def search_partition(query: str, columns: Sequence, engine: sa.Engine) -> sa.Select:
+    """Build the ranked select of the matching employees of a partition
+
+    Args:
+        query: str: Words to look for, each one matched as a prefix.
+        columns: The columns to select.
+        engine: The engine of the partition.
+
+    Returns:
+        Select: The select of the columns and of the ``SORT_KEYS``.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return sa.select(
+            *columns,
+            sa.literal(0).label("sort_rank"),
+            sa.literal("").label("sort_name"),
+        ).where(sa.false())
+    if has_search_index(engine):
+        return _full_text_query(tokens, columns, sort_columns=True)
+    return _fallback_query(query.strip(), tokens, columns, sort_columns=True)
@@ -0,0 +1,336 @@
+"""Database snapshots
+
+Two snapshot formats, both optionally gzip-compressed:
+
+- ``backup`` (SQLite only): a copy of the database file made with the SQLite
+  online backup API. Pages are copied ``pages`` at a time, so that other
+  connections keep reading the database in between, and restoring copies the
+  pages back the same way. This is the fastest way to clone a database.
+- ``dump`` (any backend): newline-delimited JSON, a header line listing the
+  tables, then for every table a line with its columns followed by one line
+  per row. Rows are streamed in both directions and restored with
+  multi-row INSERTs of ``batch_size`` rows, in a single transaction.
+
+Only the tables of the models are dumped: employee partitions living in
+other databases are not part of a snapshot.
+"""
+import datetime as dt
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from typing import IO, Callable, Dict, Iterator, List, Optional
+
+import sqlalchemy as sa
+
+from app.extensions.database import db
+from app.utils.progress import Reporter, ignore
+
+FORMATS = ("backup", "dump")
+DUMP_FORMAT = "employee-api-dump"
+DUMP_VERSION = 1
+SQLITE_HEADER = b"SQLite format 3\x00"
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class SnapshotFailed(Exception):
+    """Raised when a snapshot cannot be taken or restored"""
+
+
+def _sqlite(engine: sa.Engine) -> bool:
+    return engine.dialect.name == "sqlite"
+
+
+def _open(path: str, mode: str, compress: bool = False) -> IO:
+    if compress:
+        return gzip.open(path, mode, compresslevel=1)
+    return open(path, mode)
+
+
+def _is_gzip(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+def detect_format(path: str) -> str:
+    with _open(path, "rb", compress=_is_gzip(path)) as f:
+        header = f.read(len(SQLITE_HEADER))
+    return "backup" if header == SQLITE_HEADER else "dump"
+
+
+def snapshot(
+    engine: sa.Engine,
+    path: str,
+    snapshot_format: Optional[str] = None,
+    compress: bool = False,
+    pages: int = 1024,
+    report: Optional[Reporter] = None,
+) -> dict:
+    """Take a snapshot of a database
+
+    Args:
+        engine: The engine of the database.
+        path: str: Where to write the snapshot, replaced once complete.
+        snapshot_format: str: ``backup`` (the default on SQLite) or ``dump``.
+        compress: bool: Compress the snapshot with gzip.
+        pages: int: Pages copied at a time by the SQLite backup.
+        report: Callable: Called with progress messages.
+
+    Returns:
+        dict: The format, the size in bytes and the duration of the snapshot.
+    """
+    report = report or ignore
+    snapshot_format = snapshot_format or ("backup" if _sqlite(engine) else "dump")
+    if snapshot_format == "backup" and not _sqlite(engine):
+        raise SnapshotFailed("backup snapshots need a SQLite database, use dump")
+
+    started = time.perf_counter()
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        if snapshot_format == "backup":
+            _backup(engine, tmp_path, compress, pages, report)
+        else:
+            with _open(tmp_path, "wt", compress) as f:
+                _dump(engine, f, report)
+        # a snapshot only appears under its name once complete
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    seconds = time.perf_counter() - started
+    report(f"Wrote {snapshot_format} snapshot {path} in {seconds:.2f}s", 1.0)
+    return {
+        "format": snapshot_format,
+        "bytes": os.path.getsize(path),
+        "seconds": seconds,
+    }
+
+
+def restore(
+    engine: sa.Engine,
+    path: str,
+    pages: int = 1024,
+    batch_size: int = 10000,
+    report: Optional[Reporter] = None,
+) -> dict:
+    """Replace the contents of a database with a snapshot
+
+    Args:
+        engine: The engine of the database.
+        path: str: The snapshot, in either format, compressed or not.
+        pages: int: Pages copied at a time by the SQLite backup.
+        batch_size: int: Rows inserted at a time from a dump.
+        report: Callable: Called with progress messages.
+
+    Returns:
+        dict: The format and the duration of the restore, and the number of
+            rows restored from a dump.
+    """
+    report = report or ignore
+    started = time.perf_counter()
+    compressed = _is_gzip(path)
+    snapshot_format = detect_format(path)
+    rows = None
+    if snapshot_format == "backup":
+        if not _sqlite(engine):
+            raise SnapshotFailed("backup snapshots can only be restored to SQLite")
+        _restore_backup(engine, path, compressed, pages, report)
+    else:
+        with _open(path, "rt", compressed) as f:
+            rows = _load(engine, f, batch_size, report)
+    # pooled connections may hold state of the replaced database
+    engine.dispose()
+    seconds = time.perf_counter() - started
+    report(f"Restored {snapshot_format} snapshot {path} in {seconds:.2f}s", 1.0)
+    return {"format": snapshot_format, "rows": rows, "seconds": seconds}
+
+
+def _progress(report: Reporter, action: str) -> Callable[[int, int, int], None]:
+    def progress(status: int, remaining: int, total: int) -> None:
+        done = (total - remaining) / total if total else 1.0
+        report(f"{action} {total - remaining}/{total} pages", done)
+
+    return progress
+
+
+def _backup(
+    engine: sa.Engine, path: str, compress: bool, pages: int, report: Reporter
+) -> None:
+    target_path = f"{path}.db" if compress else path
+    target = sqlite3.connect(target_path)
+    try:
+        with engine.connect() as connection:
+            connection.connection.driver_connection.backup(
+                target, pages=pages, progress=_progress(report, "Copied")
+            )
+    finally:
+        target.close()
+    if compress:
+        with open(target_path, "rb") as source, gzip.open(
+            path, "wb", compresslevel=1
+        ) as f:
+            shutil.copyfileobj(source, f, 1024 * 1024)
+        os.remove(target_path)
+
+
+def _restore_backup(
+    engine: sa.Engine, path: str, compressed: bool, pages: int, report: Reporter
+) -> None:
+    source_path = path
+    if compressed:
+        fd, source_path = tempfile.mkstemp(suffix=".db")
+        with os.fdopen(fd, "wb") as f, gzip.open(path, "rb") as source:
+            shutil.copyfileobj(source, f, 1024 * 1024)
+    try:
+        source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+        try:
+            with engine.connect() as connection:
+                source.backup(
+                    connection.connection.driver_connection,
+                    pages=pages,
+                    progress=_progress(report, "Restored"),
+                )
+        finally:
+            source.close()
+    finally:
+        if compressed:
+            os.remove(source_path)
+
+
+def _tables(engine: sa.Engine) -> List[sa.Table]:
+    """The tables of the models present in the database, parents first"""
+    inspector = sa.inspect(engine)
+    return [
+        table for table in db.metadata.sorted_tables if inspector.has_table(table.name)
+    ]
+
+
+def _encode(value):
+    if isinstance(value, (dt.datetime, dt.date, dt.time)):
+        return value.isoformat()
+    return value
+
+
+def _decoder(column: sa.Column) -> Callable:
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = None
+    if python_type in (dt.datetime, dt.date, dt.time):
+        parse = python_type.fromisoformat
+        return lambda value: None if value is None else parse(value)
+    return lambda value: value
+
+
+def _dump(engine: sa.Engine, f: IO, report: Reporter) -> None:
+    tables = _tables(engine)
+    header = {
+        "format": DUMP_FORMAT,
+        "version": DUMP_VERSION,
+        "tables": [table.name for table in tables],
+    }
+    f.write(json.dumps(header) + "\n")
+    # one transaction, so that the tables are consistent with each other
+    with engine.connect() as connection, connection.begin():
+        for i, table in enumerate(tables):
+            columns = [column.name for column in table.columns]
+            f.write(json.dumps({"table": table.name, "columns": columns}) + "\n")
+            result = connection.execution_options(
+                stream_results=True, yield_per=10000
+            ).execute(sa.select(table))
+            count = 0
+            for row in result:
+                f.write(json.dumps([_encode(value) for value in row]) + "\n")
+                count += 1
+            report(f"Dumped {count} rows of {table.name}", (i + 1) / len(tables))
+
+
+def _batches(lines: Iterator[str], size: int) -> Iterator[List[list]]:
+    batch = []
+    for line in lines:
+        batch.append(json.loads(line))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _read_sections(f: IO) -> Iterator[tuple]:
+    """The table and columns of every section of a dump, with an iterator
+    over the lines of its rows"""
+    pending = None
+
+    def rows() -> Iterator[str]:
+        nonlocal pending
+        for line in f:
+            if line.startswith("{"):
+                pending = json.loads(line)
+                return
+            yield line
+
+    line = f.readline()
+    pending = json.loads(line) if line else None
+    while pending is not None:
+        section, pending = pending, None
+        yield section["table"], section["columns"], rows()
+
+
+def _load(engine: sa.Engine, f: IO, batch_size: int, report: Reporter) -> int:
+    header = json.loads(f.readline() or "{}")
+    if header.get("format") != DUMP_FORMAT:
+        raise SnapshotFailed("Not a snapshot of this application")
+    if header.get("version") != DUMP_VERSION:
+        raise SnapshotFailed(f"Unsupported dump version {header.get('version')}")
+
+    db.metadata.create_all(engine)
+    tables: Dict[str, sa.Table] = db.metadata.tables
+    unknown = set(header["tables"]) - set(tables)
+    if unknown:
+        raise SnapshotFailed(f"Unknown tables: {', '.join(sorted(unknown))}")
+    total = 0
+    with engine.begin() as connection:
+        for table in reversed(_tables(engine)):
+            connection.execute(table.delete())
+        for i, (name, columns, lines) in enumerate(_read_sections(f)):
+            table = tables[name]
+            decoders = [_decoder(table.columns[column]) for column in columns]
+            count = 0
+            for batch in _batches(lines, batch_size):
+                connection.execute(
+                    table.insert(),
+                    [
+                        {
+                            column: decode(value)
+                            for column, decode, value in zip(columns, decoders, row)
+                        }
+                        for row in batch
+                    ],
+                )
+                count += len(batch)
+            total += count
+            report(
+                f"Restored {count} rows of {name}", (i + 1) / len(header["tables"])
+            )
+        if engine.dialect.name == "postgresql":
+            _reset_sequences(connection, header["tables"])
+    return total
+
+
+def _reset_sequences(connection: sa.Connection, names: List[str]) -> None:
+    """Restart the id sequences after the restored ids"""
+    for name in names:
+        column = db.metadata.tables[name].autoincrement_column
+        if column is None:
+            continue
+        connection.execute(
+            sa.text(
+                f"SELECT setval(pg_get_serial_sequence('{name}', '{column.name}'),"
+                f" coalesce(max({column.name}), 0) + 1, false) FROM {name}"
+            )
+        )
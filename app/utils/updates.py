@@ -0,0 +1,117 @@
+"""Versioned items and partial updates
+
+Items carry a ``version`` column bumped on every update, which is also their
+ETag (``"<version>"``): GET answers ``304`` to an ``If-None-Match`` holding
+it, and PUT, PATCH and DELETE require an ``If-Match`` holding it (``428``
+without, ``412`` when the item has another version, ``*`` matching any).
+
+``patch_item`` writes only the supplied columns with a single
+``UPDATE ... WHERE id = ?``, without loading the row first, the expected
+version being checked in the same statement.
+"""
+from http import HTTPStatus as status
+from typing import Any, Mapping, Optional, Set
+
+import sqlalchemy as sa
+from flask import Response, abort, request
+
+from app.extensions.database import db
+
+
+def get_expected_versions() -> Optional[Set[int]]:
+    """The item versions allowed by the ``If-Match`` header, None for any
+
+    Tags which are not versions never match.
+    """
+    if_match = request.if_match
+    if not if_match:
+        abort(status.PRECONDITION_REQUIRED, "If-Match must hold the ETag of the item")
+    if if_match.star_tag:
+        return None
+    return {int(tag) for tag in if_match.as_set() if tag.isdigit()}
+
+
+def check_version(version: int, expected: Optional[Set[int]]) -> None:
+    """Abort with 412 unless the version of an item is expected
+
+    Args:
+        version: int: The current version of the item.
+        expected: set: The allowed versions (``get_expected_versions``).
+    """
+    if expected is not None and version not in expected:
+        abort(status.PRECONDITION_FAILED)
+
+
+def version_etag(version: int) -> dict:
+    """Response headers advertising the version of an item"""
+    return {"ETag": f'"{version}"'}
+
+
+def versioned(item, version: int):
+    """The response of a view returning an item, with its version as ETag
+
+    GET and HEAD requests whose ``If-None-Match`` holds the version get an
+    empty ``304`` response.
+    """
+    headers = version_etag(version)
+    if request.method in ("GET", "HEAD") and request.if_none_match.contains(
+        str(version)
+    ):
+        return Response(status=status.NOT_MODIFIED, headers=headers)
+    return item, headers
+
+
+def patch_item(
+    model,
+    item_id: Any,
+    data: Mapping[str, Any],
+    expected_versions: Optional[Set[int]],
+) -> Mapping[str, Any]:
+    """Update the supplied columns of an item
+
+    Args:
+        model: The model class of the item.
+        item_id: The primary key of the item.
+        data: dict: The new values of the columns to update.
+        expected_versions: set: The versions the item may have
+            (``get_expected_versions``), None for any.
+
+    Returns:
+        Mapping: The updated row.
+    """
+    if not data:
+        abort(status.BAD_REQUEST, "No field to update")
+    table = model.__table__
+
+    statement = (
+        sa.update(table)
+        .where(table.c.id == item_id)
+        .values(**data, version=table.c.version + 1)
+    )
+    if expected_versions is not None:
+        statement = statement.where(table.c.version.in_(expected_versions))
+
+    returning = db.engine.dialect.update_returning
+    if returning:
+        statement = statement.returning(*table.c)
+    result = db.session.execute(statement)
+    row = result.mappings().first() if returning else None
+    if not returning and result.rowcount:
+        row = (
+            db.session.execute(sa.select(table).where(table.c.id == item_id))
+            .mappings()
+            .first()
+        )
+
+    if row is None:
+        # only failed updates pay for a read, to tell the two failures apart
+        exists = db.session.execute(
+            sa.select(table.c.id).where(table.c.id == item_id)
+        ).first()
+        db.session.rollback()
+        if exists:
+            abort(status.PRECONDITION_FAILED)
+        abort(status.NOT_FOUND)
+
+    db.session.commit()
+    return row
@@ -3,11 +3,15 @@
 from . import members
 from . import teams
 from . import employees
+from . import jobs
+from . import batch
 
 MODULES = (
     teams,
     members,
     employees,
+    jobs,
+    batch,
 )
 
 
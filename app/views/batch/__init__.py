@@ -0,0 +1,3 @@
+"""Batch views"""
+
+from .resources import blp  # noqa
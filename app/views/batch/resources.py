@@ -0,0 +1,108 @@
+from http import HTTPStatus as status
+
+from flask import current_app, g, request
+from flask.views import MethodView
+from werkzeug.test import EnvironBuilder
+
+from app.extensions.api import Blueprint
+from .schemas import BatchRequestSchema, BatchResponseSchema
+
+blp = Blueprint(
+    "Batch",
+    __name__,
+    url_prefix="/batch",
+    description="Several requests in one round trip",
+)
+
+# headers of the batch request not passed on to its sub-requests
+BATCH_ONLY_HEADERS = {
+    "content-length",
+    "content-type",
+    # sub-response bodies are embedded in the batch response, uncompressed
+    "accept-encoding",
+    "if-match",
+    "if-none-match",
+    "if-modified-since",
+    "if-unmodified-since",
+}
+# headers of the sub-responses left out of the batch response
+RESPONSE_ONLY_HEADERS = {"content-length", "content-encoding", "set-cookie"}
+
+
+def _dispatch(index: int, sub_request: dict) -> dict:
+    """Run a sub-request through the whole request pipeline (hooks, admission
+    control, error handlers) in its own application context"""
+    app = current_app._get_current_object()
+    id_header = app.config.get("LOG_REQUEST_ID_HEADER", "X-Request-ID")
+    headers = {
+        name: value
+        for name, value in request.headers.items()
+        if name.lower() not in BATCH_ONLY_HEADERS
+    }
+    if g.get("request_id"):
+        headers[id_header] = f"{g.request_id}.{index}"
+    headers.update(sub_request["headers"])
+    path, _, query_string = sub_request["path"].partition("?")
+    builder = EnvironBuilder(
+        path=path,
+        base_url=request.url_root,
+        query_string=query_string,
+        method=sub_request["method"],
+        headers=headers,
+        json=sub_request.get("body"),
+        environ_base={"REMOTE_ADDR": request.remote_addr},
+    )
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+
+    with app.app_context(), app.request_context(environ):
+        if request.endpoint == "Batch.Batch":
+            response = app.make_response(
+                ({"message": "Batch requests cannot be nested"}, status.BAD_REQUEST)
+            )
+        else:
+            try:
+                response = app.full_dispatch_request()
+            except Exception as e:
+                response = app.make_response(app.handle_exception(e))
+    body = response.get_json(silent=True)
+    if body is None and response.data:
+        body = response.get_data(as_text=True)
+    return {
+        "status": response.status_code,
+        "headers": {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() not in RESPONSE_ONLY_HEADERS
+        },
+        "body": body,
+    }
+
+
+@blp.route("")
+class Batch(MethodView):
+    @blp.arguments(BatchRequestSchema)
+    @blp.response(status_code=status.OK, schema=BatchResponseSchema)
+    def post(self, data: dict) -> dict:
+        """Run several API requests in one round trip.
+
+        The sub-requests run one after the other, each with its own
+        transaction, and each gets its own status, headers and body. A failing
+        sub-request does not stop the next ones. The headers of the batch
+        request are passed on to the sub-requests, except conditional ones.
+
+        Args:
+            data: BatchRequestSchema: The method, path, headers and JSON body
+                of every sub-request.
+
+        Returns:
+            BatchResponseSchema: The responses, in the order of the requests.
+        """
+        return {
+            "responses": [
+                _dispatch(index, sub_request)
+                for index, sub_request in enumerate(data["requests"])
+            ]
+        }
@@ -0,0 +1,42 @@
+"""Batch schema"""
+
+import marshmallow as ma
+from flask import current_app
+
+from app.extensions.api import Schema
+
+METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE")
+
+
+class BatchSubRequestSchema(Schema):
+    method = ma.fields.Str(load_default="GET", validate=ma.validate.OneOf(METHODS))
+    # path of the API endpoint, with its query string if any
+    path = ma.fields.Str(required=True, validate=ma.validate.Regexp(r"^/"))
+    headers = ma.fields.Dict(
+        keys=ma.fields.Str(), values=ma.fields.Str(), load_default=dict
+    )
+    body = ma.fields.Raw(allow_none=True)
+
+
+class BatchRequestSchema(Schema):
+    requests = ma.fields.List(
+        ma.fields.Nested(BatchSubRequestSchema()),
+        required=True,
+        validate=ma.validate.Length(min=1),
+    )
+
+    @ma.validates("requests")
+    def validate_requests_count(self, value):
+        max_requests = current_app.config["BATCH_MAX_REQUESTS"]
+        if len(value) > max_requests:
+            raise ma.ValidationError(f"At most {max_requests} requests.")
+
+
+class BatchSubResponseSchema(Schema):
+    status = ma.fields.Integer()
+    headers = ma.fields.Dict(keys=ma.fields.Str(), values=ma.fields.Str())
+    body = ma.fields.Raw(allow_none=True)
+
+
+class BatchResponseSchema(Schema):
+    responses = ma.fields.List(ma.fields.Nested(BatchSubResponseSchema()))
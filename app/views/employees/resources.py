@@ -1,26 +1,63 @@
 import logging
+from collections import Counter
 from http import HTTPStatus as status
+from typing import Callable, List, Optional, Tuple
 
-import joblib
-import pandas as pd
 import sqlalchemy as sa
-from flask import request, current_app
+from flask import Response, abort, current_app, request
 from flask.views import MethodView
 
 from app.extensions.api import Blueprint
+from app.extensions.async_reads import async_reads
 from app.extensions.database import db
-from app.models.employees import Employee
-from app.utils.pagination import get_pagination
+from app.extensions.group_commit import group_commit
+from app.extensions.partitions import employee_partitions
+from app.extensions.salary_model import UnknownDepartment, salary_model
+from app.models import Employee, EmployeeChange
+from app.models.departments import (
+    Department as DepartmentModel,
+    add_headcounts,
+    move_headcount,
+    refresh_headcounts,
+)
+from app.models.hires import add_hires, bucket, move_hire, refresh_hires
+from app.utils.analytics import employee_snapshot
+from app.utils.changelog import get_changes, record_changes
+from app.utils.departments import department_names
+from app.utils.hires import hires_timeseries
+from app.utils.pagination import ListPagination, RowPagination, get_pagination
+from app.utils.salary_index import histogram, percentiles, salary_index
+from app.utils.search import SORT_KEYS, search_employees, search_partition
+from app.utils.updates import (
+    check_version,
+    get_expected_versions,
+    patch_item,
+    version_etag,
+    versioned,
+)
 from .schemas import (
     EmployeeSchema,
     DepartmentSchema,
+    DepartmentCreateSchema,
     DepartmentPaginatedSchema,
+    DepartmentListArgsSchema,
     EmployeePaginatedSchema,
     AverageSalarySchema,
+    AnalyticsSnapshotStatsSchema,
     SalaryPredictedSchema,
     SalaryPredictInputSchema,
+    PredictionCacheStatsSchema,
+    SalaryDistributionSchema,
+    HiresTimeseriesArgsSchema,
+    HiresTimeseriesSchema,
+    EmployeeSearchArgsSchema,
+    EmployeeListArgsSchema,
+    EmployeeBulkUpdateSchema,
+    EmployeeBulkDeleteSchema,
+    BulkResultSchema,
+    EmployeeChangesArgsSchema,
+    EmployeeChangesSchema,
 )
-from app.constants import departments
 
 blp = Blueprint(
     "Employees",
@@ -29,8 +66,6 @@ blp = Blueprint(
     description="Operations on employees, departments, and salaries",
 )
 
-# Load the trained model.
-model = joblib.load("model.pkl")
 # Logger
 logger = logging.getLogger(__name__)
 
@@ -38,24 +73,26 @@ logger = logging.getLogger(__name__)
 @blp.route("/employees/")
 class Employees(MethodView):
     @blp.etag
+    @blp.arguments(EmployeeListArgsSchema, location="query")
     @blp.response(status_code=status.OK, schema=EmployeePaginatedSchema)
-    def get(self) -> dict:
+    def get(self, args: dict) -> dict:
         """List employees.
 
         Returns:
             EmployeeSchema: The list of employees.
         """
-        page = request.args.get("page", 1, type=int)
-        per_page = current_app.config.get("PER_PAGE_LIMIT")
-        logger.debug(f"page: {page}, per_page: {per_page}")
-
-        employees = Employee.query.paginate(
-            page=page, per_page=per_page, error_out=True
-        )
+        page, per_page = args["page"], args["per_page"]
+        logger.debug("page: %s, per_page: %s", page, per_page)
+
+        if "ids" in args:
+            employees = _employees_by_ids(args)
+        elif employee_partitions.enabled:
+            employees = _partitioned_page(args, "id")
+        else:
+            employees = _row_page(args, _employee_rows(args).order_by(Employee.id))
         pagination = get_pagination(employees)
         return {"data": employees, "pagination": pagination}
 
-    @blp.etag
     @blp.arguments(EmployeeSchema)
     @blp.response(status_code=status.CREATED, schema=EmployeeSchema)
     def post(self, data: EmployeeSchema) -> EmployeeSchema:
@@ -66,15 +103,500 @@ class Employees(MethodView):
         Returns:
             EmployeeSchema: The created employee.
         """
-        employee = Employee(**data)
-        db.session.add(employee)
+        if employee_partitions.enabled:
+            employee = employee_partitions.insert(data)
+            _partitioned_write(None, employee)
+            return employee, version_etag(employee["version"])
+        employee, sequences = group_commit.run(lambda: _create_employee(data))
+        salary_index.insert(employee["department"], employee["salary"])
+        salary_index.acknowledge(sequences)
+        return employee, version_etag(employee["version"])
+
+
+@async_reads.view(
+    "Employees.Employees",
+    when=lambda: not employee_partitions.enabled and "ids" not in request.args,
+)
+async def list_employees_async() -> Response:
+    """``Employees.get`` on the async engine"""
+    return await _async_employee_page(
+        lambda args: _employee_rows(args).order_by(Employee.id)
+    )
+
+
+def _employee_row(employee: Employee) -> dict:
+    """The columns of an employee, readable once its session is gone"""
+    return {
+        column.key: getattr(employee, column.key) for column in Employee.__table__.c
+    }
+
+
+def _create_employee(data: dict) -> tuple:
+    """Create an employee, returning it with the sequences of its change"""
+    employee = Employee(**data)
+    db.session.add(employee)
+    db.session.flush()
+    sequences = record_changes(EmployeeChange.INSERT, [employee.id])
+    return _employee_row(employee), sequences
+
+
+def _update_employee(
+    employee_id: int, data: dict, expected_versions: Optional[set]
+) -> tuple:
+    """Update an employee, returning it with its previous department and
+    salary and the sequences of its change"""
+    employee = db.session.get(Employee, employee_id)
+    if employee is None:
+        abort(status.NOT_FOUND)
+    check_version(employee.version, expected_versions)
+    previous = employee.department, employee.salary
+    EmployeeSchema().update(employee, data)
+    sequences = record_changes(EmployeeChange.UPDATE, [employee_id])
+    db.session.flush()
+    return _employee_row(employee), previous, sequences
+
+
+def _update_partitioned(
+    employee_id: int, data: dict, expected_versions: Optional[set]
+) -> tuple:
+    """Update a partitioned employee, which gets a new id when it moves to
+    the partition of another department"""
+    previous, employee = employee_partitions.update(
+        employee_id, data, expected_versions
+    )
+    _partitioned_write(previous, employee)
+    return employee, version_etag(employee["version"])
+
+
+def _record_partition_writes(
+    writes: List[Tuple[Optional[dict], Optional[dict]]]
+) -> Optional[List[int]]:
+    """Record writes of partitioned employees in the main database
+
+    The change log, the headcounts and the monthly hires are updated and
+    committed, once the partitions are.
+
+    Args:
+        writes: list: Every written employee before and after the write, as
+            a mapping with at least its id, department and hire date, None
+            before an insert or after a deletion.
+
+    Returns:
+        list: The sequences of the recorded changes, None if unknown.
+    """
+    changes = {
+        EmployeeChange.DELETE: [],
+        EmployeeChange.UPDATE: [],
+        EmployeeChange.INSERT: [],
+    }
+    headcounts, hires = Counter(), Counter()
+    for previous, employee in writes:
+        if previous is not None:
+            headcounts[previous["department"]] -= 1
+            hires[bucket(previous["department"], previous["hire_date"])] -= 1
+        if employee is not None:
+            headcounts[employee["department"]] += 1
+            hires[bucket(employee["department"], employee["hire_date"])] += 1
+        if previous is None:
+            changes[EmployeeChange.INSERT].append(employee["id"])
+        elif employee is None:
+            changes[EmployeeChange.DELETE].append(previous["id"])
+        elif previous["id"] == employee["id"]:
+            changes[EmployeeChange.UPDATE].append(employee["id"])
+        else:
+            # moved to another partition, under a new id
+            changes[EmployeeChange.DELETE].append(previous["id"])
+            changes[EmployeeChange.INSERT].append(employee["id"])
+
+    sequences = []
+    for operation, employee_ids in changes.items():
+        recorded = record_changes(operation, employee_ids)
+        if recorded is None or sequences is None:
+            sequences = None
+        else:
+            sequences += recorded
+    connection = db.session.connection()
+    add_headcounts(
+        connection, {name: count for name, count in headcounts.items() if count}
+    )
+    add_hires(connection, hires)
+    db.session.commit()
+    return sequences
+
+
+def _partitioned_write(previous: Optional[dict], employee: Optional[dict]) -> None:
+    """Record the write of a partitioned employee and apply it to the
+    salary index"""
+    sequences = _record_partition_writes([(previous, employee)])
+    if previous is not None:
+        salary_index.remove(previous["department"], previous["salary"])
+    if employee is not None:
+        salary_index.insert(employee["department"], employee["salary"])
+    salary_index.acknowledge(sequences)
+
+
+def _partitioned_page(
+    args: dict, key: str, descending: bool = False, limit: Optional[int] = None
+) -> ListPagination:
+    """Page of the employees of all partitions sorted on a column"""
+    page, per_page = args["page"], args["per_page"]
+    items, total = employee_partitions.sorted_page(
+        page, per_page, key, descending, fields=args.get("fields"), limit=limit
+    )
+    return ListPagination(
+        page=page, per_page=per_page, max_per_page=None, items=items, total=total
+    )
+
+
+def _partition_department_page(args: dict, department: str) -> ListPagination:
+    """Page of the employees of a department, read from its partition only"""
+    page, per_page = args["page"], args["per_page"]
+    partition = employee_partitions.partition(department)
+    table = employee_partitions.table
+    criteria = table.c.department == department
+    items = employee_partitions.execute(
+        partition,
+        sa.select(*employee_partitions.columns(partition, args.get("fields")))
+        .where(criteria)
+        .order_by(table.c.hire_date.desc())
+        .offset((page - 1) * per_page)
+        .limit(per_page),
+    )
+    total = employee_partitions.count(criteria, partition=partition)
+    return ListPagination(
+        page=page, per_page=per_page, max_per_page=None, items=items, total=total
+    )
+
+
+def _employee_rows(args: dict) -> sa.Select:
+    """Core select of the employee columns, only those of the requested
+    sparse fieldset if any
+
+    Read-only list endpoints serialize the rows as they come, without
+    building ORM instances. The rows only have the selected columns, which
+    is all the employee schema dumps.
+    """
+    table = Employee.__table__
+    fields = args.get("fields")
+    if not fields:
+        return sa.select(table)
+    return sa.select(*(table.c[name] for name in dict.fromkeys(fields)))
+
+
+def _row_page(args: dict, select: sa.Select) -> RowPagination:
+    return RowPagination(
+        select=select,
+        session=db.session,
+        page=args["page"],
+        per_page=args["per_page"],
+        max_per_page=None,
+    )
+
+
+def _top_select(args: dict, column: sa.Column, limit: int) -> sa.Select:
+    """The ``limit`` employees with the highest values of a column"""
+    sort_key = column.label("sort_key")
+    top = (
+        _employee_rows(args)
+        .add_columns(sort_key)
+        .order_by(sort_key.desc())
+        .limit(limit)
+        .subquery()
+    )
+    return sa.select(top).order_by(top.c.sort_key.desc())
+
+
+def _top_rows(args: dict, column: sa.Column, limit: int) -> RowPagination:
+    """Paginate the ``limit`` employees with the highest values of a column"""
+    return _row_page(args, _top_select(args, column, limit))
+
+
+# built once like the schemas of the decorators, building them per request
+# costs as much as the queries
+_LIST_ARGS_SCHEMA = EmployeeListArgsSchema()
+_PAGINATED_SCHEMA = EmployeePaginatedSchema()
+
+
+def _reads_employees_table() -> bool:
+    """Whether the employee lists are read from the employees table, the
+    only storage the async views read"""
+    return not employee_partitions.enabled and not employee_snapshot.enabled()
+
+
+async def _async_employee_page(select_of: Callable[[dict], sa.Select]) -> Response:
+    """A page of the employees of ``select_of(args)`` read on the async
+    engine, as the sync list views answer it"""
+    args = blp.ARGUMENTS_PARSER.parse(_LIST_ARGS_SCHEMA, request, location="query")
+    page, per_page = args["page"], args["per_page"]
+    rows, total = await async_reads.page(
+        select_of(args), (page - 1) * per_page, per_page
+    )
+    employees = ListPagination(
+        page=page, per_page=per_page, max_per_page=None, items=rows, total=total
+    )
+    data = {"data": employees, "pagination": get_pagination(employees)}
+    return blp.etag_response(_PAGINATED_SCHEMA.dump(data))
+
+
+def _employees_by_ids(args: dict) -> ListPagination:
+    """The employees of ``ids`` found, in the requested order, on one page"""
+    ids = list(dict.fromkeys(args["ids"]))
+    position = {employee_id: i for i, employee_id in enumerate(ids)}
+    if employee_partitions.enabled:
+        found = employee_partitions.get_many(ids, args.get("fields"))
+        items = [found[employee_id] for employee_id in ids if employee_id in found]
+    else:
+        items = (
+            db.session.execute(
+                _employee_rows(args)
+                .where(Employee.id.in_(ids))
+                .order_by(sa.case(position, value=Employee.id))
+            )
+            .mappings()
+            .all()
+        )
+    return ListPagination(
+        page=1, per_page=len(ids), max_per_page=None, items=items, total=len(items)
+    )
+
+
+def _snapshot_top(args: dict, column: str, limit: int) -> RowPagination:
+    """Paginate the employees with the highest values of a snapshot column"""
+    ids = employee_snapshot.top_ids(column, limit)
+    select = _employee_rows(args).where(Employee.id.in_(ids))
+    if ids:
+        position = {employee_id: i for i, employee_id in enumerate(ids)}
+        select = select.order_by(sa.case(position, value=Employee.id))
+    return _row_page(args, select)
+
+
+def _employee_filters(criteria: dict) -> list:
+    """Translate bulk filter criteria into SQL conditions"""
+    conditions = []
+    if "ids" in criteria:
+        conditions.append(Employee.id.in_(criteria["ids"]))
+    if "department" in criteria:
+        conditions.append(Employee.department == criteria["department"])
+    if "hired_from" in criteria:
+        conditions.append(Employee.hire_date >= criteria["hired_from"])
+    if "hired_to" in criteria:
+        conditions.append(Employee.hire_date <= criteria["hired_to"])
+    return conditions
+
+
+def _partition_filters(criteria: dict) -> dict:
+    """Bulk filter criteria as the SQL conditions of every partition which
+    may hold matching employees"""
+    partitions = range(len(employee_partitions.engines))
+    if "department" in criteria:
+        partitions = [employee_partitions.partition(criteria["department"])]
+    conditions = _employee_filters(
+        {key: value for key, value in criteria.items() if key != "ids"}
+    )
+    if "ids" not in criteria:
+        return {partition: conditions for partition in partitions}
+    local_ids = {}
+    for employee_id in criteria["ids"]:
+        partition, local_id = employee_partitions.decode_id(employee_id)
+        local_ids.setdefault(partition, []).append(local_id)
+    return {
+        partition: conditions + [Employee.id.in_(local_ids[partition])]
+        for partition in partitions
+        if partition in local_ids
+    }
+
+
+def _affected_departments(criteria: dict, update: Optional[dict] = None):
+    """Departments whose salaries may have changed, None meaning all of them"""
+    if "department" not in criteria:
+        return None
+    affected = {criteria["department"]}
+    if update and "department" in update:
+        affected.add(update["department"])
+    return affected
+
+
+@blp.route("/employees/bulk")
+class EmployeesBulk(MethodView):
+    @blp.arguments(EmployeeBulkUpdateSchema)
+    @blp.response(status_code=status.OK, schema=BulkResultSchema)
+    def patch(self, data: dict) -> dict:
+        """Update all the employees matching a filter.
+
+        The update runs as a single UPDATE statement.
+
+        Args:
+            data: EmployeeBulkUpdateSchema: The filter and the update to apply.
+
+        Returns:
+            BulkResultSchema: The number of updated employees.
+        """
+        criteria, update = data["filter"], data["update"]
+        logger.debug("filter: %s, update: %s", criteria, update)
+
+        if employee_partitions.enabled:
+            updated = employee_partitions.bulk_update(
+                _partition_filters(criteria),
+                update.get("salary_multiplier"),
+                update.get("department"),
+            )
+            _record_partition_writes(
+                [
+                    (
+                        previous,
+                        {
+                            "id": employee_id,
+                            "department": update.get(
+                                "department", previous["department"]
+                            ),
+                            "hire_date": previous["hire_date"],
+                        },
+                    )
+                    for previous, employee_id in updated
+                ]
+            )
+            salary_index.invalidate(_affected_departments(criteria, update))
+            return {"affected": len(updated)}
+
+        values = {"version": Employee.version + 1}
+        if "salary_multiplier" in update:
+            values["salary"] = Employee.salary * update["salary_multiplier"]
+        if "department" in update:
+            values["department"] = update["department"]
+        record_changes(
+            EmployeeChange.UPDATE,
+            sa.select(Employee.id).where(*_employee_filters(criteria)),
+        )
+        result = db.session.execute(
+            sa.update(Employee)
+            .where(*_employee_filters(criteria))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if "department" in update:
+            affected = _affected_departments(criteria, update)
+            refresh_headcounts(db.session.connection(), affected)
+            refresh_hires(db.session.connection(), affected)
+        db.session.commit()
+
+        salary_index.invalidate(_affected_departments(criteria, update))
+        return {"affected": result.rowcount}
+
+    @blp.arguments(EmployeeBulkDeleteSchema)
+    @blp.response(status_code=status.OK, schema=BulkResultSchema)
+    def delete(self, data: dict) -> dict:
+        """Delete all the employees matching a filter.
+
+        The deletion runs as a single DELETE statement.
+
+        Args:
+            data: EmployeeBulkDeleteSchema: The filter of the employees to delete.
+
+        Returns:
+            BulkResultSchema: The number of deleted employees.
+        """
+        criteria = data["filter"]
+        logger.debug("filter: %s", criteria)
+
+        if employee_partitions.enabled:
+            deleted = employee_partitions.bulk_delete(_partition_filters(criteria))
+            _record_partition_writes([(previous, None) for previous in deleted])
+            salary_index.invalidate(_affected_departments(criteria))
+            return {"affected": len(deleted)}
+
+        record_changes(
+            EmployeeChange.DELETE,
+            sa.select(Employee.id).where(*_employee_filters(criteria)),
+        )
+        result = db.session.execute(
+            sa.delete(Employee)
+            .where(*_employee_filters(criteria))
+            .execution_options(synchronize_session=False)
+        )
+        affected = _affected_departments(criteria)
+        refresh_headcounts(db.session.connection(), affected)
+        refresh_hires(db.session.connection(), affected)
         db.session.commit()
-        return employee
+
+        salary_index.invalidate(affected)
+        return {"affected": result.rowcount}
+
+
+@blp.route("/employees/changes")
+class EmployeeChanges(MethodView):
+    @blp.etag
+    @blp.arguments(EmployeeChangesArgsSchema, location="query")
+    @blp.response(status_code=status.OK, schema=EmployeeChangesSchema)
+    def get(self, args: dict) -> dict:
+        """List the changes of employees since a sequence number.
+
+        Inserts and updates come with the current state of the employee,
+        deletions as tombstones. Pass the returned next_since as since to get
+        the following changes.
+
+        Returns:
+            EmployeeChangesSchema: The changes, oldest first.
+        """
+        since = args["since"]
+        max_limit = current_app.config.get("EMPLOYEE_CHANGES_PAGE_LIMIT")
+        limit = min(args["limit"], max_limit)
+        logger.debug("since: %s, limit: %s", since, limit)
+
+        changes = get_changes(since, limit + 1)
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        next_since = changes[-1]["sequence"] if changes else since
+        return {"data": changes, "next_since": next_since, "has_more": has_more}
+
+
+@blp.route("/employees/search")
+class EmployeeSearch(MethodView):
+    @blp.etag
+    @blp.arguments(EmployeeSearchArgsSchema, location="query")
+    @blp.response(status_code=status.OK, schema=EmployeePaginatedSchema)
+    def get(self, args: dict) -> dict:
+        """Search employees by name.
+
+        Every word of the query is matched against the start of the words of
+        the employee names. Results are ranked by relevance.
+
+        Returns:
+            EmployeeSchema: The list of matching employees.
+        """
+        page, per_page = args["page"], args["per_page"]
+        logger.debug("q: %s, page: %s, per_page: %s", args["q"], page, per_page)
+
+        if employee_partitions.enabled:
+            items, total = employee_partitions.ranked_page(
+                lambda partition: search_partition(
+                    args["q"],
+                    employee_partitions.columns(partition),
+                    employee_partitions.engines[partition],
+                ),
+                SORT_KEYS,
+                page,
+                per_page,
+            )
+            employees = ListPagination(
+                page=page,
+                per_page=per_page,
+                max_per_page=None,
+                items=items,
+                total=total,
+            )
+        else:
+            employees = db.paginate(
+                search_employees(args["q"]),
+                page=page,
+                per_page=per_page,
+                error_out=True,
+            )
+        pagination = get_pagination(employees)
+        return {"data": employees, "pagination": pagination}
 
 
 @blp.route("/employees/<int:employee_id>")
 class EmployeeById(MethodView):
-    @blp.etag
     @blp.response(status_code=status.OK, schema=EmployeeSchema)
     def get(self, employee_id: int) -> EmployeeSchema:
         """Get an employee.
@@ -84,14 +606,21 @@ class EmployeeById(MethodView):
         Returns:
             EmployeeSchema: The employee.
         """
+        if employee_partitions.enabled:
+            employee = employee_partitions.get(employee_id)
+            if employee is None:
+                abort(status.NOT_FOUND)
+            return versioned(employee, employee["version"])
         employee = Employee.query.get_or_404(employee_id)
-        return employee
+        return versioned(employee, employee.version)
 
-    @blp.etag
     @blp.arguments(EmployeeSchema)
     @blp.response(status_code=status.OK, schema=EmployeeSchema)
     def put(self, data: EmployeeSchema, employee_id: int) -> EmployeeSchema:
         """Update an existing employee.
+
+        The If-Match header must hold the version of the employee.
+
         Args:
             data: EmployeeSchema: The data to use to update the employee.
             employee_id: int: The ID of the employee to update.
@@ -99,53 +628,140 @@ class EmployeeById(MethodView):
         Returns:
             EmployeeSchema: The updated employee.
         """
-        employee = Employee.query.get_or_404(employee_id)
-        logger.debug(employee_id)
-        EmployeeSchema().update(employee, data)
-        db.session.add(employee)
-        db.session.commit()
-        return employee
+        logger.debug("employee_id: %s", employee_id)
+        # read here, the write may run in the thread of another request
+        expected_versions = get_expected_versions()
+        if employee_partitions.enabled:
+            return _update_partitioned(employee_id, data, expected_versions)
+        employee, (old_department, old_salary), sequences = group_commit.run(
+            lambda: _update_employee(employee_id, data, expected_versions)
+        )
+        salary_index.remove(old_department, old_salary)
+        salary_index.insert(employee["department"], employee["salary"])
+        salary_index.acknowledge(sequences)
+        return employee, version_etag(employee["version"])
+
+    @blp.arguments(EmployeeSchema(partial=True))
+    @blp.response(status_code=status.OK, schema=EmployeeSchema)
+    def patch(self, data: EmployeeSchema, employee_id: int):
+        """Partially update an existing employee.
+
+        Only the supplied fields are written, in a single UPDATE statement.
+        The If-Match header must hold the version the employee must have.
+
+        Args:
+            data: EmployeeSchema: The fields to update.
+            employee_id: int: The ID of the employee to update.
+
+        Returns:
+            EmployeeSchema: The updated employee.
+        """
+        logger.debug("employee_id: %s", employee_id)
+        expected_versions = get_expected_versions()
+        if employee_partitions.enabled:
+            if not data:
+                abort(status.BAD_REQUEST, "No field to update")
+            return _update_partitioned(employee_id, data, expected_versions)
+        # committed (or rolled back) together with the update
+        sequences = record_changes(EmployeeChange.UPDATE, [employee_id])
+        if "department" in data:
+            move_headcount(db.session.connection(), employee_id, data["department"])
+        move_hire(
+            db.session.connection(),
+            employee_id,
+            data.get("department"),
+            data.get("hire_date"),
+        )
+        employee = patch_item(Employee, employee_id, data, expected_versions)
+        # the previous values are not known, rebuild what they may have changed
+        if "department" in data:
+            salary_index.invalidate()
+        elif "salary" in data:
+            salary_index.invalidate([employee["department"]])
+        salary_index.acknowledge(sequences)
+        return employee, version_etag(employee["version"])
 
-    @blp.etag
     @blp.response(status_code=status.NO_CONTENT)
     def delete(self, employee_id: int) -> None:
         """Delete an employee.
+
+        The If-Match header must hold the version of the employee.
+
         Args:
             employee_id: int: The ID of the employee to delete.
         """
+        if employee_partitions.enabled:
+            previous = employee_partitions.delete(
+                employee_id, get_expected_versions()
+            )
+            _partitioned_write(previous, None)
+            return
         employee = Employee.query.get_or_404(employee_id)
+        check_version(employee.version, get_expected_versions())
+        department, salary = employee.department, employee.salary
         db.session.delete(employee)
+        sequences = record_changes(EmployeeChange.DELETE, [employee_id])
         db.session.commit()
+        salary_index.remove(department, salary)
+        salary_index.acknowledge(sequences)
 
 
 @blp.route("/departments/")
 class Departments(MethodView):
     @blp.etag
+    @blp.arguments(DepartmentListArgsSchema, location="query")
     @blp.response(status_code=status.OK, schema=DepartmentPaginatedSchema)
-    def get(self) -> dict:
+    def get(self, args: dict) -> dict:
         """List departments.
 
+        Only the departments that have employees are listed, unless
+        ``include_empty`` is set (e.g. to see a department just created).
+
         Returns:
             DepartmentSchema: The list of departments.
         """
-        page = request.args.get("page", 1, type=int)
-        per_page = current_app.config.get("PER_PAGE_LIMIT")
-        logger.debug(f"page: {page}, per_page: {per_page}")
-
-        departments = (
-            Employee.query.distinct(Employee.department)
-            .with_entities(Employee.department.label("name"))
-            .paginate(page=page, per_page=per_page, error_out=True)
+        page, per_page = args["page"], args["per_page"]
+        logger.debug("page: %s, per_page: %s", page, per_page)
+
+        select = db.select(DepartmentModel).order_by(DepartmentModel.name)
+        if not args["include_empty"]:
+            select = select.where(DepartmentModel.headcount > 0)
+        departments = db.paginate(
+            select,
+            page=page,
+            per_page=per_page,
+            error_out=True,
         )
         pagination = get_pagination(departments)
         return {"data": departments, "pagination": pagination}
 
+    @blp.arguments(DepartmentCreateSchema)
+    @blp.response(status_code=status.CREATED, schema=DepartmentSchema)
+    def post(self, data: dict) -> DepartmentModel:
+        """Add a new department.
+
+        Args:
+            data: DepartmentCreateSchema: The name of the department.
+
+        Returns:
+            DepartmentSchema: The created department.
+        """
+        logger.debug("data: %s", data)
+        if data["name"] in department_names:
+            abort(status.CONFLICT, f"{data['name']} already exists")
+        department = DepartmentModel(name=data["name"], headcount=0)
+        db.session.add(department)
+        db.session.commit()
+        department_names.invalidate()
+        return department
+
 
 @blp.route("/departments/<string:department>")
 class Department(MethodView):
     @blp.etag
+    @blp.arguments(EmployeeListArgsSchema, location="query")
     @blp.response(status_code=status.OK, schema=EmployeePaginatedSchema)
-    def get(self, department: str) -> dict:
+    def get(self, args: dict, department: str) -> dict:
         """Get employees of a department.
         Args:
             department: str: The name of the department to get employees for.
@@ -153,17 +769,21 @@ class Department(MethodView):
         Returns:
             EmployeeSchema: The list of employees for the department.
         """
-        logger.debug(f"department: {department}")
+        logger.debug("department: %s", department)
         department = DepartmentSchema().load({"name": department})
 
-        page = request.args.get("page", 1, type=int)
-        per_page = current_app.config.get("PER_PAGE_LIMIT")
-        logger.debug(f"page: {page}, per_page: {per_page}")
+        page, per_page = args["page"], args["per_page"]
+        logger.debug("page: %s, per_page: %s", page, per_page)
+
+        if employee_partitions.enabled:
+            employees = _partition_department_page(args, department["name"])
+            return {"data": employees, "pagination": get_pagination(employees)}
 
-        employees = (
-            Employee.query.filter_by(department=department["name"])
-            .order_by(Employee.hire_date.desc())
-            .paginate(page=page, per_page=per_page, error_out=True)
+        employees = _row_page(
+            args,
+            _employee_rows(args)
+            .where(Employee.department == department["name"])
+            .order_by(Employee.hire_date.desc()),
         )
 
         pagination = get_pagination(employees)
@@ -183,83 +803,166 @@ class AverageSalary(MethodView):
         Returns:
             int: average salary.
         """
-        logger.debug(f"department: {department}")
+        logger.debug("department: %s", department)
         department = DepartmentSchema().load({"name": department})
-        avg_salary = (
-            Employee.query.with_entities(sa.func.avg(Employee.salary))
-            .filter_by(department=department["name"])
-            .scalar()
-        )
-        logger.debug(f"avg_salary: {avg_salary}")
+        if employee_partitions.enabled:
+            table = employee_partitions.table
+            avg_salary = employee_partitions.execute(
+                employee_partitions.partition(department["name"]),
+                sa.select(sa.func.avg(table.c.salary).label("avg")).where(
+                    table.c.department == department["name"]
+                ),
+            )[0]["avg"]
+        elif employee_snapshot.enabled():
+            avg_salary = employee_snapshot.average_salary(department["name"])
+        else:
+            avg_salary = (
+                Employee.query.with_entities(sa.func.avg(Employee.salary))
+                .filter_by(department=department["name"])
+                .scalar()
+            )
+        logger.debug("avg_salary: %s", avg_salary)
         return {"data": avg_salary}
 
 
+@blp.route("/salary_distribution/<string:department>")
+class SalaryDistribution(MethodView):
+    @blp.etag
+    @blp.response(status_code=status.OK, schema=SalaryDistributionSchema)
+    def get(self, department: str) -> dict:
+        """Get salary percentiles and a salary histogram of a department.
+
+        Args:
+            department: str: The name of the department to get the distribution for.
+
+        Returns:
+            SalaryDistributionSchema: percentiles and fixed-bin histogram.
+        """
+        logger.debug("department: %s", department)
+        department = DepartmentSchema().load({"name": department})["name"]
+        bins = current_app.config.get("SALARY_HISTOGRAM_BINS")
+        # one array for the three, a write may swap it in between gets
+        salaries = salary_index.get(department)
+        return {
+            "department": department,
+            "count": len(salaries),
+            "percentiles": percentiles(salaries),
+            "histogram": histogram(salaries, bins=bins),
+        }
+
+
 @blp.route("/top_earners/")
 class TopEarners(MethodView):
     @blp.etag
+    @blp.arguments(EmployeeListArgsSchema, location="query")
     @blp.response(status_code=status.OK, schema=EmployeePaginatedSchema)
-    def get(self) -> dict:
+    def get(self, args: dict) -> dict:
         """Get a list of the top 10 earners in the company based on their salary.
 
         Returns:
             EmployeeSchema: A list of the top 10 earners in the company.
         """
-        page = request.args.get("page", 1, type=int)
-        per_page = current_app.config.get("PER_PAGE_LIMIT")
+        page, per_page = args["page"], args["per_page"]
         top_result_limit = current_app.config.get("TOP_RESULT_LIMIT")
 
         logger.debug(
-            f"page: {page}, per_page: {per_page}, top_result_limit: {top_result_limit}"
+            "page: %s, per_page: %s, top_result_limit: %s",
+            page,
+            per_page,
+            top_result_limit,
         )
 
-        top_employees_cte = (
-            db.session.query(Employee)
-            .order_by(Employee.salary.desc())
-            .limit(top_result_limit)
-            .cte()
-        )
-        employees = db.session.query(top_employees_cte).paginate(
-            page=page, per_page=per_page, error_out=True
-        )
+        if employee_partitions.enabled:
+            employees = _partitioned_page(
+                args, "salary", descending=True, limit=top_result_limit
+            )
+        elif employee_snapshot.enabled():
+            employees = _snapshot_top(args, "salaries", top_result_limit)
+        else:
+            employees = _top_rows(args, Employee.salary, top_result_limit)
 
-        logger.debug(employees)
+        logger.debug("employees: %s", employees)
         pagination = get_pagination(employees)
         return {"data": employees, "pagination": pagination}
 
 
+@async_reads.view("Employees.TopEarners", when=_reads_employees_table)
+async def top_earners_async() -> Response:
+    """``TopEarners.get`` on the async engine"""
+    limit = current_app.config.get("TOP_RESULT_LIMIT")
+    return await _async_employee_page(
+        lambda args: _top_select(args, Employee.salary, limit)
+    )
+
+
 @blp.route("/most_recent_hires/")
 class MostRecentHires(MethodView):
     @blp.etag
+    @blp.arguments(EmployeeListArgsSchema, location="query")
     @blp.response(status_code=status.OK, schema=EmployeePaginatedSchema)
-    def get(self) -> dict:
+    def get(self, args: dict) -> dict:
         """Get a list of the most recent hires in the company.
 
         Returns:
             EmployeeSchema: A list of the most recent hires in the company.
         """
-        page = request.args.get("page", 1, type=int)
-        per_page = current_app.config.get("PER_PAGE_LIMIT")
+        page, per_page = args["page"], args["per_page"]
         top_result_limit = current_app.config.get("TOP_RESULT_LIMIT")
 
         logger.debug(
-            f"page: {page}, per_page: {per_page}, top_result_limit: {top_result_limit}"
+            "page: %s, per_page: %s, top_result_limit: %s",
+            page,
+            per_page,
+            top_result_limit,
         )
 
-        top_employees_cte = (
-            db.session.query(Employee)
-            .order_by(Employee.hire_date.desc())
-            .limit(top_result_limit)
-            .cte()
-        )
-        employees = db.session.query(top_employees_cte).paginate(
-            page=page, per_page=per_page, error_out=True
-        )
+        if employee_partitions.enabled:
+            employees = _partitioned_page(
+                args, "hire_date", descending=True, limit=top_result_limit
+            )
+        elif employee_snapshot.enabled():
+            employees = _snapshot_top(args, "hire_dates", top_result_limit)
+        else:
+            employees = _top_rows(args, Employee.hire_date, top_result_limit)
 
-        logger.debug(employees)
+        logger.debug("employees: %s", employees)
         pagination = get_pagination(employees)
         return {"data": employees, "pagination": pagination}
 
 
+@async_reads.view("Employees.MostRecentHires", when=_reads_employees_table)
+async def most_recent_hires_async() -> Response:
+    """``MostRecentHires.get`` on the async engine"""
+    limit = current_app.config.get("TOP_RESULT_LIMIT")
+    return await _async_employee_page(
+        lambda args: _top_select(args, Employee.hire_date, limit)
+    )
+
+
+@blp.route("/hires/timeseries")
+class HiresTimeseries(MethodView):
+    @blp.etag
+    @blp.arguments(HiresTimeseriesArgsSchema, location="query")
+    @blp.response(status_code=status.OK, schema=HiresTimeseriesSchema)
+    def get(self, args: dict) -> dict:
+        """Get the number of hires per month or quarter.
+
+        Served from the monthly hires rollup, every period of the last
+        ``years`` years (HIRES_TIMESERIES_YEARS by default) is listed.
+
+        Returns:
+            HiresTimeseriesSchema: The hires of every period, oldest first.
+        """
+        logger.debug("args: %s", args)
+        years = args.get("years") or current_app.config["HIRES_TIMESERIES_YEARS"]
+        data = hires_timeseries(args["granularity"], args.get("department"), years)
+        return {
+            "granularity": args["granularity"],
+            "department": args.get("department"),
+            "data": data,
+        }
+
+
 @blp.route("/predict_salary/")
 class PredictSalary(MethodView):
     @blp.etag
@@ -274,18 +977,36 @@ class PredictSalary(MethodView):
         Returns:
             int: predicted salary.
         """
-        logger.debug(f"data: {data}")
-        data = {
-            "department": data["department"],
-            "hire_date": data["hire_date"].timestamp(),
-        }
-        # Convert the data to a Pandas DataFrame.
-        df = pd.DataFrame(data, index=[0])
-        department_to_int = {department: i for i, department in enumerate(departments)}
-        df["department"] = df["department"].map(department_to_int)
-
-        # Predict the salary.
-        prediction = model.predict(df)
+        logger.debug("data: %s", data)
+        # Predictions are memoized per (department, hire date bucket).
+        try:
+            prediction = salary_model.predict(data["department"], data["hire_date"])
+        except UnknownDepartment as e:
+            abort(status.UNPROCESSABLE_ENTITY, str(e))
 
         # Return the prediction.
         return {"data": prediction}
+
+
+@blp.route("/predict_salary/stats")
+class PredictSalaryStats(MethodView):
+    @blp.response(status_code=status.OK, schema=PredictionCacheStatsSchema)
+    def get(self) -> dict:
+        """Get hit-rate statistics of the salary prediction cache.
+
+        Returns:
+            PredictionCacheStatsSchema: The prediction cache statistics.
+        """
+        return salary_model.stats()
+
+
+@blp.route("/analytics/stats")
+class AnalyticsStats(MethodView):
+    @blp.response(status_code=status.OK, schema=AnalyticsSnapshotStatsSchema)
+    def get(self) -> dict:
+        """Get the size of the in-memory employees snapshot.
+
+        Returns:
+            AnalyticsSnapshotStatsSchema: The snapshot statistics.
+        """
+        return employee_snapshot.stats()
@@ -1,25 +1,127 @@
-from marshmallow import fields as ma_fields, validates, ValidationError, Schema
+from flask import current_app
+from marshmallow import (
+    fields as ma_fields,
+    validate,
+    validates,
+    validates_schema,
+    ValidationError,
+    Schema,
+)
 from marshmallow_sqlalchemy import field_for
+from webargs.fields import DelimitedList
 
-from app.constants import departments
-from app.extensions.api import AutoSchema, BasePaginatedSchema
+from app.extensions.api import AutoSchema, BasePaginatedSchema, PageArgsSchema
 from app.models import Employee
+from app.utils.departments import department_names
+
+
+def validate_department(value):
+    if value not in department_names:
+        raise ValidationError(f"{value} is not a valid department")
 
 
 class EmployeeSchema(AutoSchema):
     id = field_for(Employee, "id", dump_only=True)
+    version = field_for(Employee, "version", dump_only=True)
+    department = field_for(Employee, "department", validate=validate_department)
 
     class Meta(AutoSchema.Meta):
         table = Employee.__table__
 
 
+class EmployeeListArgsSchema(PageArgsSchema):
+    # sparse fieldset, e.g. ?fields=id,name,salary
+    fields = DelimitedList(
+        ma_fields.Str(),
+        validate=[
+            validate.Length(min=1),
+            validate.ContainsOnly(tuple(EmployeeSchema().dump_fields)),
+        ],
+    )
+    # multi-get, e.g. ?ids=1,2,3, at most MAX_PER_PAGE_LIMIT ids
+    ids = DelimitedList(ma_fields.Integer(), validate=validate.Length(min=1))
+
+    @validates_schema
+    def validate_ids_count(self, data, **kwargs):
+        max_ids = current_app.config["MAX_PER_PAGE_LIMIT"]
+        if len(data.get("ids", ())) > max_ids:
+            raise ValidationError(f"At most {max_ids} ids.", "ids")
+
+
+class DepartmentListArgsSchema(PageArgsSchema):
+    # departments without employees, e.g. just created, are hidden otherwise
+    include_empty = ma_fields.Boolean(load_default=False)
+
+
+class EmployeeSearchArgsSchema(PageArgsSchema):
+    q = ma_fields.Str(required=True, validate=validate.Length(min=1))
+
+
+class EmployeeChangeSchema(Schema):
+    sequence = ma_fields.Integer()
+    operation = ma_fields.Str()
+    employee_id = ma_fields.Integer()
+    changed_at = ma_fields.DateTime()
+    employee = ma_fields.Nested(EmployeeSchema(), allow_none=True)
+
+
+class EmployeeChangesArgsSchema(Schema):
+    since = ma_fields.Integer(load_default=0, validate=validate.Range(min=0))
+    limit = ma_fields.Integer(load_default=100, validate=validate.Range(min=1))
+
+
+class EmployeeChangesSchema(Schema):
+    data = ma_fields.List(ma_fields.Nested(EmployeeChangeSchema()))
+    next_since = ma_fields.Integer()
+    has_more = ma_fields.Boolean()
+
+
 class DepartmentSchema(AutoSchema):
     name = ma_fields.Str(required=True)
+    headcount = ma_fields.Integer(dump_only=True)
 
     @validates("name")
     def validate_department(self, value):
-        if value not in departments:
-            raise ValidationError(f"{value} is not a valid department")
+        validate_department(value)
+
+
+class DepartmentCreateSchema(Schema):
+    name = ma_fields.Str(required=True, validate=validate.Length(min=1, max=50))
+
+
+class EmployeeFilterSchema(Schema):
+    ids = ma_fields.List(ma_fields.Integer(), validate=validate.Length(min=1))
+    department = ma_fields.Str(validate=validate_department)
+    hired_from = ma_fields.DateTime()
+    hired_to = ma_fields.DateTime()
+
+    @validates_schema
+    def validate_not_empty(self, data, **kwargs):
+        if not data:
+            raise ValidationError("At least one filter criterion is required")
+
+
+class EmployeeUpdateSchema(Schema):
+    salary_multiplier = ma_fields.Float(validate=validate.Range(min=0))
+    department = ma_fields.Str(validate=validate_department)
+
+    @validates_schema
+    def validate_not_empty(self, data, **kwargs):
+        if not data:
+            raise ValidationError("At least one update is required")
+
+
+class EmployeeBulkUpdateSchema(Schema):
+    filter = ma_fields.Nested(EmployeeFilterSchema(), required=True)
+    update = ma_fields.Nested(EmployeeUpdateSchema(), required=True)
+
+
+class EmployeeBulkDeleteSchema(Schema):
+    filter = ma_fields.Nested(EmployeeFilterSchema(), required=True)
+
+
+class BulkResultSchema(Schema):
+    affected = ma_fields.Integer(required=True)
 
 
 class EmployeePaginatedSchema(BasePaginatedSchema):
@@ -34,13 +136,69 @@ class AverageSalarySchema(AutoSchema):
     data = ma_fields.Float(required=True)
 
 
+class AnalyticsSnapshotStatsSchema(Schema):
+    enabled = ma_fields.Boolean()
+    rows = ma_fields.Integer()
+    bytes = ma_fields.Integer()
+    bytes_per_row = ma_fields.Integer()
+    mb_per_million_rows = ma_fields.Float()
+    sequence = ma_fields.Integer()
+    builds = ma_fields.Integer()
+    refreshes = ma_fields.Integer()
+
+
+class SalaryHistogramBinSchema(Schema):
+    lower = ma_fields.Float()
+    upper = ma_fields.Float()
+    count = ma_fields.Integer()
+
+
+class SalaryDistributionSchema(Schema):
+    department = ma_fields.Str()
+    count = ma_fields.Integer()
+    percentiles = ma_fields.Dict(keys=ma_fields.Str(), values=ma_fields.Float())
+    histogram = ma_fields.List(ma_fields.Nested(SalaryHistogramBinSchema()))
+
+
+class HiresTimeseriesArgsSchema(Schema):
+    granularity = ma_fields.Str(
+        load_default="month", validate=validate.OneOf(("month", "quarter"))
+    )
+    department = ma_fields.Str(validate=validate_department)
+    years = ma_fields.Integer(validate=validate.Range(min=1, max=100))
+
+
+class HiresPeriodSchema(Schema):
+    period = ma_fields.Str()
+    hires = ma_fields.Integer()
+
+
+class HiresTimeseriesSchema(Schema):
+    granularity = ma_fields.Str()
+    department = ma_fields.Str(allow_none=True)
+    data = ma_fields.List(ma_fields.Nested(HiresPeriodSchema()))
+
+
 class SalaryPredictedSchema(AutoSchema):
     data = ma_fields.Float(required=True)
 
 
+class PredictionCacheStatsSchema(Schema):
+    size = ma_fields.Integer()
+    max_size = ma_fields.Integer()
+    ttl = ma_fields.Float(allow_none=True)
+    hits = ma_fields.Integer()
+    misses = ma_fields.Integer()
+    evictions = ma_fields.Integer()
+    expirations = ma_fields.Integer()
+    hit_rate = ma_fields.Float()
+    granularity = ma_fields.Str()
+    model_reloads = ma_fields.Integer()
+
+
 class SalaryPredictInputSchema(EmployeeSchema):
     name = ma_fields.Str(allow_none=True)
-    department = ma_fields.Str(required=True)
+    department = ma_fields.Str(required=True, validate=validate_department)
     hire_date = ma_fields.Date(required=True)
 
     class Meta(AutoSchema.Meta):
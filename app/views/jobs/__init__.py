@@ -0,0 +1,3 @@
+"""Jobs views"""
+
+from .resources import blp  # noqa
@@ -0,0 +1,74 @@
+from http import HTTPStatus as status
+
+from flask import abort, current_app
+from flask.views import MethodView
+
+from app.extensions.api import Blueprint
+from app.extensions.database import db
+from app.extensions.jobs import jobs, Job, TooManyJobs
+from app.extensions.partitions import employee_partitions
+from app.extensions.salary_model import salary_model
+from app.extensions.salary_model.training import train_salary_model
+from app.utils.generation import generate_employees
+from .schemas import JobSchema, GenerateEmployeesArgsSchema
+
+blp = Blueprint(
+    "Jobs",
+    __name__,
+    url_prefix="/jobs",
+    description="Background jobs for long operations",
+)
+
+
+def _train_salary_model(job: Job) -> dict:
+    result = train_salary_model(
+        db.engine,
+        current_app.config["SALARY_MODEL_PATH"],
+        report=job.report,
+        employee_engines=employee_partitions.engines,
+    )
+    # serve the new model right away, other processes notice the new artifact
+    salary_model.load()
+    return result
+
+
+def _generate_employees(job: Job, count: int) -> dict:
+    return {"employees": generate_employees(count, report=job.report)}
+
+
+def _submit(name, func, *args):
+    try:
+        return jobs.submit(name, func, *args)
+    except TooManyJobs as e:
+        abort(status.SERVICE_UNAVAILABLE, str(e))
+
+
+@blp.route("/train-salary-model")
+class TrainSalaryModelJob(MethodView):
+    @blp.response(status_code=status.ACCEPTED, schema=JobSchema)
+    def post(self):
+        """Train the salary prediction model in the background
+
+        The new model is served as soon as the job succeeds.
+        """
+        return _submit("train-salary-model", _train_salary_model)
+
+
+@blp.route("/generate-employees")
+class GenerateEmployeesJob(MethodView):
+    @blp.arguments(GenerateEmployeesArgsSchema)
+    @blp.response(status_code=status.ACCEPTED, schema=JobSchema)
+    def post(self, args):
+        """Generate random employees in the background"""
+        return _submit("generate-employees", _generate_employees, args["count"])
+
+
+@blp.route("/<string:job_id>")
+class JobById(MethodView):
+    @blp.response(status_code=status.OK, schema=JobSchema)
+    def get(self, job_id):
+        """Get the status, progress and timings of a job"""
+        job = jobs.get(job_id)
+        if job is None:
+            abort(status.NOT_FOUND)
+        return job
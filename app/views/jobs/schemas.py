@@ -0,0 +1,26 @@
+"""Jobs schema"""
+
+import marshmallow as ma
+
+from app.extensions.api import Schema
+
+
+class JobSchema(Schema):
+    id = ma.fields.Str()
+    name = ma.fields.Str()
+    status = ma.fields.Str()
+    progress = ma.fields.Float()
+    message = ma.fields.Str(allow_none=True)
+    result = ma.fields.Raw(allow_none=True)
+    error = ma.fields.Str(allow_none=True)
+    created_at = ma.fields.DateTime()
+    started_at = ma.fields.DateTime(allow_none=True)
+    finished_at = ma.fields.DateTime(allow_none=True)
+    queued_seconds = ma.fields.Float(allow_none=True)
+    run_seconds = ma.fields.Float(allow_none=True)
+
+
+class GenerateEmployeesArgsSchema(Schema):
+    count = ma.fields.Integer(
+        load_default=100, validate=ma.validate.Range(min=1, max=1000000)
+    )
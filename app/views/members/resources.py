@@ -1,10 +1,20 @@
 from http import HTTPStatus as status
 
+import sqlalchemy as sa
+from flask import Response, request
 from flask.views import MethodView
 
 from app.extensions.api import Blueprint, SQLCursorPage
+from app.extensions.async_reads import async_reads
 from app.extensions.database import db
 from app.models.members import Member
+from app.utils.updates import (
+    check_version,
+    get_expected_versions,
+    patch_item,
+    version_etag,
+    versioned,
+)
 from .schemas import MemberSchema, MemberQueryArgsSchema
 
 blp = Blueprint(
@@ -24,9 +34,8 @@ class Members(MethodView):
     def get(self, args):
         """List members"""
         # TODO: Add birthdate min/max filters
-        return Member.query.filter_by(**args)
+        return sa.select(Member.__table__).filter_by(**args)
 
-    @blp.etag
     @blp.arguments(MemberSchema)
     @blp.response(status_code=status.CREATED, schema=MemberSchema)
     def post(self, new_item):
@@ -34,34 +43,53 @@ class Members(MethodView):
         item = Member(**new_item)
         db.session.add(item)
         db.session.commit()
-        return item
+        return item, version_etag(item.version)
+
+
+# built once like the schemas of the decorators
+_ARGS_SCHEMA = MemberQueryArgsSchema()
+_LIST_SCHEMA = MemberSchema(many=True)
+
+
+@async_reads.view("Members.Members")
+async def list_members_async() -> Response:
+    """``Members.get`` on the async engine"""
+    args = blp.ARGUMENTS_PARSER.parse(_ARGS_SCHEMA, request, location="query")
+    return await async_reads.paginated_response(
+        blp, sa.select(Member.__table__).filter_by(**args), _LIST_SCHEMA
+    )
 
 
 @blp.route("/<uuid:item_id>")
 class MembersById(MethodView):
-    @blp.etag
     @blp.response(status_code=status.OK, schema=MemberSchema)
     def get(self, item_id):
         """Get member by ID"""
-        return Member.query.get_or_404(item_id)
+        item = Member.query.get_or_404(item_id)
+        return versioned(item, item.version)
 
-    @blp.etag
     @blp.arguments(MemberSchema)
     @blp.response(status_code=status.OK, schema=MemberSchema)
     def put(self, new_item, item_id):
         """Update an existing member"""
         item = Member.query.get_or_404(item_id)
-        blp.check_etag(item, MemberSchema)
+        check_version(item.version, get_expected_versions())
         MemberSchema().update(item, new_item)
         db.session.add(item)
         db.session.commit()
-        return item
+        return item, version_etag(item.version)
+
+    @blp.arguments(MemberSchema(partial=True))
+    @blp.response(status_code=status.OK, schema=MemberSchema)
+    def patch(self, new_item, item_id):
+        """Partially update an existing member"""
+        item = patch_item(Member, item_id, new_item, get_expected_versions())
+        return item, version_etag(item["version"])
 
-    @blp.etag
     @blp.response(status_code=status.NO_CONTENT)
     def delete(self, item_id):
         """Delete a member"""
         item = Member.query.get_or_404(item_id)
-        blp.check_etag(item, MemberSchema)
+        check_version(item.version, get_expected_versions())
         db.session.delete(item)
         db.session.commit()
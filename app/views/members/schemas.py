@@ -9,6 +9,7 @@ from app.models import Member
 
 class MemberSchema(AutoSchema):
     id = field_for(Member, "id", dump_only=True)
+    version = field_for(Member, "version", dump_only=True)
 
     class Meta(AutoSchema.Meta):
         table = Member.__table__
@@ -1,11 +1,21 @@
 from http import HTTPStatus as status
 
+import sqlalchemy as sa
+from flask import Response, request
 from flask.views import MethodView
 
 from app.extensions.api import Blueprint, SQLCursorPage
+from app.extensions.async_reads import async_reads
 from app.extensions.database import db
 from app.models.members import Member
 from app.models.teams import Team
+from app.utils.updates import (
+    check_version,
+    get_expected_versions,
+    patch_item,
+    version_etag,
+    versioned,
+)
 from .schemas import TeamSchema, TeamQueryArgsSchema
 
 blp = Blueprint(
@@ -20,17 +30,12 @@ blp = Blueprint(
 class Teams(MethodView):
     @blp.etag
     @blp.arguments(TeamQueryArgsSchema, location="query")
-    @blp.response(status_code=status.CREATED, schema=TeamSchema(many=True))
+    @blp.response(status_code=status.OK, schema=TeamSchema(many=True))
     @blp.paginate(SQLCursorPage)
     def get(self, args):
         """List teams"""
-        member_id = args.pop("member_id", None)
-        ret = Team.query.filter_by(**args)
-        if member_id is not None:
-            ret = ret.join(Team.members).filter(Member.id == member_id)
-        return ret
+        return _teams_select(args)
 
-    @blp.etag
     @blp.arguments(TeamSchema)
     @blp.response(status_code=status.CREATED, schema=TeamSchema)
     def post(self, new_item):
@@ -38,34 +43,63 @@ class Teams(MethodView):
         item = Team(**new_item)
         db.session.add(item)
         db.session.commit()
-        return item
+        return item, version_etag(item.version)
+
+
+def _teams_select(args: dict) -> sa.Select:
+    member_id = args.pop("member_id", None)
+    teams = Team.__table__
+    ret = sa.select(teams).filter_by(**args)
+    if member_id is not None:
+        members = Member.__table__
+        ret = ret.join(members).where(members.c.id == member_id)
+    return ret
+
+
+# built once like the schemas of the decorators
+_ARGS_SCHEMA = TeamQueryArgsSchema()
+_LIST_SCHEMA = TeamSchema(many=True)
+
+
+@async_reads.view("Teams.Teams")
+async def list_teams_async() -> Response:
+    """``Teams.get`` on the async engine"""
+    args = blp.ARGUMENTS_PARSER.parse(_ARGS_SCHEMA, request, location="query")
+    return await async_reads.paginated_response(
+        blp, _teams_select(args), _LIST_SCHEMA
+    )
 
 
 @blp.route("/<uuid:item_id>")
 class TeamsById(MethodView):
-    @blp.etag
-    @blp.response(status_code=status.CREATED, schema=TeamSchema)
+    @blp.response(status_code=status.OK, schema=TeamSchema)
     def get(self, item_id):
         """Get team by ID"""
-        return Team.query.get_or_404(item_id)
+        item = Team.query.get_or_404(item_id)
+        return versioned(item, item.version)
 
-    @blp.etag
     @blp.arguments(TeamSchema)
-    @blp.response(status_code=status.CREATED, schema=TeamSchema)
+    @blp.response(status_code=status.OK, schema=TeamSchema)
     def put(self, new_item, item_id):
         """Update an existing team"""
         item = Team.query.get_or_404(item_id)
-        blp.check_etag(item, TeamSchema)
+        check_version(item.version, get_expected_versions())
         TeamSchema().update(item, new_item)
         db.session.add(item)
         db.session.commit()
-        return item
+        return item, version_etag(item.version)
+
+    @blp.arguments(TeamSchema(partial=True))
+    @blp.response(status_code=status.OK, schema=TeamSchema)
+    def patch(self, new_item, item_id):
+        """Partially update an existing team"""
+        item = patch_item(Team, item_id, new_item, get_expected_versions())
+        return item, version_etag(item["version"])
 
-    @blp.etag
     @blp.response(status_code=status.NO_CONTENT)
     def delete(self, item_id):
         """Delete a team"""
         item = Team.query.get_or_404(item_id)
-        blp.check_etag(item, TeamSchema)
+        check_version(item.version, get_expected_versions())
         db.session.delete(item)
         db.session.commit()
@@ -9,6 +9,7 @@ from app.models import Team
 
 class TeamSchema(AutoSchema):
     id = field_for(Team, "id", dump_only=True)
+    version = field_for(Team, "version", dump_only=True)
 
     class Meta(AutoSchema.Meta):
         table = Team.__table__
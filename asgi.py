@@ -0,0 +1,15 @@
+"""ASGI entry point, for the async read path
+
+Serves the application with the list endpoints running as coroutines (see
+``app.extensions.async_reads``) when ``ASYNC_READS_ENABLED`` is set, e.g.::
+
+    uvicorn asgi:application --workers 4
+
+Each worker process runs one event loop: the async views share it, every
+other request runs in one of its ``ASYNC_WSGI_THREADS`` threads.
+"""
+from app import create_app
+from app.extensions.async_reads import AsgiApplication
+
+app = create_app()
+application = AsgiApplication(app)
@@ -0,0 +1,34 @@
+"""Gunicorn configuration for production
+
+    gunicorn -c gunicorn.conf.py
+
+Settings can be overridden with the ``GUNICORN_*`` environment variables.
+Workers share one ``SECRET_KEY`` only if it is given in the environment (or
+in ``FLASK_SETTINGS_FILE``), see ``ProductionConfig``.
+"""
+import multiprocessing
+import os
+
+wsgi_app = "wsgi:app"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(
+    os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1)
+)
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+# build the application once in the master, see wsgi.py
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+# recycle workers from time to time, pages they dirtied are then shared again
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 1000))
+
+
+def post_fork(server, worker):
+    # connections inherited from the master (if any) must not be used by the
+    # worker, drop them without closing them on the master's behalf
+    from app.extensions.database import db
+    from wsgi import app
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -0,0 +1,202 @@
+"""Compare the throughput of list requests on the sync and async read paths
+
+``--concurrency`` clients request pages of ``/employees/`` for ``--seconds``:
+threads calling the WSGI application on the sync path, coroutines calling
+the ASGI application (``asgi.py``) in one event loop on the async one. Both
+paths get the same pool of ``--pool-size`` connections, without overflow,
+and each runs in its own process whose peak RSS is reported along with the
+throughput. ``--latency-ms`` adds a delay to every statement to stand for a
+remote database (``time.sleep`` on the sync path, ``asyncio.sleep`` on the
+async one). The employees are generated in a temporary SQLite database. The
+HTTP server is left out, requests are handed to the applications directly.
+
+Usage::
+
+    python scripts/benchmark_async_reads.py --concurrency 64 --latency-ms 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import sqlalchemy as sa  # noqa: E402
+from sqlalchemy.util import await_only  # noqa: E402
+
+MODES = ("sync", "async")
+
+
+def run_sync(app, args, pages: int) -> int:
+    from app.extensions.database import db
+
+    if args.latency_ms:
+        with app.app_context():
+
+            @sa.event.listens_for(db.engine, "before_cursor_execute")
+            def delay(*_):
+                time.sleep(args.latency_ms / 1000)
+
+    client = app.test_client()
+    stop = time.perf_counter() + args.seconds
+    counts = [0] * args.concurrency
+
+    def worker(i):
+        while time.perf_counter() < stop:
+            page = random.randint(1, pages)
+            response = client.get(f"/employees/?per_page=25&page={page}")
+            assert response.status_code == 200, response.status_code
+            counts[i] += 1
+
+    threads = [
+        threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts)
+
+
+def run_async(app, args, pages: int) -> int:
+    from app.extensions.async_reads import AsgiApplication, async_reads
+
+    application = AsgiApplication(app)
+    stop = time.perf_counter() + args.seconds
+
+    async def request(page: int) -> int:
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/employees/",
+            "query_string": f"per_page=25&page={page}".encode(),
+            "headers": [],
+        }
+        started = {}
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                started["status"] = message["status"]
+
+        await application(scope, receive, send)
+        return started["status"]
+
+    async def client() -> int:
+        count = 0
+        while time.perf_counter() < stop:
+            status = await request(random.randint(1, pages))
+            assert status == 200, status
+            count += 1
+        return count
+
+    async def main() -> int:
+        if args.latency_ms:
+            engine = async_reads.engine.sync_engine
+
+            # runs in the greenlet of the statement, in the event loop
+            @sa.event.listens_for(engine, "before_cursor_execute")
+            def delay(*_):
+                await_only(asyncio.sleep(args.latency_ms / 1000))
+
+        clients = (client() for _ in range(args.concurrency))
+        try:
+            return sum(await asyncio.gather(*clients))
+        finally:
+            await async_reads.dispose()
+
+    return asyncio.run(main())
+
+
+def run_mode(args) -> dict:
+    from app import create_app
+    from app.extensions.database import db
+
+    app = create_app()
+    with app.app_context():
+        count = sa.text("SELECT count(*) FROM employees")
+        pages = max(1, db.session.execute(count).scalar() // 25)
+    run = run_async if args.mode == "async" else run_sync
+    started = time.perf_counter()
+    requests = run(app, args, pages)
+    seconds = time.perf_counter() - started
+    return {
+        "requests_per_second": requests / seconds,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def settings_file(directory: str, mode: str, pool_size: int) -> str:
+    path = os.path.join(directory, f"{mode}.py")
+    with open(path, "w") as f:
+        f.write(f"SQLALCHEMY_DATABASE_URI = 'sqlite:///{directory}/benchmark.db'\n")
+        f.write(
+            f"SQLALCHEMY_ENGINE_OPTIONS = {{'pool_size': {pool_size},"
+            " 'max_overflow': 0, 'pool_timeout': 60}\n"
+        )
+        f.write("LOG_LEVEL = 30\n")
+        f.write("ADMISSION_ENABLED = False\n")
+        f.write(f"ASYNC_READS_ENABLED = {mode == 'async'}\n")
+        f.write(f"ASYNC_POOL_SIZE = {pool_size}\n")
+        f.write("ASYNC_MAX_OVERFLOW = 0\n")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--employees", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args)))
+        return
+
+    directory = tempfile.mkdtemp()
+    os.environ["FLASK_SETTINGS_FILE"] = settings_file(
+        directory, "sync", args.pool_size
+    )
+    from app import create_app
+    from app.extensions.database import db
+    from app.utils.generation import generate_employees
+
+    with create_app().app_context():
+        db.create_all()
+        generate_employees(args.employees)
+
+    print(f"{'mode':<6} {'requests/s':>10} {'max RSS MB':>10}")
+    for mode in MODES:
+        env = dict(
+            os.environ,
+            FLASK_SETTINGS_FILE=settings_file(directory, mode, args.pool_size),
+        )
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, *sys.argv[1:]],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{mode:<6} {result['requests_per_second']:>10.0f}"
+            f" {result['max_rss_mb']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Measure the per-request cost of logging
+
+Serves a cheap endpoint through the test client with an access record per
+request, in each logging mode, and reports the time spent per request in the
+request thread. Records are written to /dev/null, optionally through a sink
+that blocks for ``--sink-latency-us`` per write, like a slow disk or a full
+pipe. The cost of a disabled DEBUG call with an eager f-string and with lazy
+%-style arguments is reported as well.
+
+Usage::
+
+    python scripts/benchmark_logging.py --requests 5000 --sink-latency-us 200
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask.logging import default_handler  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.extensions import logger as logger_extension  # noqa: E402
+from app.extensions.logger import LoggingConfig  # noqa: E402
+
+MODES = {
+    "no access log": None,
+    "sync text": {"LOG_ASYNC": False, "LOG_JSON": False},
+    "sync json": {"LOG_ASYNC": False, "LOG_JSON": True},
+    "async text": {"LOG_ASYNC": True, "LOG_JSON": False},
+    "async json": {"LOG_ASYNC": True, "LOG_JSON": True},
+}
+
+
+class SlowSink:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.stream = open(os.devnull, "w")
+
+    def write(self, data: str) -> int:
+        time.sleep(self.latency)
+        return self.stream.write(data)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+def per_request(app, requests: int) -> float:
+    client = app.test_client()
+    for _ in range(100):
+        client.get("/predict_salary/stats")
+    started = time.perf_counter()
+    for _ in range(requests):
+        client.get("/predict_salary/stats")
+    return (time.perf_counter() - started) / requests
+
+
+def disabled_debug(calls: int) -> dict:
+    logger = logging.getLogger("app.benchmark")
+    logger.setLevel(logging.INFO)
+    data = {"page": 1, "per_page": 25, "items": list(range(25))}
+    eager = timeit.timeit(lambda: logger.debug(f"data: {data}"), number=calls)
+    lazy = timeit.timeit(lambda: logger.debug("data: %s", data), number=calls)
+    return {"f-string": eager / calls, "%-style": lazy / calls}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--sink-latency-us", type=float, default=0)
+    args = parser.parse_args()
+
+    app = create_app()
+    default_handler.setStream(SlowSink(args.sink_latency_us / 1e6))
+
+    baseline = None
+    print(f"{'mode':<15} {'us/request':>10} {'overhead us':>12}")
+    for mode, overrides in MODES.items():
+        app.config["LOG_REQUESTS"] = overrides is not None
+        app.config.update(overrides or {})
+        LoggingConfig(app.config).configure(app.logger)
+        app.logger.setLevel(logging.INFO)
+        seconds = per_request(app, args.requests)
+        baseline = seconds if baseline is None else baseline
+        print(f"{mode:<15} {seconds * 1e6:>10.1f} {(seconds - baseline) * 1e6:>12.1f}")
+    logger_extension._stop_listener()
+
+    print()
+    for style, seconds in disabled_debug(100000).items():
+        print(f"disabled DEBUG call, {style:<9} {seconds * 1e9:>6.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Measure per-worker memory of the pre-fork server
+
+Starts gunicorn with and without ``preload_app``, waits for the workers to
+serve a few requests, and reports the memory of each worker read from
+``/proc/<pid>/smaps_rollup`` (Linux only):
+
+- RSS: resident memory, shared pages included
+- PSS: shared pages divided between the processes sharing them
+- USS: private memory, what the worker actually costs
+
+Usage::
+
+    python scripts/measure_worker_memory.py --workers 4
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def children(pid: int) -> list:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def memory(pid: int) -> dict:
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": values["Rss"],
+        "pss": values["Pss"],
+        "uss": values["Private_Clean"] + values["Private_Dirty"],
+    }
+
+
+def warm(url: str, requests: int) -> None:
+    body = json.dumps(
+        {"name": "x", "department": "Sales", "hire_date": "2022-01-01 00:00:00"}
+    ).encode()
+    for _ in range(requests):
+        request = urllib.request.Request(
+            url + "/predict_salary/",
+            data=body,
+            headers={"Content-Type": "application/json"},
+        )
+        urllib.request.urlopen(request).read()
+        urllib.request.urlopen(url + "/employees/").read()
+
+
+def measure(preload: bool, workers: int, requests: int) -> dict:
+    port = free_port()
+    env = {
+        **os.environ,
+        "GUNICORN_PRELOAD": "1" if preload else "0",
+        "GUNICORN_WORKERS": str(workers),
+        "GUNICORN_BIND": f"127.0.0.1:{port}",
+        "SECRET_KEY": "measure-worker-memory",
+    }
+    master = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 120
+        while True:
+            try:
+                urllib.request.urlopen(url + "/employees/").read()
+                if len(children(master.pid)) == workers:
+                    break
+            except OSError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("gunicorn did not start")
+            time.sleep(0.5)
+        # give every worker a chance to import and load what it needs
+        time.sleep(5)
+        warm(url, requests)
+        worker_memory = [memory(pid) for pid in children(master.pid)]
+        return {
+            "master": memory(master.pid),
+            "workers": {
+                key: sum(w[key] for w in worker_memory) / len(worker_memory)
+                for key in ("rss", "pss", "uss")
+            },
+        }
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}{'process':<10}{'RSS MiB':>10}{'PSS MiB':>10}{'USS MiB':>10}")
+    for preload in (False, True):
+        result = measure(preload, args.workers, args.requests)
+        mode = "preload" if preload else "no preload"
+        for process in ("master", "workers"):
+            values = result[process]
+            print(
+                f"{mode:<12}{process:<10}"
+                f"{values['rss']:>10.1f}{values['pss']:>10.1f}{values['uss']:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
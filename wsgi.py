@@ -0,0 +1,42 @@
+"""Production WSGI entry point
+
+Meant to be served by a pre-fork server with the application preloaded in the
+master process, e.g.::
+
+    gunicorn -c gunicorn.conf.py
+
+The application, the heavy scientific modules and the salary model are all
+loaded here, before the workers are forked, so that their memory pages are
+shared copy-on-write between the workers instead of being duplicated.
+"""
+import gc
+
+import numpy  # noqa: F401
+import pandas  # noqa: F401
+import sklearn  # noqa: F401
+
+from app import create_app
+from app.extensions.database import db
+from app.extensions.salary_model import salary_model
+
+app = create_app()
+
+
+def prepare_for_fork(_app) -> None:
+    """Get the master process ready to be forked
+
+    Connections must never be shared between processes, so the pools opened
+    while creating the application are closed. The objects created so far are
+    then moved out of the garbage collector's reach: collections in the
+    workers would otherwise write to (and thus copy) every page holding them.
+    """
+    with _app.app_context():
+        # make sure the model is loaded in the master, not in every worker
+        salary_model.model
+        for engine in db.engines.values():
+            engine.dispose()
+    gc.collect()
+    gc.freeze()
+
+
+prepare_for_fork(app)